@@ -1,5 +1,6 @@
-from flask import Flask, render_template, request, send_file, jsonify, session, after_this_request
+from flask import Flask, Response, render_template, request, jsonify, session, after_this_request
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import os
 import re
@@ -17,10 +18,28 @@ import time
 import urllib3
 import tempfile
 from datetime import datetime
+from email.utils import parsedate_to_datetime
+from html.parser import HTMLParser
+from http.cookiejar import DefaultCookiePolicy
 import traceback
 import html
 import shutil
 import threading
+import argparse
+import tracemalloc
+import hashlib
+import itertools
+import tarfile
+import queue
+import struct
+import zlib
+import codecs
+import weakref
+import atexit
+import sqlite3
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
 
 # Try to import Selenium
 SELENIUM_AVAILABLE = False
@@ -39,12 +58,123 @@ except ImportError:
     SELENIUM_AVAILABLE = False
     print("Selenium not available. Advanced rendering will be disabled.")
 
+# Optional HTML parser backends for BeautifulSoup (html.parser is always available)
+LXML_AVAILABLE = False
+try:
+    import lxml  # noqa: F401
+    LXML_AVAILABLE = True
+except ImportError:
+    pass
+
+HTML5LIB_AVAILABLE = False
+try:
+    import html5lib  # noqa: F401
+    HTML5LIB_AVAILABLE = True
+except ImportError:
+    pass
+
+# Optional libmagic bindings for content sniffing (a signature table covers common formats)
+MAGIC_AVAILABLE = False
+try:
+    import magic
+    MAGIC_AVAILABLE = True
+except ImportError:
+    pass
+
 # Suppress cssutils warnings
 cssutils.log.setLevel(logging.CRITICAL)
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev_key_for_website_extractor')
 
+# Asset download concurrency: total worker threads and concurrent requests per host
+ASSET_DOWNLOAD_WORKERS = int(os.environ.get('ASSET_DOWNLOAD_WORKERS', '16'))
+ASSET_DOWNLOAD_PER_HOST = int(os.environ.get('ASSET_DOWNLOAD_PER_HOST', '6'))
+
+# Per-host rate limiting (requests per second) with adaptive backoff
+RATE_LIMIT_INITIAL_RPS = float(os.environ.get('RATE_LIMIT_INITIAL_RPS', '10'))
+RATE_LIMIT_MIN_RPS = float(os.environ.get('RATE_LIMIT_MIN_RPS', '0.5'))
+RATE_LIMIT_MAX_RPS = float(os.environ.get('RATE_LIMIT_MAX_RPS', '50'))
+RATE_LIMIT_INCREASE_RPS = float(os.environ.get('RATE_LIMIT_INCREASE_RPS', '0.5'))
+RATE_LIMIT_MAX_RETRY_AFTER = float(os.environ.get('RATE_LIMIT_MAX_RETRY_AFTER', '30'))
+
+# Shared HTTP connection pools: number of hosts kept and connections kept per host
+HTTP_POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', '100'))
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', '16'))
+
+# Streaming downloads: bodies above the spill threshold go to a temp file,
+# bodies above the max size are aborted
+ASSET_SPILL_THRESHOLD = int(os.environ.get('ASSET_SPILL_THRESHOLD', str(2 * 1024 * 1024)))
+ASSET_MAX_SIZE = int(os.environ.get('ASSET_MAX_SIZE', str(100 * 1024 * 1024)))
+ASSET_CHUNK_SIZE = 64 * 1024
+
+# Persistent asset cache shared across extractions
+ASSET_CACHE_ENABLED = os.environ.get('ASSET_CACHE_ENABLED', 'true').lower() == 'true'
+ASSET_CACHE_DIR = os.environ.get('ASSET_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'website_extractor_cache'))
+ASSET_CACHE_MAX_BYTES = int(os.environ.get('ASSET_CACHE_MAX_BYTES', str(1024 * 1024 * 1024)))
+
+# URL canonicalization: query parameters (prefix* allowed) and, opt-in, CDN
+# transform path segments that are ignored when deduplicating assets. Only the
+# dedupe key is canonicalized; the URL the page referenced is what gets fetched
+URL_STRIP_PARAMS = os.environ.get(
+    'URL_STRIP_PARAMS',
+    'utm_*,fbclid,gclid,msclkid,mc_cid,mc_eid,_ga,cachebust,cache_bust'
+)
+URL_STRIP_CDN_TRANSFORMS = os.environ.get('URL_STRIP_CDN_TRANSFORMS', 'false').lower() == 'true'
+
+# Failure handling: how long 404/410 responses are remembered (seconds), and
+# how many consecutive connection errors open a host's circuit and for how long
+NEGATIVE_CACHE_TTL = float(os.environ.get('NEGATIVE_CACHE_TTL', '3600'))
+CIRCUIT_BREAKER_THRESHOLD = int(os.environ.get('CIRCUIT_BREAKER_THRESHOLD', '3'))
+CIRCUIT_BREAKER_COOLDOWN = float(os.environ.get('CIRCUIT_BREAKER_COOLDOWN', '30'))
+
+# BeautifulSoup backend used to parse pages: lxml, html.parser or html5lib
+HTML_PARSER = os.environ.get('HTML_PARSER', 'lxml')
+# Chunks buffered between the archive builder and a slow client (64 KB each)
+ZIP_STREAM_QUEUE_CHUNKS = int(os.environ.get('ZIP_STREAM_QUEUE_CHUNKS', '64'))
+# Archive compression policy (see choose_compression()); ZIP_SMALL_TEXT_LEVEL is off unless set
+ZIP_DEFAULT_LEVEL = int(os.environ.get('ZIP_DEFAULT_LEVEL', '6'))
+ZIP_FAST_LEVEL = int(os.environ.get('ZIP_FAST_LEVEL', '1'))
+ZIP_SMALL_TEXT_LEVEL = int(os.environ['ZIP_SMALL_TEXT_LEVEL']) if os.environ.get('ZIP_SMALL_TEXT_LEVEL') else None
+ZIP_SMALL_TEXT_BYTES = int(os.environ.get('ZIP_SMALL_TEXT_BYTES', str(64 * 1024)))
+ZIP_LARGE_TEXT_BYTES = int(os.environ.get('ZIP_LARGE_TEXT_BYTES', str(256 * 1024)))
+ZIP_PROBE_BYTES = int(os.environ.get('ZIP_PROBE_BYTES', str(16 * 1024)))
+ZIP_PROBE_MAX_RATIO = float(os.environ.get('ZIP_PROBE_MAX_RATIO', '0.9'))
+# Parallel archive compression: pool size and members in flight per archive
+ARCHIVE_WORKERS = int(os.environ.get('ARCHIVE_WORKERS', str(os.cpu_count() or 4)))
+ARCHIVE_MAX_PENDING = int(os.environ.get('ARCHIVE_MAX_PENDING', str(ARCHIVE_WORKERS * 4)))
+# Where the 'dir' output format writes its trees
+EXTRACT_OUTPUT_DIR = os.environ.get('EXTRACT_OUTPUT_DIR', os.path.join(tempfile.gettempdir(), 'website-extractor'))
+# Page fetches: attempts with rotated headers, and the JS-shell heuristic that escalates to Selenium
+# (visible body text below JS_SHELL_MIN_TEXT, or below JS_SHELL_NOSCRIPT_TEXT with a <noscript> warning)
+DOCUMENT_FETCH_ATTEMPTS = int(os.environ.get('DOCUMENT_FETCH_ATTEMPTS', '2'))
+JS_SHELL_MIN_TEXT = int(os.environ.get('JS_SHELL_MIN_TEXT', '200'))
+JS_SHELL_NOSCRIPT_TEXT = int(os.environ.get('JS_SHELL_NOSCRIPT_TEXT', '1000'))
+# Warm Selenium browsers: pool size, extractions per browser before it is replaced,
+# browsers started with the web interface, and the JS heap above which one is recycled
+BROWSER_POOL_SIZE = int(os.environ.get('BROWSER_POOL_SIZE', '2'))
+BROWSER_POOL_MAX_USES = int(os.environ.get('BROWSER_POOL_MAX_USES', '20'))
+BROWSER_POOL_WARM = int(os.environ.get('BROWSER_POOL_WARM', '1'))
+BROWSER_POOL_ACQUIRE_TIMEOUT = float(os.environ.get('BROWSER_POOL_ACQUIRE_TIMEOUT', '60'))
+BROWSER_POOL_MAX_HEAP_MB = int(os.environ.get('BROWSER_POOL_MAX_HEAP_MB', '512'))
+# How extract_with_selenium() waits for pages: 'idle' (network and DOM quiet), 'network', 'dom',
+# or 'fixed' sleeps; quiet window and deadline (seconds) for the initial load and for scroll/click steps
+SETTLE_STRATEGY = os.environ.get('SETTLE_STRATEGY', 'idle')
+SETTLE_IDLE_MS = int(os.environ.get('SETTLE_IDLE_MS', '500'))
+SETTLE_DEADLINE = float(os.environ.get('SETTLE_DEADLINE', '10'))
+SETTLE_STEP_IDLE_MS = int(os.environ.get('SETTLE_STEP_IDLE_MS', '150'))
+SETTLE_STEP_DEADLINE = float(os.environ.get('SETTLE_STEP_DEADLINE', '1.5'))
+# Request blocking while rendering: the built-in tracker list and extra comma separated wildcard patterns
+BLOCK_TRACKERS = os.environ.get('BLOCK_TRACKERS', 'true').lower() == 'true'
+BLOCKED_URL_PATTERNS = os.environ.get('BLOCKED_URL_PATTERNS', '')
+# Chrome's buffer for response bodies kept for capture_browser_responses() (MB)
+BROWSER_CAPTURE_BUFFER_MB = int(os.environ.get('BROWSER_CAPTURE_BUFFER_MB', '256'))
+# How many levels of @import are followed from a page's stylesheets
+CSS_MAX_DEPTH = int(os.environ.get('CSS_MAX_DEPTH', '4'))
+
+# Bytes that may appear in text; anything left after deleting them means binary
+TEXT_CHARS = bytes(bytearray({7, 8, 9, 10, 12, 13, 27} | set(range(0x20, 0x100)) - {0x7F}))
+
 def is_binary_content(content, asset_type):
     """Determine if content should be treated as binary or text based on asset type and content inspection"""
     # First check by asset type
@@ -65,8 +195,7 @@ def is_binary_content(content, asset_type):
                 
             # Sample the first 1024 bytes to determine if it's binary
             sample = content[:1024]
-            text_chars = bytearray({7, 8, 9, 10, 12, 13, 27} | set(range(0x20, 0x100)) - {0x7F})
-            return bool(sample.translate(None, text_chars))
+            return bool(sample.translate(None, TEXT_CHARS))
         except:
             # If there's any error in detection, treat as binary to be safe
             return True
@@ -74,313 +203,2107 @@ def is_binary_content(content, asset_type):
     # For anything else, just check if it's bytes
     return isinstance(content, bytes)
 
-def download_asset(url, base_url, headers=None, session_obj=None):
+class HostRateLimiter:
     """
-    Download an asset from a URL
-    
-    Args:
-        url: URL to download from
-        base_url: Base URL of the website (for referrer)
-        headers: Optional custom headers
-        session_obj: Optional requests.Session object for maintaining cookies
-    
-    Returns:
-        Content of the asset or None if download failed
-    """
-    # List of user agents to rotate through to avoid detection
-    user_agents = [
-        'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-        'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Safari/605.1.15',
-        'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:123.0) Gecko/20100101 Firefox/123.0',
-        'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-        'Mozilla/5.0 (iPhone; CPU iPhone OS 17_3_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1'
-    ]
-    
-    # Use a random user agent
-    random_user_agent = random.choice(user_agents)
-    
-    if not headers:
-        headers = {
-            'User-Agent': random_user_agent,
-            'Accept': '*/*',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Referer': base_url,
-            'Sec-Fetch-Dest': 'empty',
-            'Sec-Fetch-Mode': 'cors',
-            'Sec-Fetch-Site': 'same-origin',
-            'Pragma': 'no-cache',
-            'Cache-Control': 'no-cache',
-        }
-    else:
-        # Update the user agent in the provided headers
-        headers['User-Agent'] = random_user_agent
-    
-    # Parse the URL to check if it's valid
+    Per-host token bucket shared by every download in the process.
+
+    Each host starts at RATE_LIMIT_INITIAL_RPS. The rate grows additively
+    while a host answers normally and is halved when it pushes back
+    (429/503, server errors, timeouts), so fast CDNs run at full speed and
+    only struggling hosts are slowed down. A Retry-After value blocks the
+    host until the requested time has passed.
+    """
+
+    def __init__(self, initial_rps=None, min_rps=None, max_rps=None, increase_rps=None):
+        self.initial_rps = initial_rps or RATE_LIMIT_INITIAL_RPS
+        self.min_rps = min_rps or RATE_LIMIT_MIN_RPS
+        self.max_rps = max_rps or RATE_LIMIT_MAX_RPS
+        self.increase_rps = increase_rps or RATE_LIMIT_INCREASE_RPS
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _state(self, host, now):
+        state = self._hosts.get(host)
+        if state is None:
+            state = {'rate': self.initial_rps, 'tokens': self.initial_rps, 'updated': now, 'blocked_until': 0.0}
+            self._hosts[host] = state
+        else:
+            # Refill the bucket; capacity is one second worth of requests
+            elapsed = now - state['updated']
+            state['tokens'] = min(max(1.0, state['rate']), state['tokens'] + elapsed * state['rate'])
+            state['updated'] = now
+        return state
+
+    def acquire(self, host):
+        """Block until a request to `host` is allowed and return the time spent waiting"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                state = self._state(host, now)
+                if now < state['blocked_until']:
+                    delay = state['blocked_until'] - now
+                elif state['tokens'] >= 1:
+                    state['tokens'] -= 1
+                    return waited
+                else:
+                    delay = (1 - state['tokens']) / state['rate']
+            time.sleep(delay)
+            waited += delay
+
+    def record_success(self, host):
+        """Additive increase after a normal response"""
+        with self._lock:
+            state = self._state(host, time.monotonic())
+            state['rate'] = min(self.max_rps, state['rate'] + self.increase_rps)
+
+    def record_backoff(self, host, retry_after=None):
+        """Multiplicative decrease after the host pushed back, honouring Retry-After if given"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._state(host, now)
+            state['rate'] = max(self.min_rps, state['rate'] / 2)
+            state['tokens'] = min(state['tokens'], 0.0)
+            if retry_after:
+                retry_after = min(retry_after, RATE_LIMIT_MAX_RETRY_AFTER)
+                state['blocked_until'] = max(state['blocked_until'], now + retry_after)
+            print(f"Backing off {host}: {state['rate']:.1f} req/s" + (f", retry after {retry_after:.0f}s" if retry_after else ""))
+
+    def snapshot(self):
+        """Current request rate per host"""
+        with self._lock:
+            return {host: round(state['rate'], 2) for host, state in self._hosts.items()}
+
+def parse_retry_after(value):
+    """Parse a Retry-After header (delta seconds or HTTP date) into seconds, or None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
     try:
-        parsed_url = urlparse(url)
-        if not parsed_url.scheme or not parsed_url.netloc:
-            print(f"Invalid URL: {url}")
-            return None
-    except Exception as e:
-        print(f"Error parsing URL {url}: {str(e)}")
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(retry_at.tzinfo)).total_seconds())
+    except (TypeError, ValueError):
         return None
-    
-    # Add a delay to avoid rate limiting
-    time.sleep(0.1)  # 100ms delay between requests
-    
-    # Maximum number of retries
-    max_retries = 3
-    retry_count = 0
-    
-    while retry_count < max_retries:
-        try:
-            # Use session if provided, otherwise make a direct request
-            if session_obj:
-                response = session_obj.get(
-                    url, 
-                    timeout=15, 
-                    headers=headers, 
-                    stream=True, 
-                    allow_redirects=True,
-                    verify=False  # Ignore SSL certificate errors
-                )
-            else:
-                response = requests.get(
-                    url, 
-                    timeout=15, 
-                    headers=headers, 
-                    stream=True, 
-                    allow_redirects=True,
-                    verify=False  # Ignore SSL certificate errors
-                )
-            
-            # Handle redirects
-            if response.history:
-                print(f"Request for {url} was redirected {len(response.history)} times to {response.url}")
-                url = response.url  # Update URL to the final destination
-            
-            if response.status_code == 200:
-                # Check the Content-Type header
-                content_type = response.headers.get('Content-Type', '')
-                print(f"Downloaded {url} ({len(response.content)} bytes, type: {content_type})")
-                
-                # Check for binary content types
-                is_binary = any(binary_type in content_type.lower() for binary_type in [
-                    'image/', 'video/', 'audio/', 'font/', 'application/octet-stream', 
-                    'application/zip', 'application/x-rar', 'application/pdf', 'application/vnd.'
-                ])
-                
-                # If binary or content-type suggests binary, return raw content
-                if is_binary:
-                    return response.content
-                
-                # For text content types
-                is_text = any(text_type in content_type.lower() for text_type in [
-                    'text/', 'application/json', 'application/javascript', 'application/xml', 'application/xhtml'
-                ])
-                
-                if is_text:
-                    # Try to determine encoding
-                    encoding = None
-                    
-                    # From Content-Type header
-                    if 'charset=' in content_type:
-                        encoding = content_type.split('charset=')[1].split(';')[0].strip()
-                    
-                    # From response encoding or apparent encoding
-                    if not encoding:
-                        encoding = response.encoding or response.apparent_encoding or 'utf-8'
-                    
-                    # Decode with specified encoding
-                    try:
-                        return response.content.decode(encoding, errors='replace').encode('utf-8')
-                    except (UnicodeDecodeError, LookupError):
-                        # If decoding fails, try utf-8
-                        try:
-                            return response.content.decode('utf-8', errors='replace').encode('utf-8')
-                        except:
-                            # If all else fails, return raw content
-                            return response.content
-                
-                # For unknown content types, return raw content
-                return response.content
-            elif response.status_code == 404:
-                print(f"Resource not found (404): {url}")
-                return None
-            elif response.status_code == 403:
-                print(f"Access forbidden (403): {url}")
-                # Try with a different user agent on the next retry
-                headers['User-Agent'] = random.choice(user_agents)
-                retry_count += 1
-                time.sleep(1)  # Wait longer before retrying
-                continue
-            elif response.status_code >= 500:
-                print(f"Server error ({response.status_code}): {url}")
-                retry_count += 1
-                time.sleep(1)  # Wait longer before retrying
+
+# Shared by all extractions so hosts that pushed back stay throttled between requests
+host_rate_limiter = HostRateLimiter()
+
+class PooledHTTPClient:
+    """
+    Long-lived HTTP connection pools shared by every extraction in the process.
+
+    All sessions handed out by this client mount the same HTTPAdapter, so
+    keep-alive connections (and their TLS handshakes) to a CDN are reused
+    across requests and extractions. Each extraction still gets its own
+    requests.Session, and therefore its own cookie jar, from new_session().
+    """
+
+    def __init__(self, pool_connections=None, pool_maxsize=None):
+        self.pool_connections = pool_connections or HTTP_POOL_CONNECTIONS
+        self.pool_maxsize = pool_maxsize or HTTP_POOL_MAXSIZE
+        self.adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=0
+        )
+        # Session for callers without one of their own; it never stores cookies
+        self.shared_session = self.new_session()
+        self.shared_session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+    def new_session(self):
+        """Create a session with an isolated cookie jar on top of the shared pools"""
+        session_obj = requests.Session()
+        session_obj.mount('http://', self.adapter)
+        session_obj.mount('https://', self.adapter)
+        return session_obj
+
+    def stats(self):
+        """Connection pool counters: a hit is a request served on an already open connection"""
+        pools = self.adapter.poolmanager.pools
+        per_host = {}
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
                 continue
-            else:
-                print(f"HTTP error ({response.status_code}): {url}")
-                return None
-                
-        except requests.exceptions.Timeout:
-            print(f"Timeout error downloading {url}")
-            retry_count += 1
-            time.sleep(1)
-            continue
-        except requests.exceptions.ConnectionError:
-            print(f"Connection error downloading {url}")
-            retry_count += 1
-            time.sleep(1)
-            continue
-        except requests.exceptions.TooManyRedirects:
-            print(f"Too many redirects for {url}")
-            return None
-        except Exception as e:
-            print(f"Error downloading {url}: {str(e)}")
-            return None
-    
-    if retry_count == max_retries:
-        print(f"Max retries reached for {url}")
-    
-    return None
+            host = f"{pool.scheme}://{pool.host}:{pool.port}"
+            misses = pool.num_connections
+            hits = max(0, pool.num_requests - pool.num_connections)
+            # The pool queue is pre-filled with None placeholders; only count real connections
+            idle = sum(1 for conn in list(pool.pool.queue) if conn) if pool.pool else 0
+            per_host[host] = {'hits': hits, 'misses': misses, 'idle': idle}
+        return {
+            'pool_connections': self.pool_connections,
+            'pool_maxsize': self.pool_maxsize,
+            'open_pools': len(per_host),
+            'hits': sum(h['hits'] for h in per_host.values()),
+            'misses': sum(h['misses'] for h in per_host.values()),
+            'hosts': per_host
+        }
 
-def get_asset_type(url):
-    """Determine the type of asset from the URL"""
-    # Handle empty or None URLs
-    if not url:
-        return 'other'
-    
-    url_lower = url.lower()
-    
-    # Framework-specific patterns
-    if '_next/static' in url_lower:
-        if '.css' in url_lower or 'styles' in url_lower:
-            return 'css'
-        return 'js'  # Default to JS for Next.js assets
-        
-    if 'chunk.' in url_lower or 'webpack' in url_lower:
-        return 'js'  # Webpack chunks
-        
-    if 'angular' in url_lower and '.js' in url_lower:
-        return 'js'  # Angular bundles
+# Shared connection pools for all outgoing requests
+http_client = PooledHTTPClient()
+
+def _remove_spill_file(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+class AssetBody:
+    """
+    Content of a downloaded asset.
+
+    Small bodies are kept in memory; bodies larger than ASSET_SPILL_THRESHOLD
+    live in a temporary file that is deleted once the body is garbage
+    collected. The SHA-256 digest is computed while the body is streamed in,
+    and open()/iter_chunks() let archive writers copy it without loading it
+    into memory.
+    """
+
+    def __init__(self, data=None, path=None, size=None, sha256=None, content_type='', encoding=None, url=None,
+                 owned=True, headers=None, status=200, reason='OK', credentialed=False):
+        self._data = data
+        self.path = path
+        self.size = size if size is not None else len(data or b'')
+        self.sha256 = sha256 or (hashlib.sha256(data).hexdigest() if data is not None else None)
+        self.content_type = content_type
+        self.encoding = encoding
+        self.url = url
+        # Original response line and headers, kept for backends that preserve them (WARC)
+        self.headers = headers or {}
+        self.status = status
+        self.reason = reason
+        # Fetched with cookies or credentials: may be specific to that session
+        self.credentialed = credentialed
+        if path and owned:
+            weakref.finalize(self, _remove_spill_file, path)
+
+    @classmethod
+    def from_response(cls, response, max_size=None, spill_threshold=None):
+        """
+        Stream a requests response into an AssetBody.
         
-    # Handle CSS files
-    if url_lower.endswith(('.css', '.scss', '.less', '.sass')):
-        return 'css'
-    if 'global.css' in url_lower or 'globals.css' in url_lower or 'tailwind' in url_lower:
-        return 'css'
-    if 'fonts.googleapis.com' in url_lower:
-        return 'css'
-    if 'styles' in url_lower and '.css' in url_lower:
-        return 'css'
+        Returns None if the body is larger than `max_size`; the download is
+        aborted as soon as that is known.
+        """
+        max_size = max_size or ASSET_MAX_SIZE
+        spill_threshold = spill_threshold or ASSET_SPILL_THRESHOLD
+        content_type = response.headers.get('Content-Type', '')
+        encoding = None
+        if 'charset=' in content_type:
+            encoding = content_type.split('charset=')[1].split(';')[0].strip()
         
-    # Handle JS files
-    if url_lower.endswith(('.js', '.jsx', '.mjs', '.ts', '.tsx', '.cjs')):
-        return 'js'
-    if 'bundle.js' in url_lower or 'main.js' in url_lower or 'app.js' in url_lower:
-        return 'js'
-    if 'polyfill' in url_lower or 'runtime' in url_lower or 'vendor' in url_lower:
-        return 'js'
-    if 'image-config' in url_lower or 'image.config' in url_lower:
-        return 'js'
+        # Reject early when the server announces an oversized body
+        declared = response.headers.get('Content-Length', '')
+        if declared.isdigit() and int(declared) > max_size:
+            print(f"Skipping {response.url}: {declared} bytes exceeds the {max_size} byte limit")
+            response.close()
+            return None
         
-    # Handle image files
-    if url_lower.endswith(('.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.avif', '.bmp', '.ico')):
-        return 'img'
-    if '/images/' in url_lower or '/img/' in url_lower or '/assets/images/' in url_lower:
-        return 'img'
+        digest = hashlib.sha256()
+        chunks = []
+        size = 0
+        spill = None
+        try:
+            for chunk in response.iter_content(chunk_size=ASSET_CHUNK_SIZE):
+                if not chunk:
+                    continue
+                size += len(chunk)
+                if size > max_size:
+                    print(f"Aborting {response.url}: body exceeds the {max_size} byte limit")
+                    response.close()
+                    if spill:
+                        spill.close()
+                        _remove_spill_file(spill.name)
+                    return None
+                digest.update(chunk)
+                if spill:
+                    spill.write(chunk)
+                    continue
+                chunks.append(chunk)
+                if size > spill_threshold:
+                    # Move what we have so far to disk and keep streaming there
+                    spill = tempfile.NamedTemporaryFile(prefix='asset_', delete=False)
+                    spill.writelines(chunks)
+                    chunks = []
+        except Exception:
+            if spill:
+                spill.close()
+                _remove_spill_file(spill.name)
+            raise
         
-    # Handle font files
-    if url_lower.endswith(('.woff', '.woff2', '.ttf', '.otf', '.eot')):
-        return 'fonts'
-    if '/fonts/' in url_lower or 'font-awesome' in url_lower:
-        return 'fonts'
+        origin = {'headers': dict(response.headers), 'status': response.status_code, 'reason': response.reason or 'OK'}
+        if spill:
+            spill.close()
+            return cls(path=spill.name, size=size, sha256=digest.hexdigest(),
+                       content_type=content_type, encoding=encoding, url=response.url, **origin)
+        return cls(data=b''.join(chunks), size=size, sha256=digest.hexdigest(),
+                   content_type=content_type, encoding=encoding, url=response.url, **origin)
+
+    @property
+    def in_memory(self):
+        return self._data is not None
+
+    def __len__(self):
+        return self.size
+
+    def open(self):
+        """Return a binary file object positioned at the start of the body"""
+        if self._data is not None:
+            return BytesIO(self._data)
+        return open(self.path, 'rb')
+
+    def iter_chunks(self, chunk_size=None):
+        """Yield the body in chunks without loading it fully"""
+        with self.open() as fh:
+            while True:
+                chunk = fh.read(chunk_size or ASSET_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+    def head(self, size=None):
+        """Return the first `size` bytes (SNIFF_BYTES by default) without loading the body"""
+        size = size or SNIFF_BYTES
+        if self._data is not None:
+            return self._data[:size]
+        with open(self.path, 'rb') as fh:
+            return fh.read(size)
+
+    def read(self):
+        """Return the whole body as bytes (loads spilled bodies into memory)"""
+        if self._data is not None:
+            return self._data
+        with open(self.path, 'rb') as fh:
+            return fh.read()
+
+class ZipStreamWriter:
+    """
+    Write a ZIP archive front to back to a sink callable, without seeking.
+
+    Members arrive already compressed (see ZipArchiveWriter) through
+    write_compressed(); their CRC and sizes are known, so each is written
+    as a complete local header followed by its data, and the central
+    directory follows on close(). ZIP64 records are used for members,
+    offsets and entry counts that need them, so the archive size is not
+    limited to 4 GB. Finished members are listed as ZipInfo objects in
+    `filelist`.
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.offset = 0
+        self.filelist = []
+        self._zip64 = []  # per member in filelist: sizes written as ZIP64
+        self._names = set()
+        self._closed = False
+
+    def _write(self, data):
+        if data:
+            self.sink(data)
+            self.offset += len(data)
+
+    def _begin_member(self, name, method, zip64, crc, file_size, compress_size):
+        # Write the local header and return the member's ZipInfo
+        if self._closed:
+            raise ValueError('Attempt to write to a closed ZIP stream')
+        if isinstance(name, zipfile.ZipInfo):
+            name = name.filename
+        name = name.replace(os.sep, '/').lstrip('/')
+        if name in self._names:
+            print(f"Warning: Duplicate name in ZIP stream: {name}")
+        self._names.add(name)
         
-    # Handle media files
-    if url_lower.endswith(('.mp4', '.webm', '.ogg', '.avi', '.mov', '.flv')):
-        return 'videos'
-    if url_lower.endswith(('.mp3', '.wav', '.ogg', '.aac')):
-        return 'audio'
+        zinfo = zipfile.ZipInfo(name, time.localtime()[:6])
+        zinfo.compress_type = method
+        zinfo.header_offset = self.offset
+        encoded_name, zinfo.flag_bits = self._encode_name(name)
+        dos_time, dos_date = self._dos_timestamp(zinfo)
         
-    # Handle favicon
-    if url_lower.endswith(('.ico', '.icon')):
-        return 'favicons'
-    if 'favicon' in url_lower:
-        return 'favicons'
+        extra = struct.pack('<HHQQ', 0x0001, 16, file_size, compress_size) if zip64 else b''
+        self._write(struct.pack(
+            '<IHHHHHIIIHH', 0x04034b50, 45 if zip64 else 20, zinfo.flag_bits, method, dos_time, dos_date,
+            crc, 0xFFFFFFFF if zip64 else compress_size, 0xFFFFFFFF if zip64 else file_size,
+            len(encoded_name), len(extra)
+        ) + encoded_name + extra)
+        return zinfo
+
+    def _finish_member(self, zinfo, zip64, crc, file_size, compress_size):
+        zinfo.CRC = crc
+        zinfo.compress_size = compress_size
+        zinfo.file_size = file_size
+        self.filelist.append(zinfo)
+        self._zip64.append(zip64)
+        return zinfo
+
+    def write_compressed(self, name, compress_type, crc, file_size, compress_size, chunks):
+        """Add a member whose data in `chunks` is already compressed with `compress_type`"""
+        zip64 = max(file_size, compress_size) >= 0xFFFFFFFF
+        zinfo = self._begin_member(name, compress_type, zip64, crc, file_size, compress_size)
+        written = 0
+        for chunk in chunks:
+            written += len(chunk)
+            self._write(chunk)
+        if written != compress_size:
+            raise ValueError(f"{zinfo.filename}: wrote {written} bytes, expected {compress_size}")
+        return self._finish_member(zinfo, zip64, crc, file_size, compress_size)
+
+    @staticmethod
+    def _encode_name(name):
+        try:
+            return name.encode('ascii'), 0
+        except UnicodeEncodeError:
+            return name.encode('utf-8'), 0x800
+
+    @staticmethod
+    def _dos_timestamp(zinfo):
+        year, month, day, hour, minute, second = zinfo.date_time
+        dos_time = (hour << 11) | (minute << 5) | (second // 2)
+        dos_date = ((max(year, 1980) - 1980) << 9) | (month << 5) | day
+        return dos_time, dos_date
+
+    def close(self):
+        """Write the central directory and end records"""
+        if self._closed:
+            return
+        self._closed = True
+        central_start = self.offset
+        for zinfo, zip64 in zip(self.filelist, self._zip64):
+            # ZIP64 extra field: only the values that overflow, in this fixed order
+            values = []
+            file_size = zinfo.file_size
+            compress_size = zinfo.compress_size
+            offset = zinfo.header_offset
+            if zip64 or file_size >= 0xFFFFFFFF:
+                values.append(file_size)
+                file_size = 0xFFFFFFFF
+            if zip64 or compress_size >= 0xFFFFFFFF:
+                values.append(compress_size)
+                compress_size = 0xFFFFFFFF
+            if offset >= 0xFFFFFFFF:
+                values.append(offset)
+                offset = 0xFFFFFFFF
+            extra = struct.pack(f'<HH{len(values)}Q', 0x0001, 8 * len(values), *values) if values else b''
+            version = 45 if values else 20
+            encoded_name, _ = self._encode_name(zinfo.filename)
+            dos_time, dos_date = self._dos_timestamp(zinfo)
+            self._write(struct.pack(
+                '<IHHHHHHIIIHHHHHII', 0x02014b50, (3 << 8) | version, version, zinfo.flag_bits, zinfo.compress_type,
+                dos_time, dos_date, zinfo.CRC, compress_size, file_size,
+                len(encoded_name), len(extra), 0, 0, 0, 0o644 << 16, offset
+            ) + encoded_name + extra)
+        central_size = self.offset - central_start
+        count = len(self.filelist)
         
-    # Handle special API endpoints
-    if 'graphql' in url_lower or 'api.' in url_lower:
-        return 'js'
+        if count >= 0xFFFF or central_start >= 0xFFFFFFFF or central_size >= 0xFFFFFFFF:
+            zip64_end = self.offset
+            self._write(struct.pack(
+                '<IQHHIIQQQQ', 0x06064b50, 44, (3 << 8) | 45, 45, 0, 0, count, count, central_size, central_start
+            ))
+            self._write(struct.pack('<IIQI', 0x07064b50, 0, zip64_end, 1))
+        self._write(struct.pack(
+            '<IHHHHIIH', 0x06054b50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+            min(central_size, 0xFFFFFFFF), min(central_start, 0xFFFFFFFF), 0
+        ))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        return False
+
+class ExtractionError(Exception):
+    """An extraction failed in a way that should be reported to the client with `status`"""
+
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.status = status
+
+class ArchiveStreamClosed(Exception):
+    """The client went away while its archive was still being built"""
+
+class ArchiveStream:
+    """
+    Run an archive build on a worker thread and hand its bytes to a response.
+
+    The build writes through write(); chunks go through a bounded queue, so
+    a slow client slows the build down instead of letting the archive pile
+    up in memory. Iterating the stream yields the chunks until the build
+    finishes; if the client disconnects, the next write() raises
+    ArchiveStreamClosed and the build stops.
+    """
+
+    _DONE = object()
+
+    def __init__(self, max_chunks=None):
+        self._queue = queue.Queue(maxsize=max_chunks or ZIP_STREAM_QUEUE_CHUNKS)
+        self._started = threading.Event()
+        self._cancelled = threading.Event()
+        self.bytes_written = 0
+        self.error = None
+
+    def write(self, data):
+        self._started.set()
+        while True:
+            if self._cancelled.is_set():
+                raise ArchiveStreamClosed()
+            try:
+                self._queue.put(bytes(data), timeout=0.5)
+                self.bytes_written += len(data)
+                return
+            except queue.Full:
+                continue
+
+    def start(self, build):
+        """Run build(self) on a worker thread"""
+        def run():
+            try:
+                build(self)
+            except ArchiveStreamClosed:
+                print("Client disconnected; archive build stopped")
+            except ExtractionError as e:
+                self.error = e
+                print(f"Extraction failed: {str(e)}")
+            except Exception as e:
+                self.error = e
+                print(f"Error building archive: {str(e)}")
+                traceback.print_exc()
+            finally:
+                self._started.set()
+                while not self._cancelled.is_set():
+                    try:
+                        self._queue.put(self._DONE, timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
         
-    # Try to guess based on URL structure
-    if '/css/' in url_lower:
-        return 'css'
-    if '/js/' in url_lower or '/scripts/' in url_lower:
-        return 'js'
-    if '/static/' in url_lower and not any(ext in url_lower for ext in ['.css', '.js', '.png', '.jpg']):
-        # For static assets with unclear type, check the URL itself
-        if 'style' in url_lower:
-            return 'css'
-        return 'js'  # Default for static assets
+        threading.Thread(target=run, name='archive-stream', daemon=True).start()
+
+    def wait_started(self, timeout=None):
+        """
+        Block until the first byte is ready or the build ended.
         
-    # For CDN resources, try to determine type from the host
-    cdn_hosts = ['cdn.jsdelivr.net', 'unpkg.com', 'cdnjs.cloudflare.com']
-    for host in cdn_hosts:
-        if host in url_lower:
-            if any(lib in url_lower for lib in ['react', 'angular', 'vue', 'jquery']):
-                return 'js'
-            if any(lib in url_lower for lib in ['bootstrap', 'tailwind', 'material', 'font']):
-                return 'css'
-    
-    # Default to JS for unknown extensions
-    return 'js'
-
-def extract_metadata(soup, base_url):
-    """Extract metadata from the HTML"""
-    metadata = {
-        'title': '',
-        'description': '',
-        'keywords': '',
-        'og_tags': {},
-        'twitter_cards': {},
-        'canonical': '',
-        'language': '',
-        'favicon': '',
-        'structured_data': []
-    }
+        Returns the exception that ended the build before anything was
+        written (so the caller can still send an error response), else None.
+        """
+        self._started.wait(timeout)
+        if self.error is not None and not self.bytes_written:
+            return self.error
+        return None
+
+    def __iter__(self):
+        try:
+            while True:
+                chunk = self._queue.get()
+                if chunk is self._DONE:
+                    break
+                yield chunk
+        finally:
+            self._cancelled.set()
+
+class CompressionReport:
+    """Per asset type totals of what the archive compression cost and saved"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._types = {}
+
+    def record(self, asset_type, rule, file_size, compress_size, cpu_seconds):
+        with self._lock:
+            totals = self._totals(asset_type)
+            totals['members'] += 1
+            if rule in ('precompressed', 'incompressible', 'stored-fallback'):
+                totals['stored'] += 1
+            totals['bytes_in'] += file_size
+            totals['bytes_out'] += compress_size
+            totals['cpu_seconds'] += cpu_seconds
+            totals['rules'][rule] = totals['rules'].get(rule, 0) + 1
+
+    def record_duplicate(self, asset_type, size):
+        """Count a body that was not stored again because an identical one is in the archive"""
+        with self._lock:
+            totals = self._totals(asset_type)
+            totals['duplicates'] += 1
+            totals['bytes_deduplicated'] += size
+
+    def _totals(self, asset_type):
+        # Must be called with the lock held
+        return self._types.setdefault(asset_type, {
+            'members': 0, 'stored': 0, 'bytes_in': 0, 'bytes_out': 0, 'cpu_seconds': 0.0, 'rules': {},
+            'duplicates': 0, 'bytes_deduplicated': 0
+        })
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                asset_type: {
+                    'members': totals['members'],
+                    'stored': totals['stored'],
+                    'duplicates': totals['duplicates'],
+                    'bytes_deduplicated': totals['bytes_deduplicated'],
+                    'bytes_in': totals['bytes_in'],
+                    'bytes_out': totals['bytes_out'],
+                    'bytes_saved': totals['bytes_in'] - totals['bytes_out'],
+                    'cpu_ms': round(totals['cpu_seconds'] * 1000, 1),
+                    'rules': dict(totals['rules'])
+                }
+                for asset_type, totals in self._types.items()
+            }
+
+# Formats that are compressed already; deflating them again costs CPU for nothing
+PRECOMPRESSED_MIME_TYPES = {
+    'image/png', 'image/jpeg', 'image/gif', 'image/webp', 'image/avif', 'image/heic',
+    'font/woff', 'font/woff2', 'application/font-woff', 'application/font-woff2', 'application/x-font-woff',
+    'application/zip', 'application/gzip', 'application/x-gzip', 'application/pdf', 'application/x-brotli'
+}
+PRECOMPRESSED_MIME_PREFIXES = ('video/', 'audio/mpeg', 'audio/ogg', 'audio/aac', 'audio/mp4', 'audio/webm')
+TEXT_ASSET_TYPES = {'css', 'js', 'html', 'json'}
+
+def choose_compression(asset_type, mime_type, size, sample):
+    """
+    Pick (compress_type, compresslevel, rule) for one archive member.
     
-    # Extract title
-    title_tag = soup.find('title')
-    if title_tag and title_tag.string:
-        metadata['title'] = title_tag.string.strip()
+    Known compressed media is stored. Text is deflated at
+    ZIP_SMALL_TEXT_LEVEL when small (if configured), at ZIP_FAST_LEVEL when
+    larger than ZIP_LARGE_TEXT_BYTES, and at ZIP_DEFAULT_LEVEL otherwise.
+    Anything else is decided by deflating a sample at level 1: members
+    that do not shrink to ZIP_PROBE_MAX_RATIO of the sample are stored.
+    """
+    mime_type = (mime_type or '').split(';', 1)[0].strip().lower()
+    if mime_type in PRECOMPRESSED_MIME_TYPES or mime_type.startswith(PRECOMPRESSED_MIME_PREFIXES):
+        return zipfile.ZIP_STORED, None, 'precompressed'
+    if asset_type in TEXT_ASSET_TYPES:
+        if ZIP_SMALL_TEXT_LEVEL is not None and size <= ZIP_SMALL_TEXT_BYTES:
+            return zipfile.ZIP_DEFLATED, ZIP_SMALL_TEXT_LEVEL, 'small_text'
+        if size > ZIP_LARGE_TEXT_BYTES:
+            return zipfile.ZIP_DEFLATED, ZIP_FAST_LEVEL, 'large_text'
+        return zipfile.ZIP_DEFLATED, ZIP_DEFAULT_LEVEL, 'text'
+    if sample and len(zlib.compress(sample, 1)) > len(sample) * ZIP_PROBE_MAX_RATIO:
+        return zipfile.ZIP_STORED, None, 'incompressible'
+    return zipfile.ZIP_DEFLATED, ZIP_DEFAULT_LEVEL, 'default'
+
+# Archive directory for each asset type
+ASSET_ARCHIVE_DIRS = {
+    'css': 'assets/css',
+    'js': 'assets/js',
+    'images': 'assets/images',
+    'fonts': 'assets/fonts',
+    'other': 'assets/other'
+}
+
+def asset_archive_path(asset_type, asset, used_filenames):
+    """Pick a unique archive path for an asset record, or None if the type has no directory"""
+    dir_path = ASSET_ARCHIVE_DIRS.get(asset_type)
+    if not dir_path:
+        return None
     
-    # Extract meta tags
-    meta_tags = soup.find_all('meta')
-    for tag in meta_tags:
-        # Description
-        if tag.get('name') == 'description' and tag.get('content'):
-            metadata['description'] = tag.get('content').strip()
-        
-        # Keywords
-        elif tag.get('name') == 'keywords' and tag.get('content'):
-            metadata['keywords'] = tag.get('content').strip()
-        
-        # OpenGraph tags
-        elif tag.get('property') and tag.get('property').startswith('og:') and tag.get('content'):
-            prop = tag.get('property')[3:]  # Remove 'og:' prefix
-            metadata['og_tags'][prop] = tag.get('content').strip()
-        
-        # Twitter card tags
-        elif tag.get('name') and tag.get('name').startswith('twitter:') and tag.get('content'):
+    # Generate filename
+    original_path = asset.get('original_path', '')
+    filename = os.path.basename(original_path)
+    if not filename:
+        filename = f"asset_{uuid.uuid4().hex[:8]}"
+    
+    # Add extension if missing
+    if '.' not in filename:
+        ext = mimetypes.guess_extension(asset.get('mime') or asset.get('type', ''))
+        if ext:
+            filename += ext
+    
+    # Handle duplicates
+    base_name, ext = os.path.splitext(filename)
+    counter = 1
+    while filename in used_filenames:
+        filename = f"{base_name}_{counter}{ext}"
+        counter += 1
+    used_filenames.add(filename)
+    
+    return os.path.join(dir_path, filename)
+
+def iter_content_chunks(content, chunk_size=None):
+    """Yield an asset body (AssetBody, bytes or text) in chunks"""
+    chunk_size = chunk_size or ASSET_CHUNK_SIZE
+    if isinstance(content, AssetBody):
+        yield from content.iter_chunks(chunk_size)
+        return
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    view = memoryview(content)
+    for i in range(0, len(view), chunk_size):
+        yield view[i:i + chunk_size]
+
+def compress_member(content, compress_type, compresslevel):
+    """
+    Compress one archive member; runs on the compression pool.
+    
+    zlib releases the GIL while it works, so members compress in parallel
+    on threads. Deflated output is kept in a SpooledTemporaryFile, which
+    moves to disk past ASSET_SPILL_THRESHOLD. Stored members are only
+    checksummed; their content is copied when the member is written.
+    """
+    start = time.thread_time()
+    crc = 0
+    file_size = 0
+    payload = None
+    compressor = None
+    if compress_type == zipfile.ZIP_DEFLATED:
+        payload = tempfile.SpooledTemporaryFile(max_size=ASSET_SPILL_THRESHOLD)
+        compressor = zlib.compressobj(compresslevel if compresslevel is not None else ZIP_DEFAULT_LEVEL, zlib.DEFLATED, -15)
+    for chunk in iter_content_chunks(content):
+        crc = zlib.crc32(chunk, crc)
+        file_size += len(chunk)
+        if compressor:
+            payload.write(compressor.compress(chunk))
+    if compressor:
+        payload.write(compressor.flush())
+        compress_size = payload.tell()
+        payload.seek(0)
+    else:
+        compress_size = file_size
+    return {
+        'compress_type': compress_type,
+        'crc': crc,
+        'file_size': file_size,
+        'compress_size': compress_size,
+        'payload': payload,
+        'cpu_seconds': time.thread_time() - start
+    }
+
+# Compression pool shared by all archives being built in the process
+archive_compression_pool = ThreadPoolExecutor(max_workers=ARCHIVE_WORKERS, thread_name_prefix='archive-compress')
+
+class ArchiveWriter:
+    """
+    Base class of the output backends (ZIP, tar, WARC, directory tree).
+
+    Backends receive members one at a time through add() and write them
+    out as they arrive, so every backend can stream. add_asset() is shared:
+    it names asset records under assets/<type>/ and stores each unique
+    body once (by SHA-256); a repeated body only gets a manifest entry
+    pointing at the stored member, and backends may record it as well
+    through add_duplicate(). manifest.json, written on close(), maps every
+    URL and original path to its member.
+    """
+
+    def __init__(self, report=None):
+        self.report = report or CompressionReport()
+        self.used_filenames = set()
+        self.manifest = []
+        self._members_by_hash = {}  # sha256 -> archive path of the stored body
+
+    def add(self, name, content, asset_type='other', mime_type=None):
+        """Write one member (AssetBody, bytes or text)"""
+        raise NotImplementedError
+
+    def add_record(self, name, content, asset_type, asset):
+        """Write the first copy of an asset record's body; backends may use the record's URL and headers"""
+        self.add(name, content, asset_type, asset.get('mime'))
+
+    def add_duplicate(self, name, content, asset_type, asset):
+        """Called for a record whose body is already stored as `name`"""
+
+    def add_asset(self, asset_type, asset):
+        """Add an asset record under assets/<type>/, or point it at an identical stored body"""
+        content = asset.get('content') if isinstance(asset, dict) else None
+        if content is None:
+            return
+        try:
+            if isinstance(content, AssetBody):
+                digest = content.sha256
+            else:
+                digest = hashlib.sha256(content.encode('utf-8') if isinstance(content, str) else content).hexdigest()
+            
+            file_path = self._members_by_hash.get(digest)
+            duplicate = file_path is not None
+            if not duplicate:
+                file_path = asset_archive_path(asset_type, asset, self.used_filenames)
+                if not file_path:
+                    return
+                file_path = file_path.replace(os.sep, '/')
+            
+            # Listed before the body is written: a backend that has to drop the
+            # member (see _drop_member()) removes the entry again
+            self.manifest.append({
+                'url': asset.get('url'),
+                'original_path': asset.get('original_path'),
+                'original_paths': asset.get('original_paths') or [asset.get('original_path')],
+                'type': asset_type,
+                'member': file_path,
+                'sha256': digest,
+                'size': len(content),
+                'duplicate': duplicate
+            })
+            if duplicate:
+                self.report.record_duplicate(asset_type, len(content))
+                self.add_duplicate(file_path, content, asset_type, asset)
+            else:
+                self._members_by_hash[digest] = file_path
+                try:
+                    self.add_record(file_path, content, asset_type, asset)
+                except Exception:
+                    self._drop_member(file_path)
+                    raise
+        except ArchiveStreamClosed:
+            raise
+        except Exception as e:
+            print(f"Warning: Failed to add {asset_type} asset to the archive: {str(e)}")
+
+    def _drop_member(self, name):
+        """Forget a member that could not be written, so the manifest does not list it"""
+        self.manifest = [entry for entry in self.manifest if entry['member'] != name]
+        for digest, path in list(self._members_by_hash.items()):
+            if path == name:
+                del self._members_by_hash[digest]
+
+    def flush(self):
+        """Write out anything the backend is still holding"""
+
+    def close(self):
+        """Write manifest.json and finish the output"""
+        try:
+            # Members still in flight may be dropped; settle them before the manifest is built
+            self.flush()
+            if self.manifest:
+                self.add('manifest.json', json.dumps({
+                    'members': len(self._members_by_hash),
+                    'references': len(self.manifest),
+                    'assets': self.manifest
+                }, indent=2), 'json', 'application/json')
+            self.flush()
+            self._finish()
+        finally:
+            self._shutdown()
+
+    def abort(self):
+        """Stop without finishing the output"""
+        self._shutdown()
+
+    def _finish(self):
+        pass
+
+    def _shutdown(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+class ZipArchiveWriter(ArchiveWriter):
+    """
+    ZIP backend.
+
+    Members are compressed in parallel on a thread pool (the shared
+    archive_compression_pool, or a private one when `workers` is given)
+    and written to a ZipStreamWriter in the order they were added, so
+    the archive layout does not depend on which member finished first.
+    At most `max_pending` members are in flight; add() waits for the
+    oldest one beyond that, which keeps memory bounded.
+    """
+
+    def __init__(self, sink, workers=None, max_pending=None, report=None):
+        super().__init__(report)
+        self.zip = ZipStreamWriter(sink)
+        self._own_pool = None
+        if workers:
+            self._own_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='archive-compress')
+        self._pool = self._own_pool or archive_compression_pool
+        self.max_pending = max_pending or ARCHIVE_MAX_PENDING
+        self._pending = deque()  # (name, content, asset_type, rule, future) in archive order
+
+    def add(self, name, content, asset_type='other', mime_type=None):
+        """Queue a member; the compression method follows choose_compression()"""
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        if isinstance(content, AssetBody):
+            sample = content.head(ZIP_PROBE_BYTES)
+            mime_type = mime_type or content.content_type
+        else:
+            sample = content[:ZIP_PROBE_BYTES]
+        compress_type, compresslevel, rule = choose_compression(asset_type, mime_type, len(content), sample)
+        future = self._pool.submit(compress_member, content, compress_type, compresslevel)
+        self._pending.append((name, content, asset_type, rule, future))
+        self._write_ready(block=len(self._pending) > self.max_pending)
+
+    def _write_ready(self, block=False):
+        # Write finished members from the head of the queue; with block=True
+        # wait for the head until the queue is back under max_pending
+        while self._pending:
+            name, content, asset_type, rule, future = self._pending[0]
+            if not future.done() and not (block and len(self._pending) > self.max_pending):
+                return
+            self._pending.popleft()
+            try:
+                member = future.result()
+            except Exception as e:
+                print(f"Warning: Failed to compress {name}, storing it uncompressed: {str(e)}")
+                try:
+                    member = compress_member(content, zipfile.ZIP_STORED, None)
+                    rule = 'stored-fallback'
+                except Exception as e:
+                    print(f"Warning: Failed to read {name}, leaving it out: {str(e)}")
+                    self._drop_member(name)
+                    continue
+            payload = member['payload']
+            try:
+                if payload is None:
+                    chunks = iter_content_chunks(content)
+                else:
+                    chunks = iter(lambda: payload.read(ASSET_CHUNK_SIZE), b'')
+                zinfo = self.zip.write_compressed(
+                    name, member['compress_type'], member['crc'], member['file_size'], member['compress_size'], chunks
+                )
+            finally:
+                if payload is not None:
+                    payload.close()
+            self.report.record(asset_type, rule, zinfo.file_size, zinfo.compress_size, member['cpu_seconds'])
+
+    def flush(self):
+        """Wait for and write every queued member"""
+        while self._pending:
+            self._write_ready()
+            if self._pending:
+                try:
+                    self._pending[0][4].result()
+                except Exception:
+                    pass  # reported when the member is written
+
+    def _finish(self):
+        self.zip.close()
+
+    def abort(self):
+        """Drop queued members without finishing the archive"""
+        for *_, future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        super().abort()
+
+    def _shutdown(self):
+        if self._own_pool:
+            self._own_pool.shutdown(wait=False)
+            self._own_pool = None
+
+class SinkFile:
+    """Minimal write-only file object over a sink callable, for stdlib writers such as tarfile"""
+
+    def __init__(self, sink):
+        self.sink = sink
+
+    def write(self, data):
+        self.sink(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+class TarArchiveWriter(ArchiveWriter):
+    """Tar backend, uncompressed or gzip, written as a stream with tarfile's 'w|' modes"""
+
+    def __init__(self, sink, compress=False, report=None):
+        super().__init__(report)
+        self.compress = compress
+        self.tar = tarfile.open(fileobj=SinkFile(sink), mode='w|gz' if compress else 'w|', format=tarfile.PAX_FORMAT)
+
+    def add(self, name, content, asset_type='other', mime_type=None):
+        start = time.thread_time()
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        info = tarfile.TarInfo(name)
+        info.size = len(content)
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        with (content.open() if isinstance(content, AssetBody) else BytesIO(content)) as fh:
+            self.tar.addfile(info, fh)
+        self.report.record(asset_type, 'tar.gz' if self.compress else 'tar', info.size, info.size,
+                           time.thread_time() - start)
+
+    def _finish(self):
+        self.tar.close()
+
+class WarcArchiveWriter(ArchiveWriter):
+    """
+    WARC/1.1 backend.
+
+    Asset records with a URL become 'response' records carrying the
+    original HTTP status line and headers (bodies are stored decoded, so
+    Content-Encoding and Transfer-Encoding are dropped and Content-Length
+    is set to the stored size); repeated bodies become 'revisit' records
+    with the identical-payload-digest profile. The page, metadata and
+    inline assets become 'resource' records. With compress=True every
+    record is its own gzip member (.warc.gz).
+    """
+
+    def __init__(self, sink, page_url=None, compress=False, report=None):
+        super().__init__(report)
+        self.sink = sink
+        self.page_url = page_url
+        self.compress = compress
+        self._record_ids = {}  # archive path -> (WARC-Record-ID, target URI) of the stored copy
+        self._started = False
+
+    @staticmethod
+    def _payload_digest(content):
+        if isinstance(content, AssetBody) and content.sha256:
+            raw = bytes.fromhex(content.sha256)
+        else:
+            raw = hashlib.sha256(content).digest()
+        return 'sha256:' + base64.b32encode(raw).decode('ascii')
+
+    def _write_warcinfo(self):
+        # Written before the first record rather than in __init__, so nothing
+        # reaches the sink (and the response is not started) until there is content
+        self._started = True
+        self._write_record('warcinfo', None, 'application/warc-fields', [(
+            "software: website-extractor\r\nformat: WARC File Format 1.1\r\n"
+            "conformsTo: http://iipc.github.io/warc-specifications/specifications/warc-format/warc-1.1/\r\n"
+        ).encode('utf-8')])
+
+    def _write_record(self, warc_type, target_uri, content_type, blocks, size=None, extra_headers=None):
+        if not self._started:
+            self._write_warcinfo()
+        start = time.thread_time()
+        blocks = list(blocks) if size is None else blocks
+        size = sum(len(block) for block in blocks) if size is None else size
+        record_id = f"<urn:uuid:{uuid.uuid4()}>"
+        headers = [
+            ('WARC-Type', warc_type),
+            ('WARC-Record-ID', record_id),
+            ('WARC-Date', datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')),
+        ]
+        if target_uri:
+            headers.append(('WARC-Target-URI', target_uri))
+        headers.extend(extra_headers or [])
+        headers.append(('Content-Type', content_type))
+        headers.append(('Content-Length', str(size)))
+        head = ('WARC/1.1\r\n' + ''.join(f"{key}: {value}\r\n" for key, value in headers) + '\r\n').encode('utf-8')
+        
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if self.compress else None
+        written = 0
+        for data in itertools.chain([head], blocks, [b'\r\n\r\n']):
+            written += len(data)
+            if compressor:
+                data = compressor.compress(data)
+            if data:
+                self.sink(bytes(data))
+        if compressor:
+            self.sink(compressor.flush())
+        return record_id, written, time.thread_time() - start
+
+    def add(self, name, content, asset_type='other', mime_type=None):
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        target_uri = self.page_url if name == 'index.html' and self.page_url else f"urn:website-extractor:{name}"
+        mime_type = mime_type or (content.content_type if isinstance(content, AssetBody) else '') or 'application/octet-stream'
+        record_id, written, cpu = self._write_record(
+            'resource', target_uri, mime_type, iter_content_chunks(content), len(content),
+            [('WARC-Payload-Digest', self._payload_digest(content)), ('WARC-Block-Digest', self._payload_digest(content))]
+        )
+        self._record_ids[name] = (record_id, target_uri)
+        self.report.record(asset_type, 'warc', len(content), written, cpu)
+
+    def add_record(self, name, content, asset_type, asset):
+        url = asset.get('url')
+        if not url:
+            return self.add(name, content, asset_type, asset.get('mime'))
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        http_head = self._http_head(content, asset.get('mime')).encode('latin-1', errors='replace')
+        record_id, written, cpu = self._write_record(
+            'response', url, 'application/http; msgtype=response',
+            itertools.chain([http_head], iter_content_chunks(content)), len(http_head) + len(content),
+            [('WARC-Payload-Digest', self._payload_digest(content)), ('WARC-Identified-Payload-Type', asset.get('mime') or '')]
+        )
+        self._record_ids[name] = (record_id, url)
+        self.report.record(asset_type, 'warc', len(content), written, cpu)
+
+    def add_duplicate(self, name, content, asset_type, asset):
+        url = asset.get('url')
+        original = self._record_ids.get(name)
+        if not url or not original:
+            return
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        http_head = self._http_head(content, asset.get('mime')).encode('latin-1', errors='replace')
+        self._write_record('revisit', url, 'application/http; msgtype=response', [http_head], None, [
+            ('WARC-Profile', 'http://netpreserve.org/warc/1.1/revisit/identical-payload-digest'),
+            ('WARC-Refers-To', original[0]),
+            ('WARC-Refers-To-Target-URI', original[1]),
+            ('WARC-Payload-Digest', self._payload_digest(content)),
+        ])
+
+    @staticmethod
+    def _http_head(content, mime_type=None):
+        headers = dict(getattr(content, 'headers', None) or {})
+        status = getattr(content, 'status', None) or 200
+        reason = getattr(content, 'reason', None) or 'OK'
+        for name in list(headers):
+            if name.lower() in ('content-encoding', 'transfer-encoding', 'content-length'):
+                del headers[name]
+        if not any(name.lower() == 'content-type' for name in headers) and (mime_type or getattr(content, 'content_type', '')):
+            headers['Content-Type'] = getattr(content, 'content_type', '') or mime_type
+        headers['Content-Length'] = str(len(content))
+        return f"HTTP/1.1 {status} {reason}\r\n" + ''.join(f"{key}: {value}\r\n" for key, value in headers.items()) + '\r\n'
+
+class DirectoryArchiveWriter(ArchiveWriter):
+    """
+    Directory tree backend: members are written as plain files under `root`.
+
+    With hardlink=True, bodies that already live on disk (cache objects and
+    spilled downloads) are hardlinked instead of copied; the links share
+    storage with the asset cache, so the tree must be treated as read-only.
+    Falls back to copying across filesystems.
+    """
+
+    def __init__(self, root, hardlink=False, report=None):
+        super().__init__(report)
+        self.root = os.path.abspath(root)
+        self.hardlink = hardlink
+        os.makedirs(self.root, exist_ok=True)
+
+    def _target(self, name):
+        path = os.path.normpath(os.path.join(self.root, name))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Member path escapes the output directory: {name}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def add(self, name, content, asset_type='other', mime_type=None):
+        start = time.thread_time()
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        path = self._target(name)
+        rule = 'copy'
+        if isinstance(content, AssetBody) and not content.in_memory and self.hardlink:
+            try:
+                if os.path.exists(path):
+                    os.unlink(path)
+                os.link(content.path, path)
+                rule = 'hardlink'
+            except OSError:
+                pass
+        if rule == 'copy':
+            with open(path, 'wb') as fh:
+                for chunk in iter_content_chunks(content):
+                    fh.write(chunk)
+        self.report.record(asset_type, rule, len(content), len(content), time.thread_time() - start)
+
+# Output formats selectable on /extract and in the CLI; 'dir' writes a tree on the server instead of a stream
+ARCHIVE_FORMATS = ('zip', 'tar', 'tar.gz', 'warc', 'warc.gz', 'dir')
+ARCHIVE_MIMETYPES = {
+    'zip': 'application/zip',
+    'tar': 'application/x-tar',
+    'tar.gz': 'application/gzip',
+    'warc': 'application/warc',
+    'warc.gz': 'application/warc',
+}
+
+def open_archive_writer(fmt, sink=None, root=None, page_url=None, hardlink=False):
+    """Create the writer for an output format; streaming formats write to `sink`, 'dir' to `root`"""
+    if fmt == 'zip':
+        return ZipArchiveWriter(sink)
+    if fmt in ('tar', 'tar.gz'):
+        return TarArchiveWriter(sink, compress=fmt == 'tar.gz')
+    if fmt in ('warc', 'warc.gz'):
+        return WarcArchiveWriter(sink, page_url, compress=fmt == 'warc.gz')
+    if fmt == 'dir':
+        return DirectoryArchiveWriter(root, hardlink=hardlink)
+    raise ValueError(f"Unknown output format: {fmt} (expected one of {', '.join(ARCHIVE_FORMATS)})")
+
+class ExtractionStats:
+    """Thread-safe counters collected while running a single extraction"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def get(self, name, default=0):
+        with self._lock:
+            return self._counters.get(name, default)
+
+    def as_dict(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def cache_report(self):
+        """Warm-cache hit rate and bytes saved for this extraction"""
+        hits = self.get('cache_hits')
+        revalidated = self.get('cache_revalidated')
+        lookups = hits + revalidated + self.get('cache_misses')
+        return {
+            'hits': hits,
+            'revalidated': revalidated,
+            'misses': self.get('cache_misses'),
+            'hit_rate': round((hits + revalidated) / lookups, 3) if lookups else 0.0,
+            'bytes_saved': self.get('cache_bytes_saved')
+        }
+
+def normalize_url(url):
+    """Normalize a URL for use as a cache key (case, default ports, fragment, query order)"""
+    parsed = urlparse(url)
+    scheme = parsed.scheme.lower()
+    netloc = parsed.netloc.lower()
+    if (scheme == 'http' and netloc.endswith(':80')) or (scheme == 'https' and netloc.endswith(':443')):
+        netloc = netloc.rsplit(':', 1)[0]
+    query = '&'.join(sorted(parsed.query.split('&'))) if parsed.query else ''
+    return urlunparse((scheme, netloc, parsed.path or '/', parsed.params, query, ''))
+
+# CDN image transformation path segments such as /q_auto,f_auto/ or /w_800,c_fill/.
+# Gravity and flag values are spelled out so directories like /g_home/ or
+# /fl_images/ are kept, and a lone /w_200/ or /h_200/ is not a transform
+CDN_TRANSFORM_TOKEN = (
+    r'(?:q_(?:auto(?::\w+)?|\d+)|f_(?:auto|webp|avif|jpe?g|png|gif)|w_(?:\d+|auto)|h_\d+'
+    r'|c_(?:fill|fit|limit|scale|crop|thumb|pad|lfill|lpad|mfit)|dpr_(?:[\d.]+|auto)|ar_[\d:.]+'
+    r'|g_(?:auto(?::\w+)?|center|faces?|custom|(?:north|south)(?:_east|_west)?|east|west)'
+    r'|fl_(?:progressive|lossy|any_format|strip_profile|keep_iptc|preserve_transparency|awebp|animated))'
+)
+CDN_TRANSFORM_SEGMENT = re.compile(
+    rf'^(?![wh]_\w+$){CDN_TRANSFORM_TOKEN}(?:,{CDN_TRANSFORM_TOKEN})*$', re.IGNORECASE
+)
+
+def compile_strip_params(spec):
+    """Split a comma separated list of query parameter names (`utm_*` style prefixes allowed)"""
+    names = set()
+    prefixes = []
+    for name in (spec or '').split(','):
+        name = name.strip().lower()
+        if name.endswith('*'):
+            prefixes.append(name[:-1])
+        elif name:
+            names.add(name)
+    return names, tuple(prefixes)
+
+DEFAULT_STRIP_PARAMS = compile_strip_params(URL_STRIP_PARAMS)
+
+def canonicalize_url(url, strip_params=None, strip_transforms=None):
+    """
+    Canonical form of an asset URL, used as the key to deduplicate downloads.
+    
+    On top of normalize_url() this drops tracking query parameters and,
+    optionally, CDN transformation path segments (`q_auto`, `f_auto`, ...).
+    The result is never fetched: it may name a different resource.
+    
+    Args:
+        url: Absolute URL
+        strip_params: Optional (names, prefixes) from compile_strip_params()
+        strip_transforms: Whether to drop CDN transform segments (defaults to URL_STRIP_CDN_TRANSFORMS)
+    """
+    parsed = urlparse(url)
+    if parsed.scheme.lower() not in ('http', 'https'):
+        return url
+    names, prefixes = strip_params or DEFAULT_STRIP_PARAMS
+    if strip_transforms is None:
+        strip_transforms = URL_STRIP_CDN_TRANSFORMS
+    
+    query = parsed.query
+    if query and (names or prefixes):
+        kept = []
+        for pair in query.split('&'):
+            name = unquote(pair.split('=', 1)[0]).lower()
+            if name in names or (prefixes and name.startswith(prefixes)):
+                continue
+            kept.append(pair)
+        query = '&'.join(kept)
+    
+    path = parsed.path
+    if strip_transforms and path:
+        segments = path.split('/')
+        # Never strip the last segment, it is the file name
+        path = '/'.join([s for s in segments[:-1] if not CDN_TRANSFORM_SEGMENT.match(s)] + segments[-1:])
+    
+    return normalize_url(urlunparse((parsed.scheme, parsed.netloc, path, parsed.params, query, '')))
+
+def parse_cache_control(value):
+    """Parse a Cache-Control header into a dict of lowercase directives"""
+    directives = {}
+    for part in (value or '').split(','):
+        name, _, arg = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = arg.strip('"') if arg else True
+    return directives
+
+class AssetCache:
+    """
+    Persistent, content-addressed cache of downloaded assets.
+
+    Entries are keyed by normalized URL and point at bodies stored once per
+    SHA-256 under `objects/`, so identical files served from different URLs
+    share one copy on disk. Freshness follows Cache-Control/Expires; stale
+    entries are revalidated with If-None-Match / If-Modified-Since. The
+    least recently used entries are evicted when the stored bodies exceed
+    the byte budget. Responses that are private, set cookies, vary on the
+    requester or were fetched with cookies are never stored.
+    """
+
+    # Entries used this recently are never evicted, so bodies handed out to
+    # a running extraction stay on disk until it has finished with them
+    EVICTION_GRACE = 600
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory or ASSET_CACHE_DIR
+        self.max_bytes = max_bytes or ASSET_CACHE_MAX_BYTES
+        os.makedirs(os.path.join(self.directory, 'objects'), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(self.directory, 'index.sqlite3'), check_same_thread=False)
+        with self._db:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    sha256 TEXT NOT NULL,
+                    content_type TEXT,
+                    encoding TEXT,
+                    etag TEXT,
+                    last_modified TEXT,
+                    fresh_until REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )""")
+            self._db.execute("CREATE TABLE IF NOT EXISTS objects (sha256 TEXT PRIMARY KEY, size INTEGER NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access)")
+
+    def _object_path(self, sha256):
+        return os.path.join(self.directory, 'objects', sha256[:2], sha256)
+
+    def lookup(self, url):
+        """Return the cache entry for a URL, or None"""
+        key = normalize_url(url)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT e.sha256, e.content_type, e.encoding, e.etag, e.last_modified, e.fresh_until, o.size "
+                "FROM entries e JOIN objects o ON o.sha256 = e.sha256 WHERE e.key = ?", (key,)).fetchone()
+        if not row or not os.path.exists(self._object_path(row[0])):
+            return None
+        return {
+            'key': key, 'sha256': row[0], 'content_type': row[1] or '', 'encoding': row[2],
+            'etag': row[3], 'last_modified': row[4], 'fresh_until': row[5], 'size': row[6]
+        }
+
+    def is_fresh(self, entry):
+        return entry['fresh_until'] > time.time()
+
+    def conditional_headers(self, entry):
+        """Request headers to revalidate a stale entry"""
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def body(self, entry, url=None):
+        """Return the cached body of an entry and mark it as recently used"""
+        with self._lock, self._db:
+            self._db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), entry['key']))
+        # Only the type and validators are stored, so that is all a cached body can report of its headers
+        headers = {'Content-Type': entry['content_type'], 'ETag': entry.get('etag'), 'Last-Modified': entry.get('last_modified')}
+        return AssetBody(path=self._object_path(entry['sha256']), size=entry['size'], sha256=entry['sha256'],
+                         content_type=entry['content_type'], encoding=entry['encoding'], url=url, owned=False,
+                         headers={key: value for key, value in headers.items() if value})
+
+    def _freshness(self, response_headers):
+        """Return (cacheable, fresh_until) for a response"""
+        directives = parse_cache_control(response_headers.get('Cache-Control'))
+        if 'no-store' in directives or 'private' in directives or response_headers.get('Set-Cookie'):
+            return False, 0.0
+        # Entries are keyed by URL alone, so responses that vary on the requester cannot be shared
+        vary = {name.strip().lower() for name in (response_headers.get('Vary') or '').split(',')}
+        if vary & {'*', 'cookie', 'authorization'}:
+            return False, 0.0
+        now = time.time()
+        if 'no-cache' in directives:
+            return True, 0.0
+        max_age = directives.get('s-maxage') or directives.get('max-age')
+        if isinstance(max_age, str) and max_age.isdigit():
+            return True, now + int(max_age)
+        expires = response_headers.get('Expires')
+        if expires:
+            try:
+                return True, parsedate_to_datetime(expires).timestamp()
+            except (TypeError, ValueError):
+                return True, 0.0
+        last_modified = response_headers.get('Last-Modified')
+        if last_modified:
+            # Heuristic freshness: 10% of the time since last modification, at most a day
+            try:
+                age = now - parsedate_to_datetime(last_modified).timestamp()
+                return True, now + min(max(age, 0) * 0.1, 86400)
+            except (TypeError, ValueError):
+                pass
+        return True, 0.0
+
+    def store(self, url, body, response_headers, credentialed=False):
+        """Store a freshly downloaded body if the response allows it and was not fetched with cookies"""
+        if credentialed or body is None or body.credentialed:
+            return
+        cacheable, fresh_until = self._freshness(response_headers)
+        etag = response_headers.get('ETag')
+        last_modified = response_headers.get('Last-Modified')
+        # An entry that is never fresh and cannot be revalidated is useless
+        if not cacheable or (fresh_until <= time.time() and not etag and not last_modified):
+            return
+        
+        object_path = self._object_path(body.sha256)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            temp_fd, temp_path = tempfile.mkstemp(dir=self.directory)
+            try:
+                with os.fdopen(temp_fd, 'wb') as fh:
+                    for chunk in body.iter_chunks():
+                        fh.write(chunk)
+                os.replace(temp_path, object_path)
+            except OSError as e:
+                _remove_spill_file(temp_path)
+                print(f"Warning: Failed to cache {url}: {str(e)}")
+                return
+        
+        with self._lock, self._db:
+            self._db.execute("INSERT OR IGNORE INTO objects (sha256, size) VALUES (?, ?)", (body.sha256, body.size))
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, sha256, content_type, encoding, etag, last_modified, fresh_until, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (normalize_url(url), body.sha256, body.content_type, body.encoding, etag, last_modified, fresh_until, time.time()))
+        self._evict()
+
+    def refresh(self, entry, response_headers):
+        """Update freshness and validators after a 304 Not Modified"""
+        _, fresh_until = self._freshness(response_headers)
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE entries SET fresh_until = ?, etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) WHERE key = ?",
+                (fresh_until, response_headers.get('ETag'), response_headers.get('Last-Modified'), entry['key']))
+
+    def _evict(self):
+        """Drop least recently used entries until the stored bodies fit the byte budget"""
+        with self._lock, self._db:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            candidates = self._db.execute(
+                "SELECT key, sha256 FROM entries WHERE last_access < ? ORDER BY last_access",
+                (time.time() - self.EVICTION_GRACE,)).fetchall()
+            for key, sha256 in candidates:
+                if total <= self.max_bytes:
+                    break
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                # Bodies are shared between URLs; only delete once nothing points at them
+                if self._db.execute("SELECT 1 FROM entries WHERE sha256 = ? LIMIT 1", (sha256,)).fetchone():
+                    continue
+                size = self._db.execute("SELECT size FROM objects WHERE sha256 = ?", (sha256,)).fetchone()
+                self._db.execute("DELETE FROM objects WHERE sha256 = ?", (sha256,))
+                _remove_spill_file(self._object_path(sha256))
+                total -= size[0] if size else 0
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            objects, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects").fetchone()
+        return {'directory': self.directory, 'entries': entries, 'objects': objects, 'bytes': total, 'max_bytes': self.max_bytes}
+
+# Shared on-disk cache; disabled if the cache directory cannot be used
+asset_cache = None
+if ASSET_CACHE_ENABLED:
+    try:
+        asset_cache = AssetCache()
+    except (OSError, sqlite3.Error) as e:
+        print(f"Asset cache disabled: {str(e)}")
+
+class NegativeCache:
+    """Remember URLs that returned 404/410 so they are not requested again for a while"""
+
+    MAX_ENTRIES = 50000
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl if ttl is not None else NEGATIVE_CACHE_TTL
+        self._lock = threading.Lock()
+        self._entries = {}  # normalized URL -> (status, expires)
+
+    def get(self, url):
+        """Return the remembered status for a URL, or None"""
+        key = normalize_url(url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+        return entry[0] if entry else None
+
+    def add(self, url, status):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._entries) >= self.MAX_ENTRIES:
+                self._entries = {k: v for k, v in self._entries.items() if v[1] > now}
+            self._entries[normalize_url(url)] = (status, now + self.ttl)
+
+    def __len__(self):
+        return len(self._entries)
+
+class HostCircuitBreaker:
+    """
+    Per-host circuit breaker for unreachable hosts.
+
+    After CIRCUIT_BREAKER_THRESHOLD consecutive timeouts or connection
+    errors the circuit opens and requests to the host fail immediately.
+    Once CIRCUIT_BREAKER_COOLDOWN has passed a single probe request is let
+    through (half-open); the circuit closes if it gets any HTTP response and
+    opens again if it fails.
+    """
+
+    def __init__(self, threshold=None, cooldown=None):
+        self.threshold = threshold or CIRCUIT_BREAKER_THRESHOLD
+        self.cooldown = cooldown or CIRCUIT_BREAKER_COOLDOWN
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def allow(self, host):
+        """Return True if a request to `host` may be sent now"""
+        with self._lock:
+            state = self._hosts.get(host)
+            if not state or state['state'] == 'closed':
+                return True
+            now = time.monotonic()
+            # A probe that never reported back is given up after one cooldown
+            if now - state['since'] < self.cooldown:
+                return False
+            state['state'] = 'half-open'
+            state['since'] = now
+            print(f"Circuit half-open for {host}, sending probe request")
+            return True
+
+    def record_success(self, host):
+        with self._lock:
+            state = self._hosts.pop(host, None)
+        if state and state['state'] != 'closed':
+            print(f"Circuit closed for {host}")
+
+    def record_failure(self, host):
+        with self._lock:
+            state = self._hosts.setdefault(host, {'state': 'closed', 'failures': 0, 'since': 0.0})
+            state['failures'] += 1
+            if state['state'] == 'half-open' or (state['state'] == 'closed' and state['failures'] >= self.threshold):
+                state['state'] = 'open'
+                state['since'] = time.monotonic()
+                print(f"Circuit open for {host} after {state['failures']} consecutive failures")
+
+    def snapshot(self):
+        with self._lock:
+            return {host: {'state': s['state'], 'failures': s['failures']} for host, s in self._hosts.items()}
+
+# Shared failure tracking, kept across extractions
+negative_cache = NegativeCache()
+host_circuit_breaker = HostCircuitBreaker()
+
+# List of user agents to rotate through to avoid detection
+USER_AGENTS = [
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Safari/605.1.15',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:123.0) Gecko/20100101 Firefox/123.0',
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_3_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1'
+]
+
+def download_asset(url, base_url, headers=None, session_obj=None, stats=None):
+    """
+    Download an asset from a URL
+    
+    Args:
+        url: URL to download from
+        base_url: Base URL of the website (for referrer)
+        headers: Optional custom headers
+        session_obj: Optional requests.Session object for maintaining cookies
+                     (defaults to the shared pooled session)
+        stats: Optional ExtractionStats collecting cache counters
+    
+    Returns:
+        AssetBody with the content of the asset, or None if download failed
+    """
+    # Use a random user agent
+    random_user_agent = random.choice(USER_AGENTS)
+    
+    if not headers:
+        headers = {
+            'User-Agent': random_user_agent,
+            'Accept': '*/*',
+            'Accept-Language': 'en-US,en;q=0.9',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'Connection': 'keep-alive',
+            'Referer': base_url,
+            'Sec-Fetch-Dest': 'empty',
+            'Sec-Fetch-Mode': 'cors',
+            'Sec-Fetch-Site': 'same-origin',
+            'Pragma': 'no-cache',
+            'Cache-Control': 'no-cache',
+        }
+    else:
+        # Update the user agent in the provided headers
+        headers['User-Agent'] = random_user_agent
+    
+    # Parse the URL to check if it's valid
+    try:
+        parsed_url = urlparse(url)
+        if not parsed_url.scheme or not parsed_url.netloc:
+            print(f"Invalid URL: {url}")
+            return None
+    except Exception as e:
+        print(f"Error parsing URL {url}: {str(e)}")
+        return None
+    
+    host = parsed_url.netloc.lower()
+    
+    # Skip URLs that recently returned 404/410
+    missing_status = negative_cache.get(url)
+    if missing_status:
+        print(f"Skipping {url}: returned {missing_status} recently")
+        if stats:
+            stats.incr('negative_cache_hits')
+        return None
+    
+    # Serve fresh copies from the asset cache; revalidate stale ones
+    cache_entry = asset_cache.lookup(url) if asset_cache else None
+    if cache_entry and asset_cache.is_fresh(cache_entry):
+        if stats:
+            stats.incr('cache_hits')
+            stats.incr('cache_bytes_saved', cache_entry['size'])
+        return asset_cache.body(cache_entry, url)
+    if cache_entry:
+        headers.update(asset_cache.conditional_headers(cache_entry))
+    elif stats and asset_cache:
+        stats.incr('cache_misses')
+    request_url = url
+    
+    # Maximum number of retries
+    max_retries = 3
+    retry_count = 0
+    
+    while retry_count < max_retries:
+        # Fail fast while the host's circuit is open
+        if not host_circuit_breaker.allow(host):
+            print(f"Skipping {url}: circuit open for {host}")
+            if stats:
+                stats.incr('circuit_open_skips')
+            return None
+        
+        # Wait for the host's rate limiter instead of a fixed delay
+        host_rate_limiter.acquire(host)
+        try:
+            # Use session if provided, otherwise the shared cookie-less session
+            response = (session_obj or http_client.shared_session).get(
+                url, 
+                timeout=15, 
+                headers=headers, 
+                stream=True, 
+                allow_redirects=True,
+                verify=False  # Ignore SSL certificate errors
+            )
+            
+            # Handle redirects
+            if response.history:
+                print(f"Request for {url} was redirected {len(response.history)} times to {response.url}")
+                url = response.url  # Update URL to the final destination
+            
+            # Any HTTP response means the host is reachable
+            host_circuit_breaker.record_success(host)
+            if response.status_code < 500 and response.status_code != 429:
+                host_rate_limiter.record_success(host)
+            
+            # Streamed responses hold their connection until read or closed, so
+            # every branch that does not read the body closes it
+            if response.status_code == 200:
+                # Stream the body in chunks; bodies are kept as received (no re-encoding)
+                body = AssetBody.from_response(response)
+                if body is not None:
+                    print(f"Downloaded {url} ({body.size} bytes, type: {body.content_type})")
+                    request_headers = response.request.headers
+                    body.credentialed = 'Cookie' in request_headers or 'Authorization' in request_headers
+                    if asset_cache:
+                        asset_cache.store(request_url, body, response.headers)
+                if cache_entry and stats:
+                    stats.incr('cache_misses')
+                return body
+            elif response.status_code == 304 and cache_entry:
+                # Cached copy is still valid
+                response.close()
+                asset_cache.refresh(cache_entry, response.headers)
+                if stats:
+                    stats.incr('cache_revalidated')
+                    stats.incr('cache_bytes_saved', cache_entry['size'])
+                return asset_cache.body(cache_entry, url)
+            elif response.status_code in (404, 410):
+                print(f"Resource not found ({response.status_code}): {url}")
+                response.close()
+                negative_cache.add(request_url, response.status_code)
+                return None
+            elif response.status_code == 403:
+                print(f"Access forbidden (403): {url}")
+                response.close()
+                # Try with a different user agent on the next retry
+                headers['User-Agent'] = random.choice(USER_AGENTS)
+                retry_count += 1
+                continue
+            elif response.status_code in (429, 503):
+                print(f"Rate limited ({response.status_code}): {url}")
+                response.close()
+                # Slow the host down and respect its Retry-After before the next attempt
+                host_rate_limiter.record_backoff(host, parse_retry_after(response.headers.get('Retry-After')))
+                retry_count += 1
+                continue
+            elif response.status_code >= 500:
+                print(f"Server error ({response.status_code}): {url}")
+                response.close()
+                host_rate_limiter.record_backoff(host)
+                retry_count += 1
+                continue
+            else:
+                print(f"HTTP error ({response.status_code}): {url}")
+                response.close()
+                return None
+                
+        except requests.exceptions.Timeout:
+            print(f"Timeout error downloading {url}")
+            host_circuit_breaker.record_failure(host)
+            host_rate_limiter.record_backoff(host)
+            retry_count += 1
+            continue
+        except requests.exceptions.ConnectionError:
+            print(f"Connection error downloading {url}")
+            host_circuit_breaker.record_failure(host)
+            host_rate_limiter.record_backoff(host)
+            retry_count += 1
+            continue
+        except requests.exceptions.TooManyRedirects:
+            print(f"Too many redirects for {url}")
+            return None
+        except Exception as e:
+            print(f"Error downloading {url}: {str(e)}")
+            return None
+    
+    if retry_count == max_retries:
+        print(f"Max retries reached for {url}")
+    
+    return None
+
+# URL rules for get_asset_type(): the file extension decides when there is
+# one, otherwise the first matching hint wins
+ASSET_EXTENSION_TYPES = {extension: asset_type for asset_type, extensions in (
+    ('css', ('css', 'scss', 'less', 'sass')),
+    ('js', ('js', 'jsx', 'mjs', 'ts', 'tsx', 'cjs')),
+    ('img', ('png', 'jpg', 'jpeg', 'gif', 'svg', 'webp', 'avif', 'bmp', 'ico')),
+    ('fonts', ('woff', 'woff2', 'ttf', 'otf', 'eot')),
+    ('videos', ('mp4', 'webm', 'ogg', 'avi', 'mov', 'flv')),
+    ('audio', ('mp3', 'wav', 'aac')),
+    ('favicons', ('icon',)),
+) for extension in extensions}
+
+ASSET_URL_HINTS = [(asset_type, re.compile(pattern)) for asset_type, pattern in (
+    # Framework-specific patterns
+    ('css', r'_next/static.*(?:\.css|styles)'),
+    ('js', r'_next/static|chunk\.|webpack|angular.*\.js'),
+    ('css', r'globals?\.css|tailwind|fonts\.googleapis\.com|styles.*\.css'),
+    ('js', r'bundle\.js|main\.js|app\.js|polyfill|runtime|vendor|image[-.]config'),
+    ('img', r'/images/|/img/'),
+    ('fonts', r'/fonts/|font-awesome'),
+    ('favicons', r'favicon'),
+    # Special API endpoints
+    ('js', r'graphql|api\.'),
+    # URL structure
+    ('css', r'/css/|/static/.*style'),
+    ('js', r'/js/|/scripts/'),
+    # Well-known CDNs
+    ('js', r'(?:cdn\.jsdelivr\.net|unpkg\.com|cdnjs\.cloudflare\.com).*(?:react|angular|vue|jquery)'),
+    ('css', r'(?:cdn\.jsdelivr\.net|unpkg\.com|cdnjs\.cloudflare\.com).*(?:bootstrap|tailwind|material|font)'),
+)]
+
+def get_asset_type(url):
+    """Determine the type of asset from the URL"""
+    # Handle empty or None URLs
+    if not url:
+        return 'other'
+    
+    url_lower = url.lower()
+    path = urlparse(url_lower).path
+    extension = path.rsplit('.', 1)[-1] if '.' in path.rsplit('/', 1)[-1] else ''
+    asset_type = ASSET_EXTENSION_TYPES.get(extension)
+    if asset_type:
+        return asset_type
+    
+    for asset_type, pattern in ASSET_URL_HINTS:
+        if pattern.search(url_lower):
+            return asset_type
+    
+    return 'other'
+
+# get_asset_type() names mapped to the buckets of the assets dict / archive
+ASSET_TYPE_BUCKETS = {
+    'css': 'css',
+    'js': 'js',
+    'img': 'images',
+    'favicons': 'images',
+    'fonts': 'fonts',
+    'videos': 'other',
+    'audio': 'other',
+    'other': 'other'
+}
+
+# Magic numbers of common asset formats, checked before libmagic
+MAGIC_SIGNATURES = [
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (8, b'WEBP', 'image/webp'),
+    (4, b'ftypavif', 'image/avif'),
+    (4, b'ftypavis', 'image/avif'),
+    (0, b'\x00\x00\x01\x00', 'image/x-icon'),
+    (0, b'wOFF', 'font/woff'),
+    (0, b'wOF2', 'font/woff2'),
+    (0, b'OTTO', 'font/otf'),
+    (0, b'\x00\x01\x00\x00\x00', 'font/ttf'),
+    (8, b'WAVE', 'audio/wav'),
+    (0, b'ID3', 'audio/mpeg'),
+    (0, b'OggS', 'audio/ogg'),
+    (0, b'\x1a\x45\xdf\xa3', 'video/webm'),
+    (4, b'ftyp', 'video/mp4'),
+    (0, b'%PDF-', 'application/pdf'),
+    (0, b'\x00asm', 'application/wasm'),
+]
+
+SVG_SIGNATURE = re.compile(rb'^\s*(?:<\?xml[^>]*>\s*)?(?:<!--.*?-->\s*)*(?:<!DOCTYPE svg[^>]*>\s*)?<svg[\s>]', re.DOTALL | re.IGNORECASE)
+
+# Number of leading bytes used for content sniffing
+SNIFF_BYTES = 2048
+
+def sniff_mime_type(head):
+    """Guess a MIME type from the leading bytes of a body, or None if unknown"""
+    if not head:
+        return None
+    for offset, signature, mime_type in MAGIC_SIGNATURES:
+        if head.startswith(signature, offset):
+            return mime_type
+    if SVG_SIGNATURE.match(head):
+        return 'image/svg+xml'
+    if MAGIC_AVAILABLE:
+        try:
+            mime_type = magic.from_buffer(head, mime=True)
+        except Exception:
+            return None
+        # libmagic reports CSS and JavaScript as plain text; that says nothing
+        if mime_type and mime_type not in ('application/octet-stream', 'text/plain', 'application/x-empty'):
+            return mime_type
+    return None
+
+def mime_type_bucket(mime_type):
+    """Bucket for a MIME type, or None when the type does not tell (octet-stream, text/plain, ...)"""
+    if not mime_type:
+        return None
+    mime_type = mime_type.split(';', 1)[0].strip().lower()
+    if mime_type == 'text/css':
+        return 'css'
+    if 'javascript' in mime_type or 'ecmascript' in mime_type:
+        return 'js'
+    if mime_type.startswith('image/'):
+        return 'images'
+    if mime_type.startswith('font/') or mime_type in (
+        'application/font-woff', 'application/font-woff2', 'application/x-font-woff',
+        'application/x-font-ttf', 'application/x-font-otf', 'application/vnd.ms-fontobject'
+    ):
+        return 'fonts'
+    if mime_type.startswith(('video/', 'audio/')) or mime_type in ('application/pdf', 'application/wasm'):
+        return 'other'
+    return None
+
+class AssetClassifier:
+    """
+    Decide which bucket (css, js, images, fonts, other) an asset belongs to.
+
+    The bytes win over the server, and the server wins over the URL: magic
+    numbers first, then the response Content-Type, then get_asset_type().
+    Results are memoized per canonical URL; an answer based on content
+    replaces one that was guessed from the URL alone.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # canonical URL -> (bucket, mime type, from content)
+
+    def classify(self, url, content_type=None, head=None):
+        """Return (bucket, mime_type) for a URL and, if known, its response"""
+        key = canonicalize_url(url) if url else None
+        with self._lock:
+            cached = self._entries.get(key) if key else None
+            if cached is not None and (cached[2] or (content_type is None and head is None)):
+                self._entries.move_to_end(key)
+                return cached[0], cached[1]
+        
+        mime_type = sniff_mime_type(head)
+        bucket = mime_type_bucket(mime_type)
+        if bucket is None:
+            declared = (content_type or '').split(';', 1)[0].strip().lower() or None
+            bucket = mime_type_bucket(declared)
+            if bucket is not None:
+                mime_type = declared
+        from_content = bucket is not None
+        if bucket is None:
+            bucket = ASSET_TYPE_BUCKETS[get_asset_type(url)]
+        
+        if key:
+            with self._lock:
+                self._entries[key] = (bucket, mime_type, from_content)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return bucket, mime_type
+
+    def classify_body(self, url, body):
+        """Classify a downloaded AssetBody (or raw bytes)"""
+        if isinstance(body, AssetBody):
+            return self.classify(url, body.content_type or '', body.head())
+        if isinstance(body, bytes):
+            return self.classify(url, '', body[:SNIFF_BYTES])
+        return self.classify(url)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+# Memoized classifications shared by every extraction
+asset_classifier = AssetClassifier()
+
+# Elements whose <source> children are media files rather than images
+MEDIA_SOURCE_PARENTS = ('video', 'audio')
+
+# Tags that are component candidates even without a class, id or role
+COMPONENT_TAGS = {'nav', 'header', 'footer', 'form', 'section', 'article'}
+
+def available_parsers():
+    """Names of the BeautifulSoup parser backends installed in this environment"""
+    parsers = ['html.parser']
+    if LXML_AVAILABLE:
+        parsers.append('lxml')
+    if HTML5LIB_AVAILABLE:
+        parsers.append('html5lib')
+    return parsers
+
+def resolve_parser(parser=None):
+    """Return the requested parser backend, falling back to html.parser if it is not installed"""
+    parser = parser or HTML_PARSER
+    if parser in available_parsers():
+        return parser
+    print(f"HTML parser '{parser}' is not available, using html.parser")
+    return 'html.parser'
+
+class ParsedDocument:
+    """
+    An HTML page parsed once and shared by every extraction stage.
+
+    scan() walks the tree a single time and groups the elements each stage
+    needs (asset references, metadata tags, component candidates), so
+    extract_assets(), extract_metadata(), extract_component_structure() and
+    fix_relative_urls() never re-parse or re-walk the document.
+    """
+
+    def __init__(self, html_content, base_url, soup=None, parser=None):
+        self.html = html_content
+        self.base_url = base_url
+        if soup is None:
+            self.parser = resolve_parser(parser)
+            soup = BeautifulSoup(html_content, self.parser)
+        else:
+            self.parser = None
+        self.soup = soup
+        self._scan = None
+
+    def scan(self):
+        """Return the element index built by scan_document(), computing it on first use"""
+        if self._scan is None:
+            self._scan = scan_document(self.soup)
+        return self._scan
+
+    def __str__(self):
+        return str(self.soup)
+
+def parse_document(source, base_url='', parser=None):
+    """
+    Return a ParsedDocument for an HTML string, a BeautifulSoup tree or an existing document.
+    
+    `parser` selects the BeautifulSoup backend for strings (defaults to HTML_PARSER).
+    """
+    if isinstance(source, ParsedDocument):
+        return source
+    if isinstance(source, BeautifulSoup):
+        return ParsedDocument(None, base_url, soup=source)
+    return ParsedDocument(source, base_url, parser=parser)
+
+# Digit runs in class tokens ("col-6", "item-42") are ignored by structural hashing
+CLASS_SHAPE_DIGITS = re.compile(r'\d+')
+
+def structure_hash(element, child_hashes):
+    """
+    Merkle-style hash of an element's structure: tag name, class-token
+    shapes and the hashes of its child elements, in order. Text and other
+    attributes are ignored, so repeated cards or list items hash equally.
+    """
+    class_list = element.attrs.get('class') or ()
+    if isinstance(class_list, str):
+        class_list = class_list.split()
+    shape = tuple(sorted({CLASS_SHAPE_DIGITS.sub('#', token.lower()) for token in class_list}))
+    return hash((element.name, shape, tuple(child_hashes)))
+
+def scan_document(soup):
+    """Collect, in document order, every element the extraction stages look at in one traversal"""
+    scan = {key: [] for key in (
+        'stylesheets', 'font_links', 'styles', 'scripts', 'json_ld', 'images', 'media',
+        'links', 'anchors', 'meta', 'components'
+    )}
+    scan['title'] = None
+    scan['html'] = None
+    # Per element, keyed by id(element): number of descendant elements,
+    # structural hash (see structure_hash()) and position in document order
+    subtree_sizes = {}
+    structure_hashes = {}
+    positions = {}
+    scan['subtree_sizes'] = subtree_sizes
+    scan['structure_hashes'] = structure_hashes
+    scan['positions'] = positions
+    
+    # Elements arrive in document order; the stack holds the open ancestors,
+    # and an element's size and hash are final once it is popped (post-order)
+    stack = [soup]
+    sizes = [0]
+    child_hashes = [[]]
+    
+    def close_top():
+        node = stack.pop()
+        size = sizes.pop()
+        node_hash = structure_hash(node, child_hashes.pop())
+        subtree_sizes[id(node)] = size
+        structure_hashes[id(node)] = node_hash
+        sizes[-1] += size + 1
+        child_hashes[-1].append(node_hash)
+    
+    for position, element in enumerate(soup.find_all(True)):
+        parent = element.parent
+        while stack[-1] is not parent and len(stack) > 1:
+            close_top()
+        stack.append(element)
+        sizes.append(0)
+        child_hashes.append([])
+        positions[id(element)] = position
+        
+        name = element.name
+        attrs = element.attrs
+        if name == 'link':
+            scan['links'].append(element)
+            rel = attrs.get('rel') or []
+            if isinstance(rel, str):
+                rel = rel.split()
+            if 'stylesheet' in rel:
+                scan['stylesheets'].append(element)
+            if 'font' in rel:
+                scan['font_links'].append(element)
+        elif name == 'script':
+            scan['scripts'].append(element)
+            if attrs.get('type') == 'application/ld+json':
+                scan['json_ld'].append(element)
+        elif name == 'style':
+            scan['styles'].append(element)
+        elif name == 'img':
+            scan['images'].append(element)
+        elif name == 'source':
+            # A <source> is a media file inside <video>/<audio> and an image anywhere else (<picture>).
+            # lxml does not treat <source> as void and nests siblings, so look past the parent
+            container = element.find_parent(('video', 'audio', 'picture'))
+            if container is not None and container.name in MEDIA_SOURCE_PARENTS:
+                scan['media'].append(element)
+            else:
+                scan['images'].append(element)
+        elif name in ('video', 'audio'):
+            scan['media'].append(element)
+        elif name == 'a':
+            if 'href' in attrs:
+                scan['anchors'].append(element)
+        elif name == 'meta':
+            scan['meta'].append(element)
+        elif name == 'title':
+            if scan['title'] is None:
+                scan['title'] = element
+        elif name == 'html':
+            if scan['html'] is None:
+                scan['html'] = element
+        
+        if 'class' in attrs or 'role' in attrs or 'id' in attrs or name in COMPONENT_TAGS:
+            scan['components'].append(element)
+    
+    while len(stack) > 1:
+        close_top()
+    subtree_sizes[id(soup)] = sizes[0]
+    
+    return scan
+
+def extract_metadata(document, base_url=None):
+    """Extract metadata from a parsed document (or a BeautifulSoup tree / HTML string)"""
+    document = parse_document(document, base_url or '')
+    base_url = base_url or document.base_url
+    scan = document.scan()
+    metadata = {
+        'title': '',
+        'description': '',
+        'keywords': '',
+        'og_tags': {},
+        'twitter_cards': {},
+        'canonical': '',
+        'language': '',
+        'favicon': '',
+        'structured_data': []
+    }
+    
+    # Extract title
+    title_tag = scan['title']
+    if title_tag and title_tag.string:
+        metadata['title'] = title_tag.string.strip()
+    
+    # Extract meta tags
+    meta_tags = scan['meta']
+    for tag in meta_tags:
+        # Description
+        if tag.get('name') == 'description' and tag.get('content'):
+            metadata['description'] = tag.get('content').strip()
+        
+        # Keywords
+        elif tag.get('name') == 'keywords' and tag.get('content'):
+            metadata['keywords'] = tag.get('content').strip()
+        
+        # OpenGraph tags
+        elif tag.get('property') and tag.get('property').startswith('og:') and tag.get('content'):
+            prop = tag.get('property')[3:]  # Remove 'og:' prefix
+            metadata['og_tags'][prop] = tag.get('content').strip()
+        
+        # Twitter card tags
+        elif tag.get('name') and tag.get('name').startswith('twitter:') and tag.get('content'):
             prop = tag.get('name')[8:]  # Remove 'twitter:' prefix
             metadata['twitter_cards'][prop] = tag.get('content').strip()
     
+    def link_with_rel(value):
+        for link in scan['links']:
+            rel = link.get('rel') or []
+            if isinstance(rel, str):
+                rel = rel.split()
+            if value in rel:
+                return link
+        return None
+    
     # Extract canonical URL
-    canonical_tag = soup.find('link', {'rel': 'canonical'})
+    canonical_tag = link_with_rel('canonical')
     if canonical_tag and canonical_tag.get('href'):
         canonical_url = canonical_tag.get('href')
         if not canonical_url.startswith(('http://', 'https://')):
@@ -388,12 +2311,12 @@ def extract_metadata(soup, base_url):
         metadata['canonical'] = canonical_url
     
     # Extract language
-    html_tag = soup.find('html')
+    html_tag = scan['html']
     if html_tag and html_tag.get('lang'):
         metadata['language'] = html_tag.get('lang')
     
     # Extract favicon
-    favicon_tag = soup.find('link', {'rel': 'icon'}) or soup.find('link', {'rel': 'shortcut icon'})
+    favicon_tag = link_with_rel('icon')
     if favicon_tag and favicon_tag.get('href'):
         favicon_url = favicon_tag.get('href')
         if not favicon_url.startswith(('http://', 'https://')):
@@ -401,7 +2324,7 @@ def extract_metadata(soup, base_url):
         metadata['favicon'] = favicon_url
     
     # Extract structured data (JSON-LD)
-    script_tags = soup.find_all('script', {'type': 'application/ld+json'})
+    script_tags = scan['json_ld']
     for tag in script_tags:
         if tag.string:
             try:
@@ -410,518 +2333,1936 @@ def extract_metadata(soup, base_url):
             except json.JSONDecodeError:
                 pass
     
-    return metadata
+    return metadata
+
+# Component classification rules. get_component_type() reports the first rule
+# that matches; extract_component_structure() files an element under every
+# rule it matches (a product card is both a card and a store component).
+# An element matches a rule if its tag, role, id or class string does, except
+# for rules with 'tag_and_class', which need both the tag and a class token.
+COMPONENT_RULES = [
+    ('navigation', {'tags': {'nav'}, 'roles': {'navigation'}, 'ids': {'nav', 'navigation', 'menu'}, 'classes': ('nav', 'menu')}),
+    ('header', {'tags': {'header'}, 'roles': {'banner'}, 'ids': {'header'}, 'classes': ('header',)}),
+    ('footer', {'tags': {'footer'}, 'roles': {'contentinfo'}, 'ids': {'footer'}, 'classes': ('footer',)}),
+    ('hero', {'ids': {'hero', 'banner', 'jumbotron', 'showcase'}, 'classes': ('hero', 'banner', 'jumbotron', 'showcase')}),
+    ('card', {'ids': {'card', 'tile'}, 'classes': ('card', 'tile')}),
+    ('form', {'tags': {'form'}, 'roles': {'form'}, 'ids': {'form'}, 'classes': ('form',)}),
+    ('cta', {'ids': {'cta', 'call-to-action'}, 'classes': ('cta', 'call-to-action')}),
+    ('sidebar', {'ids': {'sidebar', 'side-bar'}, 'classes': ('sidebar', 'side-bar')}),
+    ('modal', {'roles': {'dialog'}, 'ids': {'modal', 'dialog', 'popup'}, 'classes': ('modal', 'dialog', 'popup')}),
+    # Only substantial sections (more than 3 descendant elements) count
+    ('section', {'tags': {'section'}, 'roles': {'region'}, 'min_descendants': 4}),
+    ('mobile', {'classes': ('mobile', 'smartphone')}),
+    ('cart', {'ids': {'cart', 'basket', 'shopping-cart'}, 'classes': ('cart', 'basket')}),
+    ('store', {'classes': ('product', 'store', 'shop', 'pricing')}),
+    ('container', {'tags': {'div', 'section', 'article'}, 'classes': ('container', 'wrapper', 'content'), 'tag_and_class': True}),
+]
+
+def compile_component_rules(rules):
+    """Precompile the class substrings of each rule into a single regex"""
+    compiled = []
+    for component_type, rule in rules:
+        rule = dict(rule)
+        classes = rule.pop('classes', ())
+        rule['class_pattern'] = re.compile('|'.join(re.escape(c) for c in classes)) if classes else None
+        compiled.append((component_type, rule))
+    return compiled
+
+COMPILED_COMPONENT_RULES = compile_component_rules(COMPONENT_RULES)
+
+# Maximum number of components of each type kept by extract_component_structure()
+COMPONENT_LIMITS = {
+    'navigation': 5,
+    'header': 2,
+    'footer': 2,
+    'hero': 3,
+    'card': 5,
+    'form': 3,
+    'cta': 3,
+    'sidebar': 2,
+    'modal': 3,
+    'section': 5,
+    'store': 5,
+    'mobile': 3,
+    'cart': 2
+}
+
+def classify_component(element, descendants=None):
+    """Return the first component type of an element using COMPONENT_RULES, or 'other'"""
+    types = component_types(element, descendants, first_only=True)
+    return types[0] if types else 'other'
+
+def component_types(element, descendants=None, first_only=False):
+    """
+    Return every component type in COMPONENT_RULES that an element matches, in rule order.
+    
+    `descendants` is the element's descendant count if already known (for
+    example from ParsedDocument.scan()); otherwise it is counted on demand.
+    """
+    matches = []
+    name = element.name
+    attrs = element.attrs
+    class_list = attrs.get('class') or []
+    if isinstance(class_list, str):
+        class_list = [class_list]
+    class_str = ' '.join(class_list).lower()
+    element_id = (attrs.get('id') or '').lower()
+    role = (attrs.get('role') or '').lower()
+    
+    for component_type, rule in COMPILED_COMPONENT_RULES:
+        tag_match = name in rule.get('tags', ())
+        class_match = bool(class_str) and rule['class_pattern'] is not None and rule['class_pattern'].search(class_str) is not None
+        if rule.get('tag_and_class'):
+            matched = tag_match and class_match
+        else:
+            matched = tag_match or class_match or role in rule.get('roles', ()) or element_id in rule.get('ids', ())
+        if not matched:
+            continue
+        min_descendants = rule.get('min_descendants')
+        if min_descendants:
+            if descendants is None:
+                descendants = len(element.find_all())
+            if descendants < min_descendants:
+                continue
+        matches.append(component_type)
+        if first_only:
+            break
+    return matches
+
+def get_component_type(element):
+    """Determine the type of UI component based on element attributes and classes"""
+    if not element:
+        return None
+    return classify_component(element)
+
+# Component types that are usually repeated; these are grouped by structure
+REPEATED_COMPONENT_TYPES = {'card', 'store'}
+
+def extract_component_structure(document):
+    """
+    Extract UI components from a parsed document (or a BeautifulSoup tree / HTML string).
+    
+    Every candidate element is classified once with component_types(), in
+    a single pass over the candidates collected by the document scan, and
+    kept under each type it matches up to the per-type limit in
+    COMPONENT_LIMITS.
+    
+    Repeated types (cards, product tiles) are grouped by structure hash
+    instead of sampled: each entry is one representative with the number
+    of elements sharing its structure, most frequent first. Elements nested
+    inside another element of the same repeated type are not counted.
+    """
+    if not document:
+        return {}
+    document = parse_document(document)
+    scan = document.scan()
+    subtree_sizes = scan['subtree_sizes']
+    structure_hashes = scan['structure_hashes']
+    positions = scan['positions']
+    
+    components = {component_type: [] for component_type in COMPONENT_LIMITS}
+    groups = {component_type: {} for component_type in REPEATED_COMPONENT_TYPES}
+    # Last document position covered by an element of each repeated type
+    covered_until = {component_type: -1 for component_type in REPEATED_COMPONENT_TYPES}
+    
+    for element in scan['components']:
+        key = id(element)
+        descendants = subtree_sizes.get(key)
+        html_string = None
+        
+        for component_type in component_types(element, descendants):
+            if component_type in REPEATED_COMPONENT_TYPES:
+                position = positions[key]
+                if position <= covered_until[component_type]:
+                    continue
+                covered_until[component_type] = position + (descendants or 0)
+                group = groups[component_type].get(structure_hashes[key])
+                if group is None:
+                    groups[component_type][structure_hashes[key]] = {'element': element, 'count': 1}
+                else:
+                    group['count'] += 1
+                continue
+            
+            found = components.get(component_type)
+            if found is None or len(found) >= COMPONENT_LIMITS[component_type]:
+                continue
+            if html_string is None:
+                html_string = str(element)
+            found.append({
+                'html': html_string
+            })
+    
+    for component_type, type_groups in groups.items():
+        # dicts keep first-seen order, so ties stay in document order
+        ranked = sorted(type_groups.values(), key=lambda g: -g['count'])
+        for group in ranked[:COMPONENT_LIMITS[component_type]]:
+            components[component_type].append({
+                'html': str(group['element']),
+                'count': group['count']
+            })
+    
+    # Remove empty component types
+    return {k: v for k, v in components.items() if v}
+
+def find_repeated_structures(document, min_repeats=3, min_descendants=2, limit=20):
+    """
+    Summarize structures that repeat across the page (list items, tiles, rows).
+    
+    Uses the structure hashes from the document scan, so it costs one pass
+    over the elements. Only outermost repeats are reported: children of a
+    repeated element are skipped.
+    
+    Returns:
+        list: Dicts with tag, class, descendants and count, most frequent first
+    """
+    document = parse_document(document)
+    scan = document.scan()
+    subtree_sizes = scan['subtree_sizes']
+    structure_hashes = scan['structure_hashes']
+    
+    counts = {}
+    first_seen = {}
+    for element in document.soup.find_all(True):
+        key = id(element)
+        if subtree_sizes[key] < min_descendants:
+            continue
+        structure = structure_hashes[key]
+        counts[structure] = counts.get(structure, 0) + 1
+        first_seen.setdefault(structure, element)
+    
+    repeated = []
+    covered = set()
+    for structure, element in first_seen.items():
+        if counts[structure] < min_repeats:
+            continue
+        # Skip structures that only occur inside a larger repeated structure
+        if any(structure_hashes.get(id(parent)) in covered for parent in element.parents):
+            continue
+        covered.add(structure)
+        class_list = element.get('class') or []
+        repeated.append({
+            'tag': element.name,
+            'class': ' '.join(class_list) if isinstance(class_list, list) else class_list,
+            'descendants': subtree_sizes[id(element)],
+            'count': counts[structure]
+        })
+    repeated.sort(key=lambda r: -r['count'])
+    return repeated[:limit]
+
+def build_synthetic_page(element_count):
+    """Generate a page with roughly `element_count` elements in common component patterns"""
+    patterns = [
+        ('<div class="card product-tile"><img src="/img/{i}.png"><h3>Item {i}</h3><p>Price</p></div>', 4),
+        ('<section><h2>Section {i}</h2><p>a</p><p>b</p><p>c</p></section>', 5),
+        ('<ul class="menu-list"><li><a href="/{i}">Link</a></li></ul>', 3),
+        ('<div class="wrapper"><span>{i}</span><em>x</em></div>', 3),
+    ]
+    parts = ['<html><head><title>Synthetic</title></head><body><nav class="navbar"><a href="/">Home</a></nav>']
+    count = 6
+    i = 0
+    while count < element_count:
+        pattern, size = patterns[i % len(patterns)]
+        parts.append(pattern.format(i=i))
+        count += size
+        i += 1
+    parts.append('<footer class="footer">Footer</footer></body></html>')
+    return ''.join(parts)
+
+def benchmark_components(element_counts=(5000, 10000, 20000), paths=None, parser=None):
+    """
+    Time extract_component_structure() against the previous strategy of one
+    full-tree find_all() per component rule.
+    
+    Returns:
+        list: One result dict per page (synthetic sizes first, then files)
+    """
+    pages = [(f"synthetic-{n}", build_synthetic_page(n)) for n in element_counts]
+    for path in paths or []:
+        with open(path, 'rb') as fh:
+            pages.append((os.path.basename(path), fh.read().decode('utf-8', errors='replace')))
+    
+    results = []
+    for label, html_text in pages:
+        document = ParsedDocument(html_text, 'http://localhost/', parser=parser)
+        soup = document.soup
+        
+        start = time.perf_counter()
+        document.scan()
+        scan_ms = (time.perf_counter() - start) * 1000
+        
+        start = time.perf_counter()
+        extract_component_structure(document)
+        classify_ms = (time.perf_counter() - start) * 1000
+        
+        start = time.perf_counter()
+        for _, rule in COMPILED_COMPONENT_RULES:
+            if rule['class_pattern'] is not None:
+                soup.find_all(class_=rule['class_pattern'])
+            if rule.get('tags'):
+                soup.find_all(list(rule['tags']))
+            if rule.get('roles'):
+                soup.find_all(role=list(rule['roles']))
+        walks_ms = (time.perf_counter() - start) * 1000
+        
+        results.append({
+            'page': label,
+            'elements': len(document.scan()['subtree_sizes']) - 1,
+            'scan_ms': round(scan_ms, 1),
+            'classify_ms': round(classify_ms, 1),
+            'per_rule_walks_ms': round(walks_ms, 1),
+            'speedup': round(walks_ms / (scan_ms + classify_ms), 1) if scan_ms + classify_ms else None
+        })
+    return results
+
+def extract_inline_styles(soup):
+    """Extract all inline styles from the HTML"""
+    inline_styles = {}
+    elements_with_style = soup.select('[style]')
+    
+    for i, element in enumerate(elements_with_style):
+        style_content = element.get('style')
+        if style_content:
+            class_name = f'extracted-inline-style-{i}'
+            inline_styles[class_name] = style_content
+            # Add the class to the element
+            element['class'] = element.get('class', []) + [class_name]
+            # Remove the inline style
+            del element['style']
+    
+    return inline_styles
+
+def extract_inline_javascript(soup):
+    """Extract inline JavaScript from HTML content"""
+    inline_js = []
+    # Find all script tags without src attribute (inline scripts)
+    for script in soup.find_all('script'):
+        if not script.get('src') and script.string:
+            inline_js.append(script.string.strip())
+    
+    if inline_js:
+        return '\n\n/* --- INLINE SCRIPTS --- */\n\n'.join(inline_js)
+    return ""
+
+# CSS reference scanner: one regex per tokenizer state, applied with search()
+# so comments and strings are skipped without a per-character Python loop
+CSS_TOKEN = re.compile(r'''
+    (?P<comment>/\*.*?\*/)
+  | (?P<open_comment>/\*)
+  | (?P<url>url\(\s*(?:"(?P<url_dq>(?:\\.|[^"\\])*)"|'(?P<url_sq>(?:\\.|[^'\\])*)'|(?P<url_raw>[^)"'\s]*))\s*\))
+  | (?P<open_url>url\()
+  | (?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+  | (?P<open_string>["'])
+  | (?P<import>@import\b)
+  | (?P<image_set>(?:-webkit-)?image-set\()
+  | (?P<end_statement>;)
+''', re.IGNORECASE | re.DOTALL | re.VERBOSE)
+
+# Inside image-set() parentheses also matter, to find where it ends
+CSS_IMAGE_SET_TOKEN = re.compile(CSS_TOKEN.pattern.replace(
+    r'(?P<end_statement>;)', r'(?P<end_statement>;) | (?P<open_paren>\() | (?P<close_paren>\))'
+), re.IGNORECASE | re.DOTALL | re.VERBOSE)
+
+CSS_KEYWORD_TAIL = 16
+
+CSS_ESCAPE = re.compile(r'\\([0-9a-fA-F]{1,6}\s?|.)', re.DOTALL)
+
+def _css_unescape(value):
+    def replace(match):
+        escaped = match.group(1)
+        if escaped[0] in '0123456789abcdefABCDEF' and len(escaped.strip()) <= 6:
+            try:
+                return chr(int(escaped.strip(), 16))
+            except ValueError:
+                return ''
+        return '' if escaped == '\n' else escaped
+    return CSS_ESCAPE.sub(replace, value) if '\\' in value else value
+
+def scan_css_references(chunks, max_pending=8 * 1024 * 1024):
+    """
+    Yield (kind, url) for every url(), image-set() and @import reference in CSS.
+    
+    `chunks` is a string or an iterable of string chunks, so large
+    stylesheets can be scanned as they are read. A token cut at a chunk
+    boundary is carried over to the next chunk. `kind` is 'import' for
+    @import targets and 'url' otherwise; data: URIs and fragment-only
+    references are skipped.
+    """
+    if isinstance(chunks, str):
+        chunks = [chunks]
+    
+    pending = ''
+    in_import = False
+    image_set_depth = 0
+    chunks = iter(chunks)
+    final = False
+    
+    while not final:
+        chunk = next(chunks, None)
+        if chunk is None:
+            final = True
+        else:
+            pending += chunk
+            if len(pending) < ASSET_CHUNK_SIZE and len(pending) < max_pending:
+                continue
+        
+        position = 0
+        carry_from = None
+        while True:
+            pattern = CSS_IMAGE_SET_TOKEN if image_set_depth else CSS_TOKEN
+            match = pattern.search(pending, position)
+            if not match:
+                break
+            kind = match.lastgroup
+            if kind in ('open_comment', 'open_url', 'open_string'):
+                # Unterminated token: wait for more input unless this is the end
+                if not final and len(pending) - match.start() < max_pending:
+                    carry_from = match.start()
+                    break
+                position = match.end()
+                continue
+            position = match.end()
+            
+            value = None
+            if kind == 'url':
+                value = match.group('url_dq')
+                if value is None:
+                    value = match.group('url_sq')
+                if value is None:
+                    value = match.group('url_raw')
+            elif kind == 'string' and (in_import or image_set_depth == 1):
+                value = match.group('string')[1:-1]
+            elif kind == 'import':
+                in_import = True
+            elif kind == 'image_set':
+                image_set_depth = 1
+            elif kind == 'open_paren':
+                image_set_depth += 1
+            elif kind == 'close_paren':
+                image_set_depth -= 1
+            elif kind == 'end_statement':
+                in_import = False
+                image_set_depth = 0
+            
+            if value is not None:
+                value = _css_unescape(value).strip()
+                if value and not value.startswith(('data:', '#', 'about:', 'javascript:')):
+                    yield ('import' if in_import else 'url'), value
+                if in_import:
+                    in_import = False
+        
+        if carry_from is None and not final:
+            # Keep a short tail so a keyword split across chunks ("@imp" + "ort")
+            # is still recognised
+            carry_from = max(position, len(pending) - CSS_KEYWORD_TAIL)
+        pending = pending[carry_from:] if carry_from is not None else ''
 
-def get_component_type(element):
-    """Determine the type of UI component based on element attributes and classes"""
-    if not element:
-        return None
+def css_reference_type(kind, url):
+    """Bucket in the assets dict for a reference found in a stylesheet"""
+    if kind == 'import':
+        return 'css'
+    asset_type, _ = asset_classifier.classify(url)
+    if asset_type in ('fonts', 'css'):
+        return asset_type
+    return 'images'
+
+def decode_css_chunks(body, encoding=None):
+    """Decode an AssetBody (or text) into text chunks for scan_css_references()"""
+    if isinstance(body, str):
+        yield body
+        return
+    try:
+        decoder = codecs.getincrementaldecoder(encoding or getattr(body, 'encoding', None) or 'utf-8')(errors='replace')
+    except LookupError:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    chunks = body.iter_chunks() if isinstance(body, AssetBody) else [body]
+    for chunk in chunks:
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+def build_synthetic_stylesheet(rule_count):
+    """Generate a stylesheet with `rule_count` rules mixing url(), image-set() and comments"""
+    parts = ['@import "base.css";\n@import url(theme.css) screen;\n']
+    for i in range(rule_count):
+        if i % 4 == 0:
+            parts.append(f'.hero-{i} {{ background: url("/img/hero-{i}.jpg") no-repeat; /* url(skip-{i}.png) */ }}\n')
+        elif i % 4 == 1:
+            parts.append(f'.icon-{i} {{ background-image: image-set(url(icons/{i}.png) 1x, url(icons/{i}@2x.png) 2x); }}\n')
+        elif i % 4 == 2:
+            parts.append(f'@font-face {{ font-family: F{i}; src: url(fonts/f{i}.woff2) format("woff2"); }}\n')
+        else:
+            parts.append(f'.text-{i} {{ color: #333; margin: 0 auto; content: "{i}"; }}\n')
+    return ''.join(parts)
+
+def benchmark_css(rule_counts=(1000, 10000), paths=None, repeat=3):
+    """
+    Time scan_css_references() against a full cssutils parse plus getUrls().
+    
+    Returns:
+        list: One result dict per stylesheet (synthetic sizes first, then files)
+    """
+    sheets = [(f"synthetic-{n}", build_synthetic_stylesheet(n)) for n in rule_counts]
+    for path in paths or []:
+        with open(path, 'rb') as fh:
+            sheets.append((os.path.basename(path), fh.read().decode('utf-8', errors='replace')))
+    
+    results = []
+    for label, css_text in sheets:
+        timings = []
+        for _ in range(max(1, repeat)):
+            start = time.perf_counter()
+            scanned = list(scan_css_references(css_text))
+            timings.append(time.perf_counter() - start)
+        scan_ms = min(timings) * 1000
         
-    # Get tag name, classes, and ID
-    tag_name = element.name
-    class_list = element.get('class', [])
-    if class_list and not isinstance(class_list, list):
-        class_list = [class_list]
-    class_str = ' '.join(class_list).lower() if class_list else ''
-    element_id = element.get('id', '').lower()
+        start = time.perf_counter()
+        parsed = set(url for url in cssutils.getUrls(cssutils.parseString(css_text, validate=False))
+                     if not url.startswith(('data:', '#')))
+        cssutils_ms = (time.perf_counter() - start) * 1000
+        
+        found = set(url for _, url in scanned)
+        results.append({
+            'stylesheet': label,
+            'kb': round(len(css_text) / 1024, 1),
+            'scan_ms': round(scan_ms, 2),
+            'cssutils_ms': round(cssutils_ms, 2),
+            'speedup': round(cssutils_ms / scan_ms, 1) if scan_ms else None,
+            'references': len(found),
+            'missed': sorted(parsed - found),
+        })
+    return results
+
+def build_synthetic_members(count=200, size=200 * 1024):
+    """Generate JS-like members of `size` bytes with enough variety to compress realistically"""
+    rng = random.Random(0)
+    words = ['function', 'return', 'const', 'let', 'this', 'props', 'state', 'render', 'value', 'index',
+             'document', 'window', 'element', 'callback', 'promise', 'then', 'null', 'undefined']
+    members = []
+    for i in range(count):
+        parts = []
+        length = 0
+        while length < size:
+            line = f"{rng.choice(words)}_{rng.randrange(10000)}({rng.choice(words)}, {rng.randrange(1 << 20)});\n"
+            parts.append(line)
+            length += len(line)
+        members.append((f'assets/js/chunk_{i}.js', ''.join(parts)[:size].encode('utf-8')))
+    return members
+
+def benchmark_archive(worker_counts=None, count=200, size=200 * 1024, repeat=3):
+    """
+    Build the same archive with ZipArchiveWriter at several pool sizes.
     
-    # Get element role
-    role = element.get('role', '').lower()
+    Returns:
+        list: One result dict per worker count, with throughput in MB/s of
+        input and the speedup over the first worker count
+    """
+    worker_counts = worker_counts or sorted({1, 2, 4, os.cpu_count() or 1})
+    members = build_synthetic_members(count, size)
+    total_bytes = sum(len(data) for _, data in members)
+    results = []
+    baseline = None
+    for workers in worker_counts:
+        timings = []
+        for _ in range(max(1, repeat)):
+            output = BytesIO()
+            start = time.perf_counter()
+            with ZipArchiveWriter(output.write, workers=workers) as archive:
+                for name, data in members:
+                    archive.add(name, data, 'js', 'application/javascript')
+            timings.append(time.perf_counter() - start)
+        elapsed = min(timings)
+        baseline = baseline or elapsed
+        results.append({
+            'workers': workers,
+            'seconds': round(elapsed, 3),
+            'mb_per_s': round(total_bytes / elapsed / (1024 * 1024), 1),
+            'speedup': round(baseline / elapsed, 2),
+            'archive_bytes': len(output.getvalue())
+        })
+    return results
+
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same key into one.
+
+    The first caller runs the function; callers arriving while it is still
+    running wait for and share its result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Return (result, shared) where `shared` is True if another caller did the work"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+# In-flight asset downloads shared by every extraction in the process
+asset_fetches = SingleFlight()
+
+class AssetDownloader:
+    """
+    Concurrent download stage used by extract_assets().
+
+    Jobs are queued per host and handed to a thread pool owned by this
+    downloader (one per extraction), so at most `per_host_limit` requests
+    hit the same host at once while up to `max_workers` requests run in
+    total. Records are returned in the order
+    they were submitted, which keeps the `assets` dict identical to the
+    sequential implementation.
+
+    References that map to the same canonical URL share one record, whose
+    `original_paths` lists every path that pointed at it; the record keeps
+    and downloads the first URL submitted exactly as referenced (without its
+    fragment), never the canonical or normalized form. Identical
+    downloads running in other extractions are shared through `asset_fetches`
+    unless this extraction's session carries cookies.
+
+    Downloaded stylesheets are scanned for url(), image-set() and @import
+    references, which are submitted in turn (resolved against the
+    stylesheet's own URL) until `max_css_depth` levels of imports.
+
+    Bodies in `captured` (canonical URL -> AssetBody, recorded by the
+    browser) are used as they are; only the other URLs are downloaded.
+    """
+
+    def __init__(self, base_url, session_obj=None, headers=None, max_workers=None, per_host_limit=None, stats=None,
+                 max_css_depth=None, captured=None):
+        self.base_url = base_url
+        self.session_obj = session_obj
+        self.headers = headers
+        self.stats = stats
+        self.max_workers = max(1, max_workers or ASSET_DOWNLOAD_WORKERS)
+        self.per_host_limit = max(1, per_host_limit or ASSET_DOWNLOAD_PER_HOST)
+        self.max_css_depth = CSS_MAX_DEPTH if max_css_depth is None else max_css_depth
+        self.captured = captured or {}
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='asset-download')
+        self._lock = threading.Condition()
+        self._queues = OrderedDict()  # host -> records waiting for a free slot
+        self._active = {}  # host -> downloads currently running
+        self._running = 0
+        self._outstanding = 0
+        self._records = []
+        self._by_url = {}  # canonical URL -> record
+        self._completed = deque()  # (asset_type, record) finished but not yet handed out
+        self._shut_down = False
+
+    def add(self, asset_type, record):
+        """Add a record that needs no download (inline CSS/JS) at its position in the output"""
+        with self._lock:
+            self._records.append((asset_type, record))
+            if record.get('content') is not None:
+                self._completed.append((asset_type, record))
+                self._lock.notify_all()
+        return record
+
+    def submit(self, asset_type, url, original_path, depth=0, **extra):
+        """Queue a URL for download and return the record that will receive its content"""
+        # Fetch exactly what the page referenced (query order and signatures intact); only
+        # the fragment is dropped, since it is never sent. The canonical form is just the key
+        url = url.split('#', 1)[0]
+        key = canonicalize_url(url)
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            record = self._by_url.get(key)
+            if record is not None:
+                # Already queued under another reference; just remember this path
+                if original_path not in record['original_paths']:
+                    record['original_paths'].append(original_path)
+                return record
+            record = {'url': url, 'content': None, 'original_path': original_path, 'original_paths': [original_path]}
+            record.update(extra)
+            self._by_url[key] = record
+            self._records.append((asset_type, record))
+            self._queues.setdefault(host, deque()).append((asset_type, record, depth))
+            self._outstanding += 1
+            self._dispatch()
+        return record
+
+    def _dispatch(self):
+        # Must be called with the lock held
+        if self._shut_down:
+            return
+        for host in list(self._queues):
+            if self._running >= self.max_workers:
+                break
+            queue = self._queues[host]
+            while queue and self._running < self.max_workers and self._active.get(host, 0) < self.per_host_limit:
+                asset_type, record, depth = queue.popleft()
+                self._active[host] = self._active.get(host, 0) + 1
+                self._running += 1
+                self._executor.submit(self._run, host, asset_type, record, depth)
+            if not queue:
+                del self._queues[host]
+
+    def _run(self, host, asset_type, record, depth):
+        try:
+            captured = self.captured.get(canonicalize_url(record['url']))
+            if captured is not None:
+                record['content'] = captured
+                if self.stats:
+                    self.stats.incr('browser_captured')
+                if asset_cache:
+                    asset_cache.store(record['url'], captured, captured.headers)
+            else:
+                headers = dict(self.headers) if self.headers else None
+                record['content'], shared = asset_fetches.do(
+                    self._fetch_key(record['url']),
+                    lambda: download_asset(record['url'], self.base_url, headers, self.session_obj, self.stats)
+                )
+                if shared and self.stats:
+                    self.stats.incr('shared_downloads')
+                if self.captured and self.stats:
+                    self.stats.incr('browser_fallbacks')
+            if record['content'] is not None:
+                record['kind'], record['mime'] = asset_classifier.classify_body(record['url'], record['content'])
+                asset_type = self._bucket(asset_type, record)
+            if asset_type == 'css' and record['content'] is not None:
+                # Children are queued before this job counts as finished, so wait() covers them
+                self.submit_css_references(record['content'], record['url'], depth + 1)
+        except Exception as e:
+            print(f"Warning: Failed to download {record['url']}: {str(e)}")
+        finally:
+            with self._lock:
+                if record.get('content') is not None:
+                    self._completed.append((asset_type, record))
+                self._active[host] -= 1
+                if not self._active[host]:
+                    del self._active[host]
+                self._running -= 1
+                self._outstanding -= 1
+                self._dispatch()
+                self._lock.notify_all()
+
+    def _fetch_key(self, url):
+        # A download made with this session's cookies must not be handed to another extraction
+        if self.session_obj is not None and len(self.session_obj.cookies):
+            return (url, id(self.session_obj))
+        return url
+
+    def submit_discovered(self, urls):
+        """Queue resource URLs seen in the rendered page; those already queued are deduped"""
+        for url in urls:
+            if url.startswith(('http://', 'https://')):
+                self.submit(ASSET_TYPE_BUCKETS.get(get_asset_type(url), 'other'), url, url)
+
+    def submit_captured(self):
+        """Queue captured bodies no reference in the page pointed at (loaded by scripts or on scroll)"""
+        with self._lock:
+            # A redirected body is captured under two URLs; queue it once
+            seen = {id(body) for url, body in self.captured.items() if url in self._by_url}
+        for url, body in list(self.captured.items()):
+            if id(body) not in seen:
+                seen.add(id(body))
+                self.submit(ASSET_TYPE_BUCKETS.get(get_asset_type(url), 'other'), url, url)
+
+    def submit_css_references(self, css, css_url, depth=1):
+        """Queue the subresources referenced by a stylesheet body or inline CSS text"""
+        if depth > self.max_css_depth:
+            return
+        css_url = getattr(css, 'url', None) or css_url
+        for kind, reference in scan_css_references(decode_css_chunks(css)):
+            url = urljoin(css_url, reference)
+            if not url.startswith(('http://', 'https://')):
+                continue
+            self.submit(css_reference_type(kind, url), url, reference, depth, referrer=css_url)
+            if self.stats:
+                self.stats.incr('css_references')
+
+    @staticmethod
+    def _bucket(asset_type, record):
+        # The HTML context decides, except for guesses (media, CSS references) and bodies whose
+        # bytes or Content-Type name their type: a video first queued from an image slot is still a video
+        if asset_type == 'other' or record.get('referrer') or mime_type_bucket(record.get('mime')):
+            return record.get('kind') or asset_type
+        return asset_type
+
+    def drain(self):
+        """Return the (asset_type, record) pairs finished since the last call, without blocking"""
+        with self._lock:
+            ready = list(self._completed)
+            self._completed.clear()
+        return ready
+
+    def completed(self):
+        """Yield (asset_type, record) as each download finishes, until none are outstanding"""
+        while True:
+            with self._lock:
+                while not self._completed and self._outstanding:
+                    self._lock.wait()
+                if not self._completed:
+                    return
+                ready = list(self._completed)
+                self._completed.clear()
+            for item in ready:
+                yield item
+
+    def wait(self):
+        """Block until every submitted download has finished"""
+        with self._lock:
+            while self._outstanding:
+                self._lock.wait()
+
+    def shutdown(self):
+        """Drop queued downloads and stop the workers without waiting for running ones"""
+        with self._lock:
+            self._shut_down = True
+            self._queues.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def collect(self):
+        """Wait for all downloads and return the assets dict grouped by type"""
+        self.wait()
+        self._executor.shutdown(wait=True)
+        assets = {
+            'css': [],
+            'js': [],
+            'images': [],
+            'fonts': [],
+            'other': []
+        }
+        for asset_type, record in self._records:
+            if record.get('content') is not None:
+                assets[self._bucket(asset_type, record)].append(record)
+        return assets
+
+def benchmark_parsers(paths, parsers=None, repeat=3, base_url='http://localhost/'):
+    """
+    Parse captured pages with each backend and report parse time and peak memory.
     
-    # Navigation components
-    if tag_name == 'nav' or role == 'navigation' or 'nav' in class_str or 'navigation' in class_str or 'menu' in class_str or element_id in ['nav', 'navigation', 'menu']:
-        return 'navigation'
+    Every backend is also checked against the first one (html.parser) for
+    the asset references and metadata it yields, so switching backends
+    cannot silently change what gets extracted. Peak memory is measured
+    with tracemalloc and covers the Python-side tree.
     
-    # Header components
-    if tag_name == 'header' or role == 'banner' or 'header' in class_str or 'banner' in class_str or element_id in ['header', 'banner']:
-        return 'header'
+    Returns:
+        list: One result dict per (file, parser)
+    """
+    parsers = parsers or available_parsers()
+    results = []
+    for path in paths:
+        with open(path, 'rb') as fh:
+            html_text = fh.read().decode('utf-8', errors='replace')
+        reference = None
+        for parser in parsers:
+            timings = []
+            for _ in range(max(1, repeat)):
+                start = time.perf_counter()
+                document = ParsedDocument(html_text, base_url, parser=parser)
+                document.scan()
+                timings.append(time.perf_counter() - start)
+            
+            document = None
+            tracemalloc.start()
+            document = ParsedDocument(html_text, base_url, parser=parser)
+            document.scan()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            
+            summary = (
+                [(asset_type, url, original_path) for asset_type, url, original_path, _ in iter_asset_references(document, base_url)],
+                extract_metadata(document, base_url)
+            )
+            if reference is None:
+                reference = summary
+            results.append({
+                'file': path,
+                'parser': parser,
+                'bytes': len(html_text),
+                'parse_ms': round(min(timings) * 1000, 1),
+                'peak_kb': round(peak / 1024),
+                'assets': len(summary[0]),
+                'matches_reference': summary == reference
+            })
+    return results
+
+def image_references(attrs, base_url):
+    """Yield (url, original_path) for an <img>/<source>, preferring srcset candidates over src"""
+    if 'srcset' in attrs:
+        for src_item in (attrs['srcset'] or '').split(','):
+            url = src_item.strip().split(' ')[0]
+            yield urljoin(base_url, url), src_item.strip()
+    elif attrs.get('src'):
+        yield urljoin(base_url, attrs['src']), attrs['src']
+
+def iter_asset_references(document, base_url):
+    """
+    Yield every asset reference in a parsed document, in extraction order.
     
-    # Footer components
-    if tag_name == 'footer' or role == 'contentinfo' or 'footer' in class_str or element_id == 'footer':
-        return 'footer'
+    Each item is (asset_type, url, original_path, extra). `url` is None for
+    inline CSS/JS, whose text is in extra['content'].
+    """
+    scan = parse_document(document, base_url).scan()
     
-    # Hero/banner components
-    if 'hero' in class_str or 'banner' in class_str or 'jumbotron' in class_str or 'showcase' in class_str or element_id in ['hero', 'banner', 'jumbotron', 'showcase']:
-        return 'hero'
+    # Discover CSS files
+    for link in scan['stylesheets']:
+        href = link.get('href')
+        if href:
+            try:
+                yield 'css', urljoin(base_url, href), href, {}
+            except Exception as e:
+                print(f"Warning: Failed to extract CSS from {href}: {str(e)}")
     
-    # Card components
-    if 'card' in class_str or 'tile' in class_str or 'item' in class_str or element_id in ['card', 'tile']:
-        return 'card'
+    # Extract inline CSS
+    for style in scan['styles']:
+        if style.string:
+            yield 'css', None, 'inline', {'content': style.string}
     
-    # Form components
-    if tag_name == 'form' or role == 'form' or 'form' in class_str or element_id == 'form':
-        return 'form'
+    # Discover JavaScript files
+    for script in scan['scripts']:
+        src = script.get('src')
+        if src:
+            try:
+                yield 'js', urljoin(base_url, src), src, {}
+            except Exception as e:
+                print(f"Warning: Failed to extract JS from {src}: {str(e)}")
     
-    # CTA (Call to Action) components
-    if 'cta' in class_str or 'call-to-action' in class_str or 'action' in class_str or element_id in ['cta', 'call-to-action']:
-        return 'cta'
+    # Extract inline JavaScript
+    for script in scan['scripts']:
+        if script.string and not script.get('src'):
+            yield 'js', None, 'inline', {'content': script.string}
     
-    # Sidebar components
-    if 'sidebar' in class_str or 'side-bar' in class_str or element_id in ['sidebar', 'side-bar']:
-        return 'sidebar'
+    # Discover images
+    for img in scan['images']:
+        src = img.get('src') or img.get('srcset')
+        if src:
+            try:
+                for url, original_path in image_references(img.attrs, base_url):
+                    yield 'images', url, original_path, {}
+            except Exception as e:
+                print(f"Warning: Failed to extract image from {src}: {str(e)}")
     
-    # Modal/Dialog components
-    if role == 'dialog' or 'modal' in class_str or 'dialog' in class_str or 'popup' in class_str or element_id in ['modal', 'dialog', 'popup']:
-        return 'modal'
+    # Discover fonts
+    for font in scan['font_links']:
+        href = font.get('href')
+        if href:
+            try:
+                yield 'fonts', urljoin(base_url, href), href, {}
+            except Exception as e:
+                print(f"Warning: Failed to extract font from {href}: {str(e)}")
     
-    # Section components
-    if tag_name == 'section' or role == 'region' or 'section' in class_str:
-        return 'section'
+    # Discover url(), image-set() and @import references in inline CSS
+    for style in scan['styles']:
+        if style.string:
+            try:
+                for kind, reference in scan_css_references(style.string):
+                    url = urljoin(base_url, reference)
+                    yield css_reference_type(kind, url), url, reference, {}
+            except Exception as e:
+                print(f"Warning: Failed to scan inline CSS: {str(e)}")
     
-    # Mobile components
-    if 'mobile' in class_str or 'smartphone' in class_str or 'mobile-only' in class_str:
-        return 'mobile'
+    # Discover other assets (videos, audio, etc.)
+    for media in scan['media']:
+        src = media.get('src')
+        if src:
+            try:
+                yield 'other', urljoin(base_url, src), src, {'type': media.name}
+            except Exception as e:
+                print(f"Warning: Failed to extract media from {src}: {str(e)}")
+
+class HTMLReferenceSniffer(HTMLParser):
+    """
+    Incremental scanner that finds asset references while HTML is still arriving.
     
-    # Store/Product components
-    if 'product' in class_str or 'store' in class_str or 'shop' in class_str or 'pricing' in class_str:
-        return 'store'
+    feed() accepts text chunks as they come off the wire and returns the
+    (asset_type, url, original_path, extra) references completed by that
+    chunk, using the same rules as iter_asset_references() so the
+    downloader dedupes the two against each other.
+    """
+
+    def __init__(self, base_url):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self._found = []
+        self._style_text = None
+        self._media_depth = 0  # open <video>/<audio> elements
+
+    def feed(self, data):
+        super().feed(data)
+        found, self._found = self._found, []
+        return found
+
+    def close(self):
+        super().close()
+        found, self._found = self._found, []
+        return found
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {name: value or '' for name, value in attrs}
+        base_url = self.base_url
+        found = self._found
+        if tag == 'link' and attrs.get('href'):
+            rel = attrs.get('rel', '').split()
+            if 'stylesheet' in rel:
+                found.append(('css', urljoin(base_url, attrs['href']), attrs['href'], {}))
+            if 'font' in rel:
+                found.append(('fonts', urljoin(base_url, attrs['href']), attrs['href'], {}))
+        elif tag == 'script' and attrs.get('src'):
+            found.append(('js', urljoin(base_url, attrs['src']), attrs['src'], {}))
+        elif tag == 'style':
+            self._style_text = []
+        in_media = tag == 'source' and self._media_depth > 0
+        if tag in MEDIA_SOURCE_PARENTS:
+            self._media_depth += 1
+        if tag in ('img', 'source') and not in_media and (attrs.get('src') or attrs.get('srcset')):
+            for url, original_path in image_references(attrs, base_url):
+                found.append(('images', url, original_path, {}))
+        if (tag in MEDIA_SOURCE_PARENTS or in_media) and attrs.get('src'):
+            found.append(('other', urljoin(base_url, attrs['src']), attrs['src'], {'type': tag}))
+
+    def handle_data(self, data):
+        if self._style_text is not None:
+            self._style_text.append(data)
+
+    def handle_endtag(self, tag):
+        if tag in MEDIA_SOURCE_PARENTS and self._media_depth:
+            self._media_depth -= 1
+        if tag == 'style' and self._style_text is not None:
+            for kind, reference in scan_css_references(''.join(self._style_text)):
+                url = urljoin(self.base_url, reference)
+                self._found.append((css_reference_type(kind, url), url, reference, {}))
+            self._style_text = None
+
+def queue_assets(document, base_url, session_obj=None, headers=None, max_workers=None, per_host_limit=None, stats=None,
+                 captured=None, discovered=None):
+    """
+    Queue every asset reference of a parsed document on a new AssetDownloader.
     
-    # Cart components
-    if 'cart' in class_str or 'basket' in class_str or 'shopping-cart' in class_str or element_id in ['cart', 'basket', 'shopping-cart']:
-        return 'cart'
+    Returns immediately with the downloader; iterate its completed() to
+    handle assets as they finish, or call collect() for the assets dict.
+    Bodies in `captured` (from capture_browser_responses()) are used instead
+    of downloading, and captured assets the document does not reference
+    are added as well, as are the `discovered` URLs the rendered page
+    referenced or loaded (see extract_with_selenium()).
+    """
+    document = parse_document(document, base_url)
+    downloader = AssetDownloader(base_url, session_obj, headers, max_workers, per_host_limit, stats, captured=captured)
     
-    # If no specific type is identified, check if the element is a major container
-    if tag_name in ['div', 'section', 'article'] and ('container' in class_str or 'wrapper' in class_str or 'content' in class_str):
-        return 'container'
+    for asset_type, url, original_path, extra in iter_asset_references(document, base_url):
+        if url is None:
+            downloader.add(asset_type, {
+                'url': None,
+                'content': extra['content'],
+                'original_path': original_path
+            })
+        else:
+            try:
+                downloader.submit(asset_type, url, original_path, **extra)
+            except Exception as e:
+                print(f"Warning: Failed to queue {asset_type} asset {original_path}: {str(e)}")
     
-    # Default to unknown if no specific type is identified
-    return 'other'
+    if discovered:
+        downloader.submit_discovered(discovered)
+    if captured:
+        downloader.submit_captured()
+    return downloader
 
-def extract_component_structure(soup):
-    """Extract UI components from the HTML structure"""
-    if not soup:
-        return {}
-        
-    components = {
-        'navigation': [],
-        'header': [],
-        'footer': [],
-        'hero': [],
-        'card': [],
-        'form': [],
-        'cta': [],
-        'sidebar': [],
-        'modal': [],
-        'section': [],
-        'store': [],
-        'mobile': [],
-        'cart': []
-    }
-    
-    # Helper function to convert element to HTML string
-    def element_to_html(element):
-        return str(element)
+def extract_assets(document, base_url, session_obj=None, headers=None, max_workers=None, per_host_limit=None, stats=None):
+    """
+    Extract all assets (CSS, JS, images, fonts) from a parsed document.
     
-    # Extract navigation components
-    nav_elements = soup.find_all(['nav']) + soup.find_all(role='navigation') + soup.find_all(class_=lambda c: c and ('nav' in c.lower() or 'menu' in c.lower()))
-    for element in nav_elements[:5]:  # Limit to 5 to avoid excessive extraction
-        components['navigation'].append({
-            'html': element_to_html(element)
-        })
+    Asset URLs are discovered from the whole document first and then
+    downloaded in parallel by an AssetDownloader, which also follows the
+    url() and @import references of every stylesheet it downloads.
     
-    # Extract header components
-    header_elements = soup.find_all(['header']) + soup.find_all(role='banner') + soup.find_all(class_=lambda c: c and 'header' in c.lower())
-    for element in header_elements[:2]:  # Usually only 1-2 headers per page
-        components['header'].append({
-            'html': element_to_html(element)
-        })
+    Args:
+        document: ParsedDocument (an HTML string is parsed on the fly)
+        base_url: Base URL for resolving relative paths
+        session_obj: Optional requests session object
+        headers: Optional headers for requests
+        max_workers: Optional total number of concurrent downloads
+        per_host_limit: Optional number of concurrent downloads per host
+        stats: Optional ExtractionStats collecting download counters
+        
+    Returns:
+        dict: Dictionary containing extracted assets by type
+    """
+    if not document:
+        return {}
     
-    # Extract footer components
-    footer_elements = soup.find_all(['footer']) + soup.find_all(role='contentinfo') + soup.find_all(class_=lambda c: c and 'footer' in c.lower())
-    for element in footer_elements[:2]:  # Usually only 1-2 footers per page
-        components['footer'].append({
-            'html': element_to_html(element)
-        })
+    try:
+        return queue_assets(document, base_url, session_obj, headers, max_workers, per_host_limit, stats).collect()
+        
+    except Exception as e:
+        print(f"Error in extract_assets: {str(e)}")
+        traceback.print_exc()
+        return {}
+
+def document_request_headers(headers=None):
+    """Browser-like headers for fetching a page, with a rotated User-Agent"""
+    request_headers = {
+        'User-Agent': random.choice(USER_AGENTS),
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.9'
+    }
+    request_headers.update(headers or {})
+    return request_headers
+
+def decode_document(content, content_type):
+    """Decode a page body with the charset from its Content-Type, defaulting to UTF-8"""
+    charset = re.search(r'charset=([\w-]+)', content_type or '', re.IGNORECASE)
+    try:
+        return content.decode(charset.group(1) if charset else 'utf-8', errors='replace')
+    except LookupError:
+        return content.decode('utf-8', errors='replace')
+
+def fetch_document(url, session_obj=None, headers=None, timeout=30, attempts=DOCUMENT_FETCH_ATTEMPTS):
+    """
+    Fetch a page over plain HTTP on the pooled session, following redirects.
     
-    # Extract hero/banner components
-    hero_elements = soup.find_all(class_=lambda c: c and ('hero' in c.lower() or 'banner' in c.lower() or 'jumbotron' in c.lower()))
-    for element in hero_elements[:3]:  # Limit to 3
-        components['hero'].append({
-            'html': element_to_html(element)
-        })
+    Responses that look like bot blocking (403, 429, 503) are retried with
+    freshly rotated headers. Raises requests.RequestException on failure.
     
-    # Extract card components - often these are repeated elements
-    card_elements = soup.find_all(class_=lambda c: c and ('card' in c.lower() or 'tile' in c.lower()))
+    Returns:
+        tuple: (html_content, final URL after redirects)
+    """
+    host = urlparse(url).netloc.lower()
+    for attempt in range(1, attempts + 1):
+        host_rate_limiter.acquire(host)
+        response = (session_obj or http_client.shared_session).get(
+            url, headers=document_request_headers(headers), timeout=timeout, allow_redirects=True, verify=False
+        )
+        if response.status_code in (403, 429, 503) and attempt < attempts:
+            print(f"Fetching {url} returned {response.status_code}, retrying with different headers")
+            if response.status_code != 403:
+                host_rate_limiter.record_backoff(host, parse_retry_after(response.headers.get('Retry-After')))
+            response.close()
+            continue
+        if response.status_code >= 400:
+            response.close()
+            response.raise_for_status()
+        host_rate_limiter.record_success(host)
+        if response.history:
+            print(f"Request for {url} was redirected {len(response.history)} times to {response.url}")
+        return decode_document(response.content, response.headers.get('Content-Type')), response.url
+
+# Mount points of client-side frameworks (React, Next.js, Vue, Nuxt, Svelte, Angular)
+JS_SHELL_MOUNT_IDS = {'root', 'app', '__next', '__nuxt', 'svelte', 'app-root'}
+JS_SHELL_NOSCRIPT = re.compile(r'enable\s+javascript|javascript\s+(?:is\s+)?(?:required|disabled|needed)|requires\s+javascript', re.IGNORECASE)
+JS_SHELL_HIDDEN_TAGS = {'script', 'style', 'noscript', 'template'}
+
+def detect_js_shell(document):
+    """
+    Return why a page looks like a JavaScript-rendered shell, or None if its HTML already holds the content.
     
-    # If we find many cards, just keep one of each unique structure
-    unique_cards = {}
-    for element in card_elements[:15]:  # Examine up to 15 cards
-        # Use a simplified structure hash to identify similar cards
-        structure_hash = str(len(element.find_all()))  # Number of child elements
-        if structure_hash not in unique_cards:
-            unique_cards[structure_hash] = element
+    A page is a shell when its body has almost no visible text, when a
+    framework mount point (#root, #__next, ...) is empty, or when a
+    <noscript> block asks for JavaScript and there is little text besides.
+    """
+    soup = parse_document(document).soup
+    body = soup.body or soup
+    text_length = 0
+    for string in body.find_all(string=True):
+        if string.parent is not None and string.parent.name not in JS_SHELL_HIDDEN_TAGS:
+            text_length += len(string.strip())
     
-    # Add unique cards to components
-    for idx, element in enumerate(unique_cards.values()):
-        if idx >= 5:  # Limit to 5 unique cards
-            break
-        components['card'].append({
-            'html': element_to_html(element)
-        })
+    for element in body.find_all(id=JS_SHELL_MOUNT_IDS):
+        if not element.find(True) and not element.get_text(strip=True):
+            return f"empty #{element.get('id')} mount"
+    if text_length < JS_SHELL_MIN_TEXT:
+        return f"near-empty body ({text_length} characters of text)"
+    if text_length < JS_SHELL_NOSCRIPT_TEXT:
+        for noscript in body.find_all('noscript'):
+            if JS_SHELL_NOSCRIPT.search(noscript.get_text(' ')):
+                return "noscript warning"
+    return None
+
+def extract_pipelined(url, session_obj=None, parser=None, stats=None, on_asset=None, headers=None, timeout=30):
+    """
+    Fetch a page over HTTP and download its assets while the HTML is still arriving.
     
-    # Extract form components
-    form_elements = soup.find_all(['form']) + soup.find_all(class_=lambda c: c and 'form' in c.lower())
-    for element in form_elements[:3]:  # Limit to 3
-        components['form'].append({
-            'html': element_to_html(element)
-        })
+    The response body is fed chunk by chunk to an HTMLReferenceSniffer and
+    every reference it finds is queued on the AssetDownloader right away.
+    Finished assets are handed to `on_asset(asset_type, record)` as soon as
+    they complete (between chunks, then while the remaining downloads run),
+    so the total time approaches max(HTML time, slowest asset) instead of
+    the sum of the stages. Once the body is complete it is parsed once and
+    iter_asset_references() fills in anything the sniffer could not see.
     
-    # Extract CTA components
-    cta_elements = soup.find_all(class_=lambda c: c and ('cta' in c.lower() or 'call-to-action' in c.lower()))
-    for element in cta_elements[:3]:  # Limit to 3
-        components['cta'].append({
-            'html': element_to_html(element)
-        })
+    Returns:
+        tuple: (html_content, ParsedDocument, assets dict), with the document
+        based on the final URL after redirects
+    """
+    start = time.perf_counter()
+    # The page counts against the same per-host limits as its assets
+    host = urlparse(url).netloc.lower()
+    host_rate_limiter.acquire(host)
+    response = (session_obj or http_client.shared_session).get(
+        url, headers=document_request_headers(headers), stream=True, timeout=timeout, verify=False
+    )
+    if response.status_code in (429, 503):
+        host_rate_limiter.record_backoff(host, parse_retry_after(response.headers.get('Retry-After')))
+    elif response.status_code >= 500:
+        host_rate_limiter.record_backoff(host)
+    else:
+        host_rate_limiter.record_success(host)
     
-    # Extract sidebar components
-    sidebar_elements = soup.find_all(class_=lambda c: c and ('sidebar' in c.lower() or 'side-bar' in c.lower()))
-    for element in sidebar_elements[:2]:  # Limit to 2
-        components['sidebar'].append({
-            'html': element_to_html(element)
-        })
+    downloader = None
+    try:
+        try:
+            response.raise_for_status()
+            base_url = response.url
+            downloader = AssetDownloader(base_url, session_obj, headers, stats=stats)
+            sniffer = HTMLReferenceSniffer(base_url)
+            charset = re.search(r'charset=([\w-]+)', response.headers.get('Content-Type', ''), re.IGNORECASE)
+            try:
+                decoder = codecs.getincrementaldecoder(charset.group(1) if charset else 'utf-8')(errors='replace')
+            except LookupError:
+                decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        
+            def deliver(ready):
+                if on_asset:
+                    for asset_type, record in ready:
+                        on_asset(asset_type, record)
+        
+            def queue(references):
+                for asset_type, ref_url, original_path, extra in references:
+                    try:
+                        downloader.submit(asset_type, ref_url, original_path, **extra)
+                    except Exception as e:
+                        print(f"Warning: Failed to queue {asset_type} asset {original_path}: {str(e)}")
+        
+            parts = []
+            for chunk in response.iter_content(ASSET_CHUNK_SIZE):
+                text = decoder.decode(chunk)
+                parts.append(text)
+                queue(sniffer.feed(text))
+                deliver(downloader.drain())
+            text = decoder.decode(b'', final=True)
+            parts.append(text)
+            queue(sniffer.feed(text))
+            queue(sniffer.close())
+        finally:
+            response.close()
+        
+        html_content = ''.join(parts)
+        html_ms = (time.perf_counter() - start) * 1000
+        
+        # Authoritative pass over the parsed document; already queued URLs are deduped
+        document = parse_document(html_content, base_url, parser)
+        for asset_type, ref_url, original_path, extra in iter_asset_references(document, base_url):
+            if ref_url is None:
+                downloader.add(asset_type, {
+                    'url': None,
+                    'content': extra['content'],
+                    'original_path': original_path
+                })
+            else:
+                queue([(asset_type, ref_url, original_path, extra)])
+        
+        deliver(downloader.completed())
+        assets = downloader.collect()
+        total_ms = (time.perf_counter() - start) * 1000
+        if stats:
+            stats.incr('html_ms', round(html_ms))
+            stats.incr('pipeline_ms', round(total_ms))
+        print(f"Pipelined extraction: HTML received in {html_ms:.0f} ms, finished after {total_ms:.0f} ms")
+    finally:
+        # Stops the download workers if anything above failed; a no-op after collect()
+        if downloader is not None:
+            downloader.shutdown()
     
-    # Extract modal/dialog components
-    modal_elements = soup.find_all(role='dialog') + soup.find_all(class_=lambda c: c and ('modal' in c.lower() or 'dialog' in c.lower() or 'popup' in c.lower()))
-    for element in modal_elements[:3]:  # Limit to 3
-        components['modal'].append({
-            'html': element_to_html(element)
-        })
+    return html_content, document, assets
+
+def chrome_options(profile='full'):
+    """Chrome options for pooled browsers; the 'dom' profile stops at DOMContentLoaded and loads no images"""
+    options = Options()
+    options.add_argument("--headless=new")  # Use new headless mode
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--window-size=1920,1080")
+    options.add_argument("--disable-notifications")
+    options.add_argument("--disable-extensions")
+    options.add_argument("--disable-infobars")
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    options.add_argument("--disable-features=IsolateOrigins,site-per-process")  # Improve performance
+    options.add_argument("--disable-site-isolation-trials")
+    options.add_argument("--disable-web-security")  # Allow cross-origin requests
+    options.add_argument("--allow-running-insecure-content")
+    # Lets the health check read performance.memory
+    options.add_argument("--enable-precise-memory-info")
+    # Network events for capture_browser_responses()
+    options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    if profile == 'dom':
+        options.page_load_strategy = 'eager'
+        options.add_argument("--blink-settings=imagesEnabled=false")
     
-    # Extract section components
-    section_elements = soup.find_all(['section']) + soup.find_all(role='region')
-    # Filter to get only substantial sections
-    substantial_sections = [element for element in section_elements if len(element.find_all()) > 3]  # Must have at least 3 child elements
-    for element in substantial_sections[:5]:  # Limit to 5
-        components['section'].append({
-            'html': element_to_html(element)
-        })
+    # Advanced anti-detection measures
+    options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    options.add_experimental_option("useAutomationExtension", False)
     
-    # Extract mobile-specific components
-    mobile_elements = soup.find_all(class_=lambda c: c and ('mobile' in c.lower() or 'smartphone' in c.lower() or 'mobile-only' in c.lower()))
-    for element in mobile_elements[:3]:  # Limit to 3
-        components['mobile'].append({
-            'html': element_to_html(element)
-        })
+    # Add modern user agent and additional headers
+    options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36")
+    return options
+
+class PooledBrowser:
+    """A browser session owned by BrowserPool; `healthy` is cleared by callers that saw it fail"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+        self.created = time.monotonic()
+        self.healthy = True
+        self.wait = 0.0  # seconds the current lease waited for this browser
+        self.origins = set()  # origins the current lease loaded anything from; their storage is cleared on reset
+
+class BrowserPool:
+    """
+    Bounded pool of pre-started headless Chrome sessions shared by every extraction.
+
+    The chromedriver path is resolved once (CHROMEDRIVER_PATH, webdriver-manager,
+    or Selenium's own lookup) instead of on every request. session() lends a
+    browser for one extraction and waits while all of them are busy. Every
+    lease starts on a fresh tab with cookies and storage cleared; a browser
+    that fails its health check (dead session, JS heap above
+    BROWSER_POOL_MAX_HEAP_MB) or has served max_uses extractions is quit and
+    replaced. stats() reports wait times and utilization.
+    """
+
+    def __init__(self, size=None, max_uses=None, acquire_timeout=None, profile='full'):
+        self.profile = profile
+        self.size = size or BROWSER_POOL_SIZE
+        self.max_uses = max_uses or BROWSER_POOL_MAX_USES
+        self.acquire_timeout = acquire_timeout or BROWSER_POOL_ACQUIRE_TIMEOUT
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._live = 0
+        self._in_use = 0
+        self._driver_path = None
+        self._driver_path_resolved = False
+        self._started = time.monotonic()
+        self._busy_seconds = 0.0
+        self._busy_since = None
+        self._counters = {'leases': 0, 'launched': 0, 'launch_failures': 0, 'retired': 0, 'unhealthy': 0,
+                          'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+
+    def driver_path(self):
+        """Resolve the chromedriver executable once; None lets Selenium locate it"""
+        with self._cond:
+            if self._driver_path_resolved:
+                return self._driver_path
+        path = os.environ.get('CHROMEDRIVER_PATH')
+        if not path:
+            try:
+                path = ChromeDriverManager().install()
+            except Exception as e:
+                print(f"webdriver-manager could not install chromedriver, using Selenium's lookup: {str(e)}")
+        with self._cond:
+            self._driver_path, self._driver_path_resolved = path, True
+        return path
+
+    def _launch(self):
+        path = self.driver_path()
+        service = Service(path) if path else None
+        start = time.perf_counter()
+        driver = webdriver.Chrome(service=service, options=chrome_options(self.profile)) if service else webdriver.Chrome(options=chrome_options(self.profile))
+        print(f"Started pooled Chrome in {time.perf_counter() - start:.1f}s")
+        return PooledBrowser(driver)
+
+    def _check(self, browser):
+        """Health check before a browser is reused"""
+        try:
+            heap = browser.driver.execute_script(
+                "return window.performance && performance.memory ? performance.memory.usedJSHeapSize : 0"
+            ) or 0
+        except Exception as e:
+            print(f"Pooled browser failed its health check: {str(e)}")
+            return False
+        if heap > BROWSER_POOL_MAX_HEAP_MB * 1024 * 1024:
+            print(f"Pooled browser is using {heap // (1024 * 1024)} MB of JS heap, recycling it")
+            return False
+        return True
+
+    def _reset(self, browser):
+        """Give a browser a clean context: cookies and storage cleared, a single fresh tab"""
+        driver = browser.driver
+        origins = set(browser.origins)
+        visited = urlparse(driver.current_url)
+        if visited.scheme in ('http', 'https'):
+            origins.add(f"{visited.scheme}://{visited.netloc}")
+        # Cookies of every site go at once; storage has to be cleared origin by origin,
+        # including third-party frames and the hops of redirect chains
+        driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+        for origin in sorted(origins):
+            driver.execute_cdp_cmd('Storage.clearDataForOrigin', {'origin': origin, 'storageTypes': 'all'})
+        browser.origins.clear()
+        old_handles = driver.window_handles
+        driver.switch_to.new_window('tab')
+        fresh = driver.current_window_handle
+        for handle in old_handles:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(fresh)
+
+    def _retire(self, browser):
+        try:
+            browser.driver.quit()
+        except Exception:
+            pass
+        with self._cond:
+            self._live -= 1
+            self._counters['retired'] += 1
+            self._cond.notify()
+
+    def _mark_busy(self, delta):
+        # Caller holds the lock; integrates busy browser-seconds for utilization
+        now = time.monotonic()
+        if self._busy_since is not None:
+            self._busy_seconds += self._in_use * (now - self._busy_since)
+        self._busy_since = now
+        self._in_use += delta
+
+    def acquire(self, timeout=None):
+        """Lend a browser, starting one if the pool is below its size; raises TimeoutError if none frees up"""
+        timeout = timeout or self.acquire_timeout
+        start = time.monotonic()
+        while True:
+            browser = None
+            with self._cond:
+                while not self._idle and self._live >= self.size:
+                    remaining = timeout - (time.monotonic() - start)
+                    if remaining <= 0:
+                        raise TimeoutError(f"No browser became available within {timeout:.0f}s")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    browser = self._idle.popleft()
+                else:
+                    self._live += 1
+            
+            if browser is None:
+                try:
+                    browser = self._launch()
+                except Exception:
+                    with self._cond:
+                        self._live -= 1
+                        self._counters['launch_failures'] += 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._counters['launched'] += 1
+            elif not self._check(browser):
+                with self._cond:
+                    self._counters['unhealthy'] += 1
+                self._retire(browser)
+                continue
+            
+            waited = time.monotonic() - start
+            with self._cond:
+                self._counters['leases'] += 1
+                self._counters['wait_seconds'] += waited
+                self._counters['max_wait_seconds'] = max(self._counters['max_wait_seconds'], waited)
+                self._mark_busy(1)
+            browser.wait = waited
+            return browser
+
+    def release(self, browser):
+        """Return a browser after use; it is retired if it failed or reached max_uses"""
+        browser.uses += 1
+        with self._cond:
+            self._mark_busy(-1)
+        if browser.healthy and browser.uses < self.max_uses:
+            try:
+                self._reset(browser)
+            except Exception as e:
+                print(f"Could not reset pooled browser: {str(e)}")
+                browser.healthy = False
+        if not browser.healthy:
+            with self._cond:
+                self._counters['unhealthy'] += 1
+        if not browser.healthy or browser.uses >= self.max_uses:
+            self._retire(browser)
+            return
+        with self._cond:
+            self._idle.append(browser)
+            self._cond.notify()
+
+    @contextmanager
+    def session(self, timeout=None):
+        """Context manager around acquire()/release()"""
+        browser = self.acquire(timeout)
+        try:
+            yield browser
+        except WebDriverException:
+            browser.healthy = False
+            raise
+        finally:
+            self.release(browser)
+
+    def warm(self, count=None):
+        """Start browsers ahead of the first extraction (resolves the driver path too)"""
+        for _ in range(count or BROWSER_POOL_WARM):
+            with self._cond:
+                if self._live >= self.size:
+                    return
+                self._live += 1
+            try:
+                browser = self._launch()
+            except Exception as e:
+                with self._cond:
+                    self._live -= 1
+                    self._counters['launch_failures'] += 1
+                print(f"Could not pre-start browsers: {str(e)}")
+                return
+            with self._cond:
+                self._counters['launched'] += 1
+                self._idle.append(browser)
+                self._cond.notify()
+
+    def close(self):
+        """Quit every idle browser"""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for browser in idle:
+            self._retire(browser)
+
+    def stats(self):
+        """Pool size, lease wait times and utilization (busy browser-seconds over capacity since start)"""
+        with self._cond:
+            self._mark_busy(0)
+            leases = self._counters['leases']
+            elapsed = time.monotonic() - self._started
+            return {
+                'size': self.size,
+                'max_uses': self.max_uses,
+                'live': self._live,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'leases': leases,
+                'launched': self._counters['launched'],
+                'launch_failures': self._counters['launch_failures'],
+                'retired': self._counters['retired'],
+                'unhealthy': self._counters['unhealthy'],
+                'avg_wait_ms': round(self._counters['wait_seconds'] * 1000 / leases, 1) if leases else 0.0,
+                'max_wait_ms': round(self._counters['max_wait_seconds'] * 1000, 1),
+                'utilization': round(self._busy_seconds / (self.size * elapsed), 3) if elapsed else 0.0
+            }
+
+# Shared browser sessions for Selenium rendering; DOM-only browsers are started on first use
+browser_pool = BrowserPool() if SELENIUM_AVAILABLE else None
+dom_browser_pool = BrowserPool(profile='dom') if SELENIUM_AVAILABLE else None
+if browser_pool:
+    atexit.register(browser_pool.close)
+    atexit.register(dom_browser_pool.close)
+
+_browser_pool_warm_lock = threading.Lock()
+_browser_pool_warm_started = False
+
+def warm_browser_pool(debug=False):
+    """
+    Start browsers in the background so the first Selenium extraction does not wait for Chrome.
     
-    # Extract store/product components
-    store_elements = soup.find_all(class_=lambda c: c and ('product' in c.lower() or 'store' in c.lower() or 'shop' in c.lower() or 'pricing' in c.lower()))
-    for element in store_elements[:5]:  # Limit to 5
-        components['store'].append({
-            'html': element_to_html(element)
-        })
+    Runs at most once per process. Under the debug reloader the parent
+    process only watches files (the child, with WERKZEUG_RUN_MAIN set,
+    serves requests), so it is skipped there.
+    """
+    global _browser_pool_warm_started
+    if not browser_pool or not BROWSER_POOL_WARM:
+        return
+    if debug and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+        return
+    with _browser_pool_warm_lock:
+        if _browser_pool_warm_started:
+            return
+        _browser_pool_warm_started = True
+    threading.Thread(target=browser_pool.warm, name='browser-pool-warm', daemon=True).start()
+
+# Installed before the page's own scripts (and again lazily if that failed):
+# counts in-flight fetch/XHR requests, records the time of the last network
+# event and DOM mutation, and provides the wait used by wait_for_settle()
+SETTLE_SHIM_JS = """
+(function() {
+    if (window.__extractorSettle) return;
+    var state = window.__extractorSettle = {inflight: 0, lastNetwork: performance.now(), lastMutation: performance.now()};
+    function started() { state.inflight++; state.lastNetwork = performance.now(); }
+    function finished() { state.inflight = Math.max(0, state.inflight - 1); state.lastNetwork = performance.now(); }
+    if (window.fetch) {
+        var originalFetch = window.fetch;
+        window.fetch = function() {
+            started();
+            return originalFetch.apply(this, arguments).then(
+                function(response) { finished(); return response; },
+                function(error) { finished(); throw error; }
+            );
+        };
+    }
+    var originalSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function() {
+        started();
+        this.addEventListener('loadend', finished);
+        return originalSend.apply(this, arguments);
+    };
+    try {
+        new PerformanceObserver(function() { state.lastNetwork = performance.now(); })
+            .observe({type: 'resource', buffered: false});
+    } catch (e) {}
+    function observeDom() {
+        new MutationObserver(function() { state.lastMutation = performance.now(); })
+            .observe(document.documentElement, {childList: true, subtree: true, attributes: true, characterData: true});
+    }
+    if (document.documentElement) observeDom(); else document.addEventListener('DOMContentLoaded', observeDom);
+    function pendingImages() {
+        var count = 0;
+        for (var i = 0; i < document.images.length; i++) {
+            var img = document.images[i];
+            if (img.currentSrc && !img.complete && img.loading !== 'lazy') count++;
+        }
+        return count;
+    }
+    // Resolves once nothing has happened for idleMs (network and/or DOM, per
+    // strategy) or the deadline passes; step waits (waitInflight false) do not
+    // wait for requests already in flight, they only let new work start
+    state.wait = function(idleMs, deadlineMs, strategy, waitInflight) {
+        var start = performance.now();
+        return new Promise(function(resolve) {
+            (function check() {
+                var now = performance.now();
+                var last = start;
+                if (strategy !== 'dom') last = Math.max(last, state.lastNetwork);
+                if (strategy !== 'network') last = Math.max(last, state.lastMutation);
+                var busy = waitInflight && strategy !== 'dom' && (state.inflight > 0 || pendingImages() > 0);
+                if (!busy && now - last >= idleMs) return resolve({settled: true, waited: now - start});
+                if (now - start >= deadlineMs) return resolve({settled: false, waited: now - start, inflight: state.inflight});
+                setTimeout(check, 50);
+            })();
+        });
+    };
+})();
+"""
+
+# Single settle wait for wait_for_settle()
+SETTLE_WAIT_JS = SETTLE_SHIM_JS + """
+window.__extractorSettle.wait(arguments[0], arguments[1], arguments[2], arguments[3]).then(arguments[arguments.length - 1]);
+"""
+
+def wait_for_settle(driver, phase, timings=None, deadline=None, idle_ms=None, wait_inflight=True, fixed_delay=0):
+    """
+    Wait until the page is quiet instead of sleeping for a fixed time.
     
-    # Extract cart components
-    cart_elements = soup.find_all(class_=lambda c: c and ('cart' in c.lower() or 'basket' in c.lower() or 'shopping-cart' in c.lower()))
-    for element in cart_elements[:2]:  # Limit to 2
-        components['cart'].append({
-            'html': element_to_html(element)
-        })
+    With SETTLE_STRATEGY 'idle' the page must see no network activity and no
+    DOM mutations for `idle_ms`; 'network' and 'dom' watch only one of them;
+    'fixed' sleeps `fixed_delay` seconds (the old behaviour). `deadline`
+    caps the wait. The time spent is added to timings[phase] in milliseconds.
     
-    # Remove empty component types
-    return {k: v for k, v in components.items() if v}
+    Returns:
+        bool: whether the page settled before the deadline
+    """
+    start = time.perf_counter()
+    settled = True
+    if SETTLE_STRATEGY == 'fixed':
+        time.sleep(fixed_delay)
+    else:
+        try:
+            result = driver.execute_async_script(
+                SETTLE_WAIT_JS,
+                idle_ms if idle_ms is not None else SETTLE_IDLE_MS,
+                (deadline if deadline is not None else SETTLE_DEADLINE) * 1000,
+                SETTLE_STRATEGY,
+                wait_inflight
+            )
+            settled = bool(result and result.get('settled'))
+        except WebDriverException as e:
+            print(f"Warning: settle wait failed during {phase}: {str(e)}")
+            settled = False
+    if timings is not None:
+        timings[phase] = round(timings.get(phase, 0) + (time.perf_counter() - start) * 1000)
+    return settled
 
-def extract_inline_styles(soup):
-    """Extract all inline styles from the HTML"""
-    inline_styles = {}
-    elements_with_style = soup.select('[style]')
+# Buttons and toggles clicked (first 3 visible matches each) to reveal collapsed content
+EXPAND_SELECTORS = [
+    'button.load-more', '.show-more', '.expand', '.accordion-toggle',
+    '[aria-expanded="false"]', '.menu-toggle', '.navbar-toggler',
+    '.mobile-menu-button', '.hamburger', '[data-toggle="collapse"]'
+]
+# Most scroll positions visited when looking for lazy content
+MAX_SCROLL_STEPS = 20
+
+# Installed with SETTLE_SHIM_JS: accumulates, deduplicated, the stylesheet,
+# script and image URLs the page references or loads (MutationObserver for
+# new elements, PerformanceObserver for loaded resources)
+PAGE_COLLECTOR_JS = """
+(function() {
+    if (window.__extractorCollector) return;
+    var urls = new Set();
+    var selector = 'link[rel="stylesheet"], link[as="style"], script[src], img[src]';
+    var initiators = {link: 1, script: 1, img: 1, css: 1, image: 1, video: 1, audio: 1, source: 1};
+    function add(url) {
+        if (url && url.indexOf('data:') !== 0 && url.indexOf('blob:') !== 0) urls.add(url);
+    }
+    function addElement(el) {
+        add(el.tagName === 'LINK' ? el.href : el.src);
+    }
+    function sweep(root) {
+        if (root.matches && root.matches(selector)) addElement(root);
+        if (root.querySelectorAll) root.querySelectorAll(selector).forEach(addElement);
+    }
+    window.__extractorCollector = {urls: urls, sweep: sweep};
+    try {
+        new PerformanceObserver(function(list) {
+            list.getEntries().forEach(function(entry) { if (initiators[entry.initiatorType]) add(entry.name); });
+        }).observe({type: 'resource', buffered: true});
+    } catch (e) {}
+    function observeDom() {
+        new MutationObserver(function(mutations) {
+            mutations.forEach(function(mutation) {
+                if (mutation.type === 'attributes') sweep(mutation.target);
+                else mutation.addedNodes.forEach(function(node) { if (node.nodeType === 1) sweep(node); });
+            });
+        }).observe(document.documentElement, {childList: true, subtree: true, attributes: true, attributeFilter: ['src', 'href']});
+    }
+    if (document.documentElement) observeDom(); else document.addEventListener('DOMContentLoaded', observeDom);
+})();
+"""
+
+# One async call that scrolls the page, clicks expanders, waits for the page
+# to settle between steps (in the page, like wait_for_settle()) and returns
+# the collected URLs with the time each phase waited
+COLLECT_PAGE_JS = SETTLE_SHIM_JS + PAGE_COLLECTOR_JS + """
+var options = arguments[0], done = arguments[arguments.length - 1];
+var settle = window.__extractorSettle, collector = window.__extractorCollector;
+var timings = {};
+function wait(phase, idleMs, deadlineMs, waitInflight, fixedDelay) {
+    var start = performance.now();
+    var waiting = options.strategy === 'fixed'
+        ? new Promise(function(resolve) { setTimeout(resolve, fixedDelay * 1000); })
+        : settle.wait(idleMs, deadlineMs, options.strategy, waitInflight);
+    return waiting.then(function() { timings[phase] = (timings[phase] || 0) + performance.now() - start; });
+}
+function stepWait(phase, fixedDelay) { return wait(phase, options.stepIdleMs, options.stepDeadlineMs, false, fixedDelay); }
+function fullWait(phase, fixedDelay) { return wait(phase, options.idleMs, options.deadlineMs, true, fixedDelay); }
+function visible(el) {
+    return el.getClientRects().length > 0 && getComputedStyle(el).visibility !== 'hidden';
+}
+async function run() {
+    var result = {steps: 0, clicked: 0};
+    collector.sweep(document);
+    // Scroll down in steps so lazy loaders fire
+    var body = document.body, root = document.documentElement;
+    var total = Math.max(body.scrollHeight, root.scrollHeight, body.offsetHeight, root.offsetHeight, body.clientHeight, root.clientHeight);
+    var steps = Math.max(1, Math.min(options.maxScrollSteps, Math.floor(total / (window.innerHeight || total || 1))));
+    for (var i = 0; i <= steps; i++) {
+        window.scrollTo(0, Math.floor(i * total / steps));
+        await stepWait('scroll', 0.3);
+    }
+    result.steps = steps + 1;
+    window.scrollTo(0, 0);
+    await fullWait('after_scroll', 1);
+    // Click elements that might reveal more content
+    for (var s = 0; s < options.expandSelectors.length; s++) {
+        var elements = Array.prototype.slice.call(document.querySelectorAll(options.expandSelectors[s]), 0, 3);
+        for (var j = 0; j < elements.length; j++) {
+            try {
+                if (!visible(elements[j])) continue;
+                elements[j].click();
+                result.clicked++;
+                await stepWait('expand', 0.5);
+            } catch (e) {}
+        }
+    }
+    if (result.clicked) await fullWait('after_expand', 0);
+    collector.sweep(document);
+    result.tailwind = !!(document.querySelector('.flex') && document.querySelector('.grid') && document.querySelector('[class*="text-"]'));
+    return result;
+}
+run().catch(function(error) { return {error: String(error)}; }).then(function(result) {
+    result.urls = Array.from(collector.urls);
+    result.timings = {};
+    Object.keys(timings).forEach(function(phase) { result.timings[phase] = Math.round(timings[phase]); });
+    done(result);
+});
+"""
+
+def collect_page_resources(driver, timings=None, script_timeout=30):
+    """
+    Scroll, expand and collect the page's resource URLs with one in-page async call.
     
-    for i, element in enumerate(elements_with_style):
-        style_content = element.get('style')
-        if style_content:
-            class_name = f'extracted-inline-style-{i}'
-            inline_styles[class_name] = style_content
-            # Add the class to the element
-            element['class'] = element.get('class', []) + [class_name]
-            # Remove the inline style
-            del element['style']
+    The page drives itself (COLLECT_PAGE_JS), so the whole phase costs one
+    WebDriver round trip instead of several per scroll step and click.
+    Per-phase settle waits are added to `timings` like wait_for_settle() does.
     
-    return inline_styles
+    Returns:
+        dict: 'urls' (deduplicated), 'steps', 'clicked', 'tailwind' and 'error' if the script failed part way
+    """
+    options = {
+        'strategy': SETTLE_STRATEGY,
+        'idleMs': SETTLE_IDLE_MS,
+        'deadlineMs': SETTLE_DEADLINE * 1000,
+        'stepIdleMs': SETTLE_STEP_IDLE_MS,
+        'stepDeadlineMs': SETTLE_STEP_DEADLINE * 1000,
+        'maxScrollSteps': MAX_SCROLL_STEPS,
+        'expandSelectors': EXPAND_SELECTORS
+    }
+    # Worst case every wait runs into its deadline (or fixed delay)
+    step_wait = max(SETTLE_STEP_DEADLINE, 0.5)
+    budget = 2 * max(SETTLE_DEADLINE, 1) + step_wait * (MAX_SCROLL_STEPS + 1 + 3 * len(EXPAND_SELECTORS)) + 5
+    driver.set_script_timeout(max(script_timeout, budget))
+    try:
+        result = driver.execute_async_script(COLLECT_PAGE_JS, options) or {}
+    finally:
+        driver.set_script_timeout(script_timeout)
+    if timings is not None:
+        for phase, ms in (result.get('timings') or {}).items():
+            timings[phase] = timings.get(phase, 0) + ms
+    return result
 
-def extract_inline_javascript(soup):
-    """Extract inline JavaScript from HTML content"""
-    inline_js = []
-    # Find all script tags without src attribute (inline scripts)
-    for script in soup.find_all('script'):
-        if not script.get('src') and script.string:
-            inline_js.append(script.string.strip())
-    
-    if inline_js:
-        return '\n\n/* --- INLINE SCRIPTS --- */\n\n'.join(inline_js)
-    return ""
+# Analytics, ad, session-recording and chat-widget hosts blocked while rendering
+# (Network.setBlockedURLs wildcard patterns)
+TRACKER_URL_PATTERNS = [
+    '*google-analytics.com/*', '*googletagmanager.com/*', '*doubleclick.net/*', '*googlesyndication.com/*',
+    '*googleadservices.com/*', '*connect.facebook.net/*', '*facebook.com/tr*', '*bat.bing.com/*',
+    '*ads-twitter.com/*', '*analytics.tiktok.com/*', '*snap.licdn.com/*', '*px.ads.linkedin.com/*',
+    '*hotjar.com/*', '*clarity.ms/*', '*fullstory.com/*', '*mouseflow.com/*', '*segment.com/*', '*segment.io/*',
+    '*mixpanel.com/*', '*amplitude.com/*', '*newrelic.com/*', '*nr-data.net/*', '*scorecardresearch.com/*',
+    '*quantserve.com/*', '*adnxs.com/*', '*criteo.com/*', '*criteo.net/*', '*taboola.com/*', '*outbrain.com/*',
+    '*intercom.io/*', '*intercomcdn.com/*', '*js.driftt.com/*', '*zdassets.com/*', '*client.crisp.chat/*',
+    '*embed.tawk.to/*', '*hs-analytics.net/*', '*hs-scripts.com/*'
+]
+
+def blocked_url_patterns(extra=None):
+    """URL patterns blocked while rendering: the tracker list (BLOCK_TRACKERS), BLOCKED_URL_PATTERNS and `extra`"""
+    patterns = list(TRACKER_URL_PATTERNS) if BLOCK_TRACKERS else []
+    patterns.extend(pattern.strip() for pattern in BLOCKED_URL_PATTERNS.split(',') if pattern.strip())
+    patterns.extend(extra or [])
+    return list(dict.fromkeys(patterns))
+
+def compile_url_patterns(patterns):
+    """Regex matching the same URLs as a list of Network.setBlockedURLs wildcard patterns"""
+    if not patterns:
+        return None
+    return re.compile('|'.join('^' + '.*'.join(re.escape(part) for part in pattern.split('*')) + '$' for pattern in patterns))
+
+# CDP resource types whose bodies are taken from the browser instead of re-downloaded
+BROWSER_CAPTURE_TYPES = {'Stylesheet', 'Script', 'Image', 'Font', 'Media'}
 
-def extract_assets(html_content, base_url, session_obj=None, headers=None):
+def read_network_log(driver):
     """
-    Extract all assets (CSS, JS, images, fonts) from HTML content.
+    Drain Chrome's performance log into one record per request.
     
-    Args:
-        html_content: HTML content as string
-        base_url: Base URL for resolving relative paths
-        session_obj: Optional requests session object
-        headers: Optional headers for requests
-        
     Returns:
-        dict: Dictionary containing extracted assets by type
+        OrderedDict: requestId -> {'urls', 'response', 'type', 'started', 'ended', 'finished', 'blocked', 'credentialed'},
+        with `urls` listing every URL of a redirect chain and times in seconds
     """
-    if not html_content:
-        return {}
+    requests_by_id = OrderedDict()
+    for entry in driver.get_log('performance'):
+        try:
+            message = json.loads(entry['message'])['message']
+        except (KeyError, ValueError):
+            continue
+        method = message.get('method')
+        params = message.get('params', {})
+        if method == 'Network.requestWillBeSent':
+            info = requests_by_id.setdefault(params['requestId'], {'urls': []})
+            info['urls'].append(params['request']['url'])
+            info.setdefault('started', params.get('timestamp'))
+        elif method == 'Network.requestWillBeSentExtraInfo':
+            # May arrive before requestWillBeSent; carries the cookies actually sent
+            info = requests_by_id.setdefault(params['requestId'], {'urls': []})
+            if any(not cookie.get('blockedReasons') for cookie in params.get('associatedCookies') or []):
+                info['credentialed'] = True
+        elif params.get('requestId') not in requests_by_id:
+            continue
+        elif method == 'Network.responseReceived':
+            info = requests_by_id[params['requestId']]
+            info['response'] = params['response']
+            info['type'] = params.get('type')
+        elif method == 'Network.loadingFinished':
+            requests_by_id[params['requestId']].update(finished=True, ended=params.get('timestamp'))
+        elif method == 'Network.loadingFailed' and params.get('blockedReason') == 'inspector':
+            # Blocked by Network.setBlockedURLs
+            requests_by_id[params['requestId']]['blocked'] = True
+    return requests_by_id
+
+def blocked_request_report(network_log):
+    """
+    Count requests stopped by Network.setBlockedURLs, per host.
     
-    try:
-        soup = BeautifulSoup(html_content, 'html.parser')
-        assets = {
-            'css': [],
-            'js': [],
-            'images': [],
-            'fonts': [],
-            'other': []
-        }
-        
-        # Extract CSS files
-        for link in soup.find_all('link', rel='stylesheet'):
-            href = link.get('href')
-            if href:
-                try:
-                    url = urljoin(base_url, href)
-                    content = download_asset(url, base_url, headers, session_obj)
-                    if content:
-                        assets['css'].append({
-                            'url': url,
-                            'content': content,
-                            'original_path': href
-                        })
-                except Exception as e:
-                    print(f"Warning: Failed to extract CSS from {href}: {str(e)}")
-        
-        # Extract inline CSS
-        for style in soup.find_all('style'):
-            if style.string:
-                assets['css'].append({
-                    'url': None,
-                    'content': style.string,
-                    'original_path': 'inline'
-                })
-        
-        # Extract JavaScript files
-        for script in soup.find_all('script', src=True):
-            src = script.get('src')
-            if src:
-                try:
-                    url = urljoin(base_url, src)
-                    content = download_asset(url, base_url, headers, session_obj)
-                    if content:
-                        assets['js'].append({
-                            'url': url,
-                            'content': content,
-                            'original_path': src
-                        })
-                except Exception as e:
-                    print(f"Warning: Failed to extract JS from {src}: {str(e)}")
-        
-        # Extract inline JavaScript
-        for script in soup.find_all('script'):
-            if script.string and not script.get('src'):
-                assets['js'].append({
-                    'url': None,
-                    'content': script.string,
-                    'original_path': 'inline'
-                })
-        
-        # Extract images
-        for img in soup.find_all(['img', 'source']):
-            src = img.get('src') or img.get('srcset')
-            if src:
-                try:
-                    # Handle srcset
-                    if 'srcset' in img.attrs:
-                        srcset = img['srcset'].split(',')
-                        for src_item in srcset:
-                            url = src_item.strip().split(' ')[0]
-                            url = urljoin(base_url, url)
-                            content = download_asset(url, base_url, headers, session_obj)
-                            if content:
-                                assets['images'].append({
-                                    'url': url,
-                                    'content': content,
-                                    'original_path': src_item.strip()
-                                })
-                    else:
-                        url = urljoin(base_url, src)
-                        content = download_asset(url, base_url, headers, session_obj)
-                        if content:
-                            assets['images'].append({
-                                'url': url,
-                                'content': content,
-                                'original_path': src
-                            })
-                except Exception as e:
-                    print(f"Warning: Failed to extract image from {src}: {str(e)}")
-        
-        # Extract fonts
-        for font in soup.find_all(['link', 'style']):
-            if font.name == 'link' and 'font' in font.get('rel', []):
-                href = font.get('href')
-                if href:
-                    try:
-                        url = urljoin(base_url, href)
-                        content = download_asset(url, base_url, headers, session_obj)
-                        if content:
-                            assets['fonts'].append({
-                                'url': url,
-                                'content': content,
-                                'original_path': href
-                            })
-                    except Exception as e:
-                        print(f"Warning: Failed to extract font from {href}: {str(e)}")
-            
-            # Extract @font-face declarations
-            if font.name == 'style' and font.string:
-                try:
-                    font_faces = re.findall(r'@font-face\s*{([^}]*)}', font.string)
-                    for font_face in font_faces:
-                        src_match = re.search(r'src:\s*url\(([^)]+)\)', font_face)
-                        if src_match:
-                            font_url = src_match.group(1).strip('"\'').strip()
-                            url = urljoin(base_url, font_url)
-                            content = download_asset(url, base_url, headers, session_obj)
-                            if content:
-                                assets['fonts'].append({
-                                    'url': url,
-                                    'content': content,
-                                    'original_path': font_url
-                                })
-                except Exception as e:
-                    print(f"Warning: Failed to extract @font-face: {str(e)}")
-        
-        # Extract other assets (videos, audio, etc.)
-        for media in soup.find_all(['video', 'audio', 'source']):
-            src = media.get('src')
-            if src:
-                try:
-                    url = urljoin(base_url, src)
-                    content = download_asset(url, base_url, headers, session_obj)
-                    if content:
-                        assets['other'].append({
-                            'url': url,
-                            'content': content,
-                            'original_path': src,
-                            'type': media.name
-                        })
-                except Exception as e:
-                    print(f"Warning: Failed to extract media from {src}: {str(e)}")
-        
-        return assets
-        
-    except Exception as e:
-        print(f"Error in extract_assets: {str(e)}")
-        traceback.print_exc()
-        return {}
+    The time saved is an estimate: the blocked requests never ran, so each
+    is costed at the median duration of the requests that did complete.
+    """
+    blocked_hosts = {}
+    durations = []
+    for info in network_log.values():
+        if info.get('blocked'):
+            host = urlparse(info['urls'][-1]).netloc.lower()
+            blocked_hosts[host] = blocked_hosts.get(host, 0) + 1
+        elif info.get('finished') and info.get('started') is not None and info.get('ended') is not None:
+            durations.append(info['ended'] - info['started'])
+    blocked = sum(blocked_hosts.values())
+    median = sorted(durations)[len(durations) // 2] if durations else 0.0
+    return {
+        'requests': blocked,
+        'hosts': dict(sorted(blocked_hosts.items(), key=lambda item: -item[1])),
+        'estimated_ms_saved': round(blocked * median * 1000)
+    }
 
-def create_zip_file(html_content, assets, url, session_obj, headers, screenshots=None):
+def capture_browser_responses(driver, captured, network_log, max_size=None):
     """
-    Create a ZIP file containing all extracted assets.
+    Copy the bodies of the assets the browser loaded into `captured` (canonical URL -> AssetBody).
+    
+    Responses come from read_network_log() and their bodies from
+    Network.getResponseBody, with the original status line and headers.
+    A redirected request is recorded under both its original and final URL.
+    Bodies Chrome has already evicted are skipped; those URLs fall back to
+    HTTP downloads.
     
-    Args:
-        html_content: Main HTML content
-        assets: Dictionary of extracted assets
-        url: Original URL
-        session_obj: Requests session object
-        headers: Headers for requests
-        screenshots: Optional screenshots
-        
     Returns:
-        str: Path to the created ZIP file
+        int: Number of bodies captured
     """
-    try:
-        # Create a temporary directory for the files
-        temp_dir = tempfile.mkdtemp()
-        zip_path = os.path.join(temp_dir, 'website.zip')
-        
-        # Create a ZIP file with compression
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=9) as zip_file:
-            # Add main HTML file
-            zip_file.writestr('index.html', html_content)
-            
-            # Create directories for different asset types
-            asset_dirs = {
-                'css': 'assets/css',
-                'js': 'assets/js',
-                'images': 'assets/images',
-                'fonts': 'assets/fonts',
-                'other': 'assets/other'
-            }
-            
-            # Track used filenames to avoid duplicates
-            used_filenames = set()
-            
-            # Add assets to ZIP file
-            for asset_type, asset_list in assets.items():
-                if asset_type in asset_dirs:
-                    dir_path = asset_dirs[asset_type]
-                    
-                    for asset in asset_list:
-                        try:
-                            if isinstance(asset, dict) and 'content' in asset:
-                                content = asset['content']
-                                if content:
-                                    # Generate a unique filename
-                                    original_path = asset.get('original_path', '')
-                                    filename = os.path.basename(original_path)
-                                    if not filename:
-                                        filename = f"asset_{uuid.uuid4().hex[:8]}"
-                                    
-                                    # Add file extension if missing
-                                    if '.' not in filename:
-                                        ext = mimetypes.guess_extension(asset.get('type', ''))
-                                        if ext:
-                                            filename += ext
-                                    
-                                    # Handle duplicate filenames
-                                    base_name, ext = os.path.splitext(filename)
-                                    counter = 1
-                                    while filename in used_filenames:
-                                        filename = f"{base_name}_{counter}{ext}"
-                                        counter += 1
-                                    used_filenames.add(filename)
-                                    
-                                    # Create full path
-                                    file_path = os.path.join(dir_path, filename)
-                                    
-                                    # Handle large files
-                                    if isinstance(content, bytes) and len(content) > 10 * 1024 * 1024:  # 10MB
-                                        # For large files, write to a temporary file first
-                                        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                                            temp_file.write(content)
-                                            zip_file.write(temp_file.name, file_path)
-                                            os.unlink(temp_file.name)
-                                    else:
-                                        zip_file.writestr(file_path, content)
-                        except Exception as e:
-                            print(f"Warning: Failed to add {asset_type} asset to ZIP: {str(e)}")
-            
-            # Add screenshots if available
-            if screenshots:
-                for name, screenshot in screenshots.items():
-                    try:
-                        if isinstance(screenshot, bytes):
-                            zip_file.writestr(f'screenshots/{name}.png', screenshot)
-                    except Exception as e:
-                        print(f"Warning: Failed to add screenshot {name}: {str(e)}")
-            
-            # Add metadata
-            metadata = {
-                'url': url,
-                'timestamp': datetime.now().isoformat(),
-                'asset_counts': {k: len(v) for k, v in assets.items()}
-            }
-            zip_file.writestr('metadata.json', json.dumps(metadata, indent=2))
-        
-        return zip_path
-        
-    except Exception as e:
-        print(f"Error creating ZIP file: {str(e)}")
-        traceback.print_exc()
-        return None
+    max_size = max_size or ASSET_MAX_SIZE
+    count = 0
+    for request_id, info in network_log.items():
+        response = info.get('response')
+        if not response or not info.get('finished') or info.get('type') not in BROWSER_CAPTURE_TYPES:
+            continue
+        if response.get('status') != 200 or not response.get('url', '').startswith(('http://', 'https://')):
+            continue
+        try:
+            result = driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+        except WebDriverException:
+            continue
+        headers = requests.structures.CaseInsensitiveDict(response.get('headers') or {})
+        content_type = headers.get('Content-Type') or response.get('mimeType', '')
+        encoding = None
+        if 'charset=' in content_type:
+            encoding = content_type.split('charset=')[1].split(';')[0].strip()
+        if result.get('base64Encoded'):
+            data = base64.b64decode(result['body'])
+        else:
+            # Text bodies come back decoded; re-encode them in their declared charset
+            try:
+                data = result['body'].encode(encoding or 'utf-8')
+            except (LookupError, UnicodeEncodeError):
+                data = result['body'].encode('utf-8')
+                encoding = 'utf-8'
+        if not data or len(data) > max_size:
+            continue
+        body = AssetBody(data=data, content_type=content_type, encoding=encoding, url=response['url'],
+                         headers=headers, status=200, reason=response.get('statusText') or 'OK',
+                         credentialed=bool(info.get('credentialed')))
+        for url in [response['url']] + info['urls']:
+            if url.startswith(('http://', 'https://')):
+                captured.setdefault(canonicalize_url(url), body)
+        count += 1
+    return count
 
-def extract_with_selenium(url, timeout=30):
+def extract_with_selenium(url, timeout=30, timings=None, captured=None, profile='full', block_patterns=None, blocked=None,
+                          final=None):
     """
     Extract rendered HTML content using Selenium with Chrome/Chromium.
     This method will execute JavaScript and capture the fully rendered page structure.
@@ -929,7 +4270,13 @@ def extract_with_selenium(url, timeout=30):
     Args:
         url: URL to fetch
         timeout: Maximum time to wait for page to load (seconds)
-        
+        timings: Optional dict that receives the milliseconds each phase spent waiting for the page to settle
+        captured: Optional dict that receives the asset bodies the browser loaded (canonical URL -> AssetBody)
+        profile: 'full', or 'dom' for markup and CSS only (eager page load, no images)
+        block_patterns: Extra URL patterns to block on top of blocked_url_patterns()
+        blocked: Optional dict that receives the blocked request counts (see blocked_request_report())
+        final: Optional dict that receives the page's URL after redirects and client-side navigation ('url')
+    
     Returns:
         tuple: (html_content, discovered_urls, None)
     """
@@ -937,297 +4284,337 @@ def extract_with_selenium(url, timeout=30):
         return None, None, {"error": "Selenium is not installed. Run: pip install selenium webdriver-manager"}
     
     try:
-        print("Setting up advanced Chrome options...")
-        # Set up Chrome options with anti-detection measures
-        chrome_options = Options()
-        chrome_options.add_argument("--headless=new")  # Use new headless mode
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--window-size=1920,1080")
-        chrome_options.add_argument("--disable-notifications")
-        chrome_options.add_argument("--disable-extensions")
-        chrome_options.add_argument("--disable-infobars")
-        chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-        chrome_options.add_argument("--disable-features=IsolateOrigins,site-per-process")  # Improve performance
-        chrome_options.add_argument("--disable-site-isolation-trials")
-        chrome_options.add_argument("--disable-web-security")  # Allow cross-origin requests
-        chrome_options.add_argument("--allow-running-insecure-content")
-        
-        # Advanced anti-detection measures
-        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        chrome_options.add_experimental_option("useAutomationExtension", False)
-        
-        # Add modern user agent and additional headers
-        chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36")
-        
-        # Initialize the Chrome driver with retry mechanism
-        max_retries = 3
-        retry_count = 0
-        driver = None
-        
-        while retry_count < max_retries:
-            try:
-                service = Service(ChromeDriverManager().install())
-                driver = webdriver.Chrome(service=service, options=chrome_options)
-                break
-            except Exception as e:
-                retry_count += 1
-                print(f"Attempt {retry_count} failed: {str(e)}")
-                if retry_count == max_retries:
-                    print("All retry attempts failed. Trying alternative initialization...")
-                    try:
-                        driver = webdriver.Chrome(options=chrome_options)
-                    except Exception as alt_error:
-                        return None, None, {"error": f"Failed to initialize Chrome WebDriver: {str(alt_error)}"}
-                time.sleep(2)  # Wait before retrying
-        
-        # Set page load timeout and script timeout
-        driver.set_page_load_timeout(timeout)
-        driver.set_script_timeout(timeout)
-        
-        # Used to store discovered URLs
-        discovered_urls = []
-        
-        try:
-            print(f"Navigating to {url}...")
-            driver.get(url)
+        # Lease a warm browser instead of starting Chrome for this request
+        pool = dom_browser_pool if profile == 'dom' else browser_pool
+        with pool.session() as browser:
+            driver = browser.driver
+            print(f"Using pooled {profile} browser (waited {browser.wait * 1000:.0f} ms, use {browser.uses + 1} of {pool.max_uses})")
             
-            # Wait for page to be fully loaded with multiple conditions
-            try:
-                WebDriverWait(driver, timeout).until(
-                    lambda d: d.execute_script("return document.readyState") == "complete"
-                )
-                WebDriverWait(driver, timeout).until(
-                    EC.presence_of_element_located((By.TAG_NAME, "body"))
-                )
-            except Exception as e:
-                print(f"Warning: Timeout waiting for page load: {str(e)}")
+            # Set page load timeout and script timeout
+            driver.set_page_load_timeout(timeout)
+            driver.set_script_timeout(timeout)
             
-            # Execute JavaScript to improve performance and disable animations
-            try:
-                driver.execute_script("""
-                    // Disable animations and transitions
-                    var style = document.createElement('style');
-                    style.type = 'text/css';
-                    style.innerHTML = '* { animation-duration: 0.001s !important; transition-duration: 0.001s !important; }';
-                    document.getElementsByTagName('head')[0].appendChild(style);
-                    
-                    // Force layout recalculation
-                    document.body.offsetHeight;
-                    
-                    // Wait for any pending network requests
-                    return new Promise((resolve) => {
-                        if (window.performance && window.performance.getEntriesByType) {
-                            const resources = window.performance.getEntriesByType('resource');
-                            const pending = resources.filter(r => !r.responseEnd);
-                            if (pending.length === 0) {
-                                resolve();
-                            } else {
-                                setTimeout(resolve, 1000);
-                            }
-                        } else {
-                            resolve();
-                        }
-                    });
-                """)
-            except Exception as e:
-                print(f"Warning: JavaScript execution failed: {str(e)}")
+            # Used to store discovered URLs
+            discovered_urls = []
             
-            # Wait for page to be fully rendered
-            print("Waiting for dynamic content to load...")
             try:
-                # Wait a bit for any dynamic content to load
-                time.sleep(5)
+                # Track network and DOM activity, and collect resources, from the page's first script on
+                try:
+                    driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': SETTLE_SHIM_JS + PAGE_COLLECTOR_JS})
+                except Exception as e:
+                    print(f"Warning: could not install the settle tracker before navigation: {str(e)}")
                 
-                # Wait for network to be idle
-                driver.execute_script("return window.performance.getEntriesByType('resource').length")
-                time.sleep(2)  # Wait a bit more after resources are loaded
-            except Exception as e:
-                print(f"Warning while waiting for dynamic content: {str(e)}")
-            
-            # Implement advanced scrolling to trigger lazy loading
-            print("Performing advanced scrolling to trigger lazy loading...")
-            try:
-                # Get the total height of the page
-                total_height = driver.execute_script("return Math.max(document.body.scrollHeight, document.documentElement.scrollHeight, document.body.offsetHeight, document.documentElement.offsetHeight, document.body.clientHeight, document.documentElement.clientHeight);")
+                try:
+                    # Drop events left over from the browser's previous lease and keep
+                    # enough response bodies around to read them after the page settles
+                    driver.get_log('performance')
+                    driver.execute_cdp_cmd('Network.enable', {
+                        'maxTotalBufferSize': BROWSER_CAPTURE_BUFFER_MB * 1024 * 1024,
+                        'maxResourceBufferSize': min(ASSET_MAX_SIZE, BROWSER_CAPTURE_BUFFER_MB * 1024 * 1024)
+                    })
+                    # Trackers, ads and widgets never load (set on every lease, so it never carries over)
+                    patterns = blocked_url_patterns(block_patterns)
+                    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+                    if patterns:
+                        print(f"Blocking {len(patterns)} URL patterns")
+                except Exception as e:
+                    print(f"Warning: could not set up network capture and blocking: {str(e)}")
                 
-                # Scroll down the page in steps
-                viewport_height = driver.execute_script("return window.innerHeight")
-                scroll_steps = max(1, min(20, total_height // viewport_height))  # Cap at 20 steps
+                print(f"Navigating to {url}...")
+                driver.get(url)
                 
-                for i in range(scroll_steps + 1):
-                    scroll_position = (i * total_height) // scroll_steps
-                    driver.execute_script(f"window.scrollTo(0, {scroll_position});")
-                    
-                    # Small pause to allow content to load
-                    time.sleep(0.3)
-                    
-                    # Extract resources after each scroll
-                    try:
-                        urls = driver.execute_script("""
-                            var resources = [];
-                            // Get all link hrefs
-                            document.querySelectorAll('link[rel="stylesheet"], link[as="style"]').forEach(function(el) {
-                                if (el.href) resources.push(el.href);
-                            });
-                            // Get all script srcs
-                            document.querySelectorAll('script[src]').forEach(function(el) {
-                                if (el.src) resources.push(el.src);
-                            });
-                            // Get all image srcs
-                            document.querySelectorAll('img[src]').forEach(function(el) {
-                                if (el.src && !el.src.startsWith('data:')) resources.push(el.src);
-                            });
-                            return resources;
-                        """)
-                        discovered_urls.extend(urls)
-                    except Exception as res_error:
-                        print(f"Error extracting resources during scroll: {str(res_error)}")
+                # Wait for page to be fully loaded with multiple conditions; the DOM
+                # profile only needs the parsed document, the settle wait covers the rest
+                ready_states = ('interactive', 'complete') if profile == 'dom' else ('complete',)
+                try:
+                    WebDriverWait(driver, timeout).until(
+                        lambda d: d.execute_script("return document.readyState") in ready_states
+                    )
+                    WebDriverWait(driver, timeout).until(
+                        EC.presence_of_element_located((By.TAG_NAME, "body"))
+                    )
+                except Exception as e:
+                    print(f"Warning: Timeout waiting for page load: {str(e)}")
                 
-                # Scroll back to top
-                driver.execute_script("window.scrollTo(0, 0);")
+                # Execute JavaScript to improve performance and disable animations
+                try:
+                    driver.execute_script("""
+                        // Disable animations and transitions
+                        var style = document.createElement('style');
+                        style.type = 'text/css';
+                        style.innerHTML = '* { animation-duration: 0.001s !important; transition-duration: 0.001s !important; }';
+                        document.getElementsByTagName('head')[0].appendChild(style);
+                        
+                        // Force layout recalculation
+                        document.body.offsetHeight;
+                    """)
+                except Exception as e:
+                    print(f"Warning: JavaScript execution failed: {str(e)}")
                 
-                # Wait for everything to settle after scrolling
-                time.sleep(1)
-            except Exception as scroll_error:
-                print(f"Error during page scrolling: {str(scroll_error)}")
-            
-            # Try to click on common elements that might reveal more content
-            try:
-                # Common UI elements that might reveal more content when clicked
-                for selector in [
-                    'button.load-more', '.show-more', '.expand', '.accordion-toggle', 
-                    '[aria-expanded="false"]', '.menu-toggle', '.navbar-toggler',
-                    '.mobile-menu-button', '.hamburger', '[data-toggle="collapse"]'
-                ]:
-                    try:
-                        elements = driver.find_elements(By.CSS_SELECTOR, selector)
-                        for element in elements[:3]:  # Limit to first 3 matches of each type
-                            if element.is_displayed():
-                                driver.execute_script("arguments[0].click();", element)
-                                time.sleep(0.5)  # Wait for content to appear
-                    except Exception as click_error:
-                        # Skip any errors and continue with next selector
-                        continue
-                print("Attempted to expand hidden content")
-            except Exception as interact_error:
-                print(f"Error expanding content: {str(interact_error)}")
-            
-            # Get the final HTML content after all JavaScript executed
-            html_content = driver.page_source
-            print(f"HTML content captured ({len(html_content)} bytes)")
-            
-            # Extract URLs for modern frameworks
-            try:
-                # React/Next.js specific resources
-                next_js_urls = driver.execute_script("""
-                    var resources = [];
-                    // Find Next.js specific scripts
-                    document.querySelectorAll('script[src*="_next"]').forEach(function(el) {
-                        resources.push(el.src);
-                    });
-                    // Find chunk files
-                    document.querySelectorAll('script[src*="chunk"]').forEach(function(el) {
-                        resources.push(el.src);
-                    });
-                    // Find webpack files
-                    document.querySelectorAll('script[src*="webpack"]').forEach(function(el) {
-                        resources.push(el.src);
-                    });
-                    // Find hydration scripts
-                    document.querySelectorAll('script[src*="hydration"]').forEach(function(el) {
-                        resources.push(el.src);
-                    });
-                    return resources;
-                """)
-                discovered_urls.extend(next_js_urls)
+                # Wait for page to be fully rendered
+                print("Waiting for dynamic content to load...")
+                if not wait_for_settle(driver, 'load', timings, fixed_delay=7):
+                    print(f"Warning: page was still busy after {SETTLE_DEADLINE:.0f}s")
                 
-                # Angular specific resources
-                angular_urls = driver.execute_script("""
-                    var resources = [];
-                    // Find Angular specific scripts
-                    document.querySelectorAll('script[src*="runtime"]').forEach(function(el) {
-                        resources.push(el.src);
-                    });
-                    document.querySelectorAll('script[src*="polyfills"]').forEach(function(el) {
-                        resources.push(el.src);
-                    });
-                    document.querySelectorAll('script[src*="main"]').forEach(function(el) {
-                        resources.push(el.src);
-                    });
-                    return resources;
-                """)
-                discovered_urls.extend(angular_urls)
+                # Scroll, expand and collect resources in the page itself
+                print("Scrolling and expanding content to trigger lazy loading...")
+                try:
+                    collected = collect_page_resources(driver, timings, timeout)
+                    discovered_urls.extend(collected.get('urls') or [])
+                    if collected.get('error'):
+                        print(f"Error while scrolling and expanding content: {collected['error']}")
+                    print(f"Visited {collected.get('steps', 0)} scroll positions, clicked {collected.get('clicked', 0)} expanders")
+                    if collected.get('tailwind'):
+                        print("Tailwind CSS detected, including appropriate CSS files")
+                except Exception as collect_error:
+                    print(f"Error collecting page resources: {str(collect_error)}")
                 
-                # Get CSS variables for Tailwind detection
-                tailwind_check = driver.execute_script("""
-                    var style = window.getComputedStyle(document.body);
-                    var hasTailwind = false;
-                    // Check for common Tailwind classes
-                    if (document.querySelector('.flex') && 
-                        document.querySelector('.grid') && 
-                        document.querySelector('.text-')) {
-                        hasTailwind = true;
-                    }
-                    return hasTailwind;
-                """)
+                if timings:
+                    print("Settle waits: " + ", ".join(f"{phase} {ms} ms" for phase, ms in timings.items()))
                 
-                if tailwind_check:
-                    print("Tailwind CSS detected, including appropriate CSS files")
-            except Exception as framework_error:
-                print(f"Error detecting framework resources: {str(framework_error)}")
-            
-            # Remove duplicates from discovered URLs
-            discovered_urls = list(set(discovered_urls))
-            print(f"Discovered {len(discovered_urls)} resource URLs")
-            
-            return html_content, discovered_urls, None
+                # Get the final HTML content after all JavaScript executed
+                html_content = driver.page_source
+                if final is not None:
+                    final['url'] = driver.current_url
+                
+                try:
+                    network_log = read_network_log(driver)
+                    # Remember every origin the page touched so the pool can clear its storage
+                    for info in network_log.values():
+                        for request_url in info['urls']:
+                            parsed = urlparse(request_url)
+                            if parsed.scheme in ('http', 'https'):
+                                browser.origins.add(f"{parsed.scheme}://{parsed.netloc}")
+                    report = blocked_request_report(network_log)
+                    if blocked is not None:
+                        blocked.update(report)
+                    if report['requests']:
+                        print(f"Blocked {report['requests']} requests (about {report['estimated_ms_saved']} ms saved)")
+                    # Keep the bodies the browser already downloaded
+                    if captured is not None:
+                        print(f"Captured {capture_browser_responses(driver, captured, network_log)} asset bodies from the browser")
+                except Exception as e:
+                    print(f"Warning: could not read the browser's network log: {str(e)}")
+                print(f"HTML content captured ({len(html_content)} bytes)")
+                
+                # Remove duplicates and blocked trackers from discovered URLs
+                blocked_pattern = compile_url_patterns(blocked_url_patterns(block_patterns))
+                discovered_urls = [u for u in discovered_urls if not (blocked_pattern and blocked_pattern.match(u))]
+                print(f"Discovered {len(discovered_urls)} resource URLs")
+                
+                return html_content, discovered_urls, None
             
-        except TimeoutException:
-            print(f"Timeout while loading {url}")
-            return None, None, {"error": "Timeout while loading page"}
-        except WebDriverException as e:
-            print(f"Selenium error: {str(e)}")
-            return None, None, {"error": f"Selenium error: {str(e)}"}
-        finally:
-            # Close the browser
-            print("Closing WebDriver...")
-            driver.quit()
+            except TimeoutException:
+                print(f"Timeout while loading {url}")
+                return None, None, {"error": "Timeout while loading page"}
+            except WebDriverException as e:
+                print(f"Selenium error: {str(e)}")
+                browser.healthy = False
+                return None, None, {"error": f"Selenium error: {str(e)}"}
     
     except Exception as e:
         print(f"Error setting up Selenium: {str(e)}")
         return None, None, {"error": f"Error setting up Selenium: {str(e)}"}
 
-def fix_relative_urls(html_content, base_url):
-    """Fix relative URLs in the HTML content"""
-    soup = BeautifulSoup(html_content, 'html.parser')
+def fix_relative_urls(document, base_url):
+    """
+    Fix relative URLs in a parsed document and return the resulting HTML.
+    
+    This rewrites attributes in the shared DOM, so it should run after the
+    other stages have read the original references.
+    """
+    document = parse_document(document, base_url)
+    scan = document.scan()
     
     # Fix relative URLs for links
-    for link in soup.find_all('a', href=True):
+    for link in scan['anchors']:
         href = link['href']
         if href.startswith('/'):
             link['href'] = urljoin(base_url, href)
     
     # Fix relative URLs for images
-    for img in soup.find_all('img', src=True):
-        src = img['src']
-        if not src.startswith(('http://', 'https://', 'data:')):
+    for img in scan['images']:
+        src = img.get('src') if img.name == 'img' else None
+        if src is not None and not src.startswith(('http://', 'https://', 'data:')):
             img['src'] = urljoin(base_url, src)
     
     # Fix relative URLs for scripts
-    for script in soup.find_all('script', src=True):
-        src = script['src']
-        if not src.startswith(('http://', 'https://', 'data:')):
+    for script in scan['scripts']:
+        src = script.get('src')
+        if src is not None and not src.startswith(('http://', 'https://', 'data:')):
             script['src'] = urljoin(base_url, src)
     
     # Fix relative URLs for stylesheets
-    for link in soup.find_all('link', href=True):
-        href = link['href']
-        if not href.startswith(('http://', 'https://', 'data:')):
+    for link in scan['links']:
+        href = link.get('href')
+        if href is not None and not href.startswith(('http://', 'https://', 'data:')):
             link['href'] = urljoin(base_url, href)
     
-    return str(soup)
+    return str(document.soup)
+
+def run_extraction(url, archive, session_obj, use_selenium=False, pipeline=False, parser=None, render_profile='full',
+                   block_patterns=None):
+    """
+    Extract a page and its assets into an archive writer (any ArchiveWriter
+    backend) and close it. Members are written as soon as they are ready, so
+    streaming backends deliver them while the extraction is still running.
+    `render_profile` and `block_patterns` apply when the page is rendered
+    with Selenium (see extract_with_selenium()).
+    Returns the metadata written to metadata.json; failures that should be
+    reported to the client raise ExtractionError.
+    """
+    stats = ExtractionStats()
+    html_content = None
+    document = None
+    downloader = None
+    assets = None
+    base_url = url
+    fetch = {'method': None, 'escalation': None, 'profile': render_profile, 'settle_ms': {}, 'blocked': {}}
+    captured = {}  # asset bodies recorded by the browser
+    discovered = []  # resource URLs the browser saw the page reference or load
+    start = time.perf_counter()
+    
+    with archive:
+        # Use Selenium for rendering if requested and available
+        if use_selenium and SELENIUM_AVAILABLE:
+            print("Using Selenium for advanced rendering...")
+            final = {}
+            html_content, additional_urls, error_info = extract_with_selenium(
+                url, timings=fetch['settle_ms'], captured=captured, profile=render_profile,
+                block_patterns=block_patterns, blocked=fetch['blocked'], final=final
+            )
+            fetch['method'] = 'selenium'
+            # Relative URLs in the rendered page resolve against where the browser ended up
+            base_url = final.get('url') or url
+            discovered = additional_urls or []
+            
+            if not html_content:
+                print("Selenium extraction failed, falling back to regular request")
+        elif pipeline:
+            print("Using pipelined extraction...")
+            try:
+                html_content, document, assets = extract_pipelined(
+                    url, session_obj, parser, stats,
+                    on_asset=archive.add_asset
+                )
+                base_url = document.base_url
+                fetch['method'] = 'pipeline'
+            except ArchiveStreamClosed:
+                raise
+            except Exception as e:
+                print(f"Pipelined extraction failed: {str(e)}")
+                html_content, document = None, None
+        
+        if not html_content:
+            # Plain HTTP fetch; the browser is only started for pages that need it
+            try:
+                html_content, base_url = fetch_document(url, session_obj)
+                fetch['method'] = 'http'
+            except requests.RequestException as e:
+                print(f"HTTP fetch failed: {str(e)}")
+            
+            if html_content and not use_selenium:
+                try:
+                    document = parse_document(html_content, base_url, parser)
+                    fetch['escalation'] = detect_js_shell(document)
+                except Exception as e:
+                    print(f"Error checking for a JavaScript shell: {str(e)}")
+                if fetch['escalation'] and SELENIUM_AVAILABLE:
+                    print(f"Page looks JavaScript-rendered ({fetch['escalation']}), rendering with Selenium...")
+                    final = {}
+                    rendered_html, additional_urls, error_info = extract_with_selenium(
+                        url, timings=fetch['settle_ms'], captured=captured, profile=render_profile,
+                        block_patterns=block_patterns, blocked=fetch['blocked'], final=final
+                    )
+                    if rendered_html:
+                        html_content, document, base_url = rendered_html, None, final.get('url') or url
+                        discovered = additional_urls or []
+                        fetch['method'] = 'selenium'
+                    else:
+                        print("Selenium rendering failed, keeping the HTTP response")
+                elif fetch['escalation']:
+                    print(f"Page looks JavaScript-rendered ({fetch['escalation']}) but Selenium is not available")
+        fetch['ms'] = round((time.perf_counter() - start) * 1000)
+        print(f"Fetched page via {fetch['method']} in {fetch['ms']} ms")
+        
+        # Safety check - make sure we have HTML content
+        if not html_content or len(html_content) < 100:
+            raise ExtractionError('Failed to extract valid HTML content from the website', 400)
+        
+        if downloader is None and assets is None:
+            try:
+                # Parse the HTML once; every stage below shares this document
+                if document is None:
+                    document = parse_document(html_content, base_url, parser)
+                
+                print("\nExtracting assets...")
+                # Queue the asset downloads; they run while the page itself is archived
+                downloader = queue_assets(document, base_url, session_obj, None, stats=stats, captured=captured,
+                                          discovered=discovered)
+            except Exception as e:
+                traceback.print_exc()
+                raise ExtractionError(f'Error extracting assets: {str(e)}')
+        
+        # Page metadata and component summary (read before URLs are rewritten)
+        try:
+            page_metadata = extract_metadata(document, base_url)
+            components = extract_component_structure(document)
+            repeated_structures = find_repeated_structures(document)
+        except Exception as e:
+            print(f"Error extracting page metadata: {str(e)}")
+            page_metadata, components, repeated_structures = {}, {}, []
+        
+        # Try to fix relative URLs in the HTML
+        try:
+            print("\nFixing relative URLs...")
+            fixed_html = fix_relative_urls(document, base_url)
+            print("Relative URLs fixed")
+        except Exception as e:
+            print(f"Error fixing URLs: {str(e)}")
+            fixed_html = html_content
+        
+        # Add main HTML file
+        print("\nWriting archive...")
+        archive.add('index.html', fixed_html, 'html', 'text/html')
+        
+        # Add each asset as soon as its download finishes
+        if downloader is not None:
+            for asset_type, asset in downloader.completed():
+                archive.add_asset(asset_type, asset)
+            assets = downloader.collect()
+        
+        archive.flush()
+        if captured:
+            fetch['browser_captured'] = stats.get('browser_captured')
+            fetch['http_fallbacks'] = stats.get('browser_fallbacks')
+            print(f"Assets from the browser: {fetch['browser_captured']}, downloaded over HTTP: {fetch['http_fallbacks']}")
+        cache_report = stats.cache_report()
+        print(f"Asset cache: {cache_report['hit_rate']:.0%} hit rate, {cache_report['bytes_saved']} bytes saved")
+        # The page is already streaming, so a page without assets still yields a valid archive
+        assets = assets or {}
+        if not any(assets.values()):
+            print("Warning: no assets were downloaded; the archive holds the page only")
+        
+        # Add metadata
+        metadata = {
+            'url': url,
+            'timestamp': datetime.now().isoformat(),
+            'fetch': fetch,
+            'asset_counts': {k: len(v) for k, v in assets.items()},
+            'cache': cache_report,
+            'compression': archive.report.as_dict(),
+            'page': page_metadata,
+            'component_counts': {k: len(v) for k, v in components.items()},
+            'repeated_structures': repeated_structures
+        }
+        archive.add('metadata.json', json.dumps(metadata, indent=2), 'json', 'application/json')
+    return metadata
+
+
+@app.before_request
+def warm_browser_pool_on_first_request():
+    """Warm the pool in processes started without main(), such as WSGI servers"""
+    warm_browser_pool()
 
 @app.route('/')
 def index():
@@ -1240,13 +4627,34 @@ def clear_session():
     session.clear()
     return jsonify({'message': 'Session cleared'})
 
+@app.route('/stats')
+def stats():
+    """Expose process-wide download statistics for tuning"""
+    return jsonify({
+        'http_pool': http_client.stats(),
+        'rate_limits': host_rate_limiter.snapshot(),
+        'asset_cache': asset_cache.stats() if asset_cache else None,
+        'negative_cache_entries': len(negative_cache),
+        'circuit_breakers': host_circuit_breaker.snapshot(),
+        'browser_pool': browser_pool.stats() if browser_pool else None,
+        'dom_browser_pool': dom_browser_pool.stats() if dom_browser_pool else None
+    })
+
 @app.route('/extract', methods=['POST'])
 def extract():
     url = request.form.get('url')
     use_selenium = request.form.get('use_selenium') == 'true'
+    parser = request.form.get('parser') or None
+    pipeline = request.form.get('pipeline') == 'true'
+    fmt = request.form.get('format') or 'zip'
+    hardlink = request.form.get('hardlink') == 'true'
+    render_profile = 'dom' if request.form.get('render_profile') == 'dom' else 'full'
+    block_patterns = [pattern.strip() for pattern in (request.form.get('block') or '').split(',') if pattern.strip()]
     
     if not url:
         return jsonify({'error': 'URL is required'}), 400
+    if fmt not in ARCHIVE_FORMATS:
+        return jsonify({'error': f"Unknown format '{fmt}', expected one of: {', '.join(ARCHIVE_FORMATS)}"}), 400
     
     try:
         # Add http:// if not present
@@ -1255,140 +4663,53 @@ def extract():
         
         print(f"\n{'='*80}\nStarting extraction for: {url}\n{'='*80}")
         
-        # Create a session to maintain cookies
-        session_obj = requests.Session()
+        # Per-extraction session (own cookie jar) on top of the shared connection pools
+        session_obj = http_client.new_session()
         
         # Disable SSL verification warnings
         urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
         
-        # Use Selenium for rendering if requested and available
-        if use_selenium and SELENIUM_AVAILABLE:
-            print("Using Selenium for advanced rendering...")
-            html_content, additional_urls, error_info = extract_with_selenium(url)
-            
-            if not html_content:
-                print("Selenium extraction failed, falling back to regular request")
-                use_selenium = False
-        
-        # Safety check - make sure we have HTML content
-        if not html_content or len(html_content) < 100:
-            return jsonify({'error': 'Failed to extract valid HTML content from the website'}), 400
+        # Extract domain from URL for the file and directory names
+        domain = urlparse(url).netloc
+        safe_domain = re.sub(r'[^\w\-_]', '_', domain)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         
-        try:
-            print("\nExtracting assets...")
-            # Extract assets from the HTML content
-            assets = extract_assets(html_content, url, session_obj, None)
-            
-            if not assets:
-                return jsonify({'error': 'Failed to extract assets from the website'}), 500
-            
-            # Try to fix relative URLs in the HTML
-            try:
-                print("\nFixing relative URLs...")
-                fixed_html = fix_relative_urls(html_content, url)
-                print("Relative URLs fixed")
-            except Exception as e:
-                print(f"Error fixing URLs: {str(e)}")
-                fixed_html = html_content
-            
+        if fmt == 'dir':
+            # Written on the server; the response only says where
+            output_dir = os.path.join(EXTRACT_OUTPUT_DIR, f"{safe_domain}_{timestamp}")
+            archive = open_archive_writer(fmt, root=output_dir, hardlink=hardlink)
             try:
-                # Create zip file in memory
-                print("\nCreating zip file in memory...")
-                zip_buffer = BytesIO()
-                
-                with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED, compresslevel=9) as zip_file:
-                    # Add main HTML file
-                    zip_file.writestr('index.html', fixed_html)
-                    
-                    # Create directories for different asset types
-                    asset_dirs = {
-                        'css': 'assets/css',
-                        'js': 'assets/js',
-                        'images': 'assets/images',
-                        'fonts': 'assets/fonts',
-                        'other': 'assets/other'
-                    }
-                    
-                    # Track used filenames to avoid duplicates
-                    used_filenames = set()
-                    
-                    # Add assets to ZIP file
-                    for asset_type, asset_list in assets.items():
-                        if asset_type in asset_dirs:
-                            dir_path = asset_dirs[asset_type]
-                            
-                            for asset in asset_list:
-                                if isinstance(asset, dict) and 'content' in asset:
-                                    content = asset['content']
-                                    if content:
-                                        try:
-                                            # Generate filename
-                                            original_path = asset.get('original_path', '')
-                                            filename = os.path.basename(original_path)
-                                            if not filename:
-                                                filename = f"asset_{uuid.uuid4().hex[:8]}"
-                                            
-                                            # Add extension if missing
-                                            if '.' not in filename:
-                                                ext = mimetypes.guess_extension(asset.get('type', ''))
-                                                if ext:
-                                                    filename += ext
-                                            
-                                            # Handle duplicates
-                                            base_name, ext = os.path.splitext(filename)
-                                            counter = 1
-                                            while filename in used_filenames:
-                                                filename = f"{base_name}_{counter}{ext}"
-                                                counter += 1
-                                            used_filenames.add(filename)
-                                            
-                                            # Create full path and add to zip
-                                            file_path = os.path.join(dir_path, filename)
-                                            zip_file.writestr(file_path, content)
-                                        except Exception as e:
-                                            print(f"Warning: Failed to add {asset_type} asset to ZIP: {str(e)}")
-                    
-                    # Add metadata
-                    metadata = {
-                        'url': url,
-                        'timestamp': datetime.now().isoformat(),
-                        'asset_counts': {k: len(v) for k, v in assets.items()}
-                    }
-                    zip_file.writestr('metadata.json', json.dumps(metadata, indent=2))
-                
-                # Prepare zip file for download
-                zip_buffer.seek(0)
-                
-                # Extract domain from URL for the filename
-                domain = urlparse(url).netloc
-                safe_domain = re.sub(r'[^\w\-_]', '_', domain)
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"{safe_domain}_{timestamp}.zip"
-                
-                # Send the file with proper headers
-                response = send_file(
-                    zip_buffer,
-                    mimetype='application/zip',
-                    as_attachment=True,
-                    download_name=filename
-                )
-                
-                # Add headers to prevent caching
-                response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-                response.headers['Pragma'] = 'no-cache'
-                response.headers['Expires'] = '0'
-                
-                return response
-                
-            except Exception as e:
-                print(f"Error creating zip file: {str(e)}")
-                traceback.print_exc()
-                return jsonify({'error': f'Failed to create zip file: {str(e)}'}), 500
-                
-        except Exception as e:
-            print(f"Error in asset extraction: {str(e)}")
-            traceback.print_exc()
-            return jsonify({'error': f'Error extracting assets: {str(e)}'}), 500
+                metadata = run_extraction(url, archive, session_obj, use_selenium, pipeline, parser, render_profile, block_patterns)
+            except ExtractionError as e:
+                return jsonify({'error': str(e)}), e.status
+            return jsonify({'path': output_dir, 'asset_counts': metadata['asset_counts'], 'compression': metadata['compression']})
+        
+        def build(stream):
+            # Runs on the archive worker thread; every member goes to the client as soon as it is written
+            run_extraction(url, open_archive_writer(fmt, stream.write, page_url=url), session_obj, use_selenium, pipeline, parser,
+                           render_profile, block_patterns)
+            print(f"Archive complete: {stream.bytes_written} bytes")
+        
+        stream = ArchiveStream()
+        stream.start(build)
+        
+        # Errors raised before the first byte can still be reported as JSON
+        error = stream.wait_started()
+        if error is not None:
+            return jsonify({'error': str(error)}), getattr(error, 'status', 500)
+        
+        filename = f"{safe_domain}_{timestamp}.{fmt}"
+        
+        # Stream the archive with proper headers
+        response = Response(iter(stream), mimetype=ARCHIVE_MIMETYPES[fmt])
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+        
+        # Add headers to prevent caching
+        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+        response.headers['Pragma'] = 'no-cache'
+        response.headers['Expires'] = '0'
+        
+        return response
             
     except Exception as e:
         print(f"Unexpected error: {str(e)}")
@@ -1400,12 +4721,120 @@ if __name__ == '__main__':
     print("Website Extractor is running!")
     print("Access it in your browser at: http://127.0.0.1:5002")
     print("="*80 + "\n")
+    warm_browser_pool(debug=True)
     app.run(debug=True, threaded=True, port=5002) 
 
-def main():
+def main(argv=None):
     """Entry point for the package, to allow running as an installed package from command line"""
+    parser = argparse.ArgumentParser(prog='website-extractor', description='Extract and archive websites')
+    subcommands = parser.add_subparsers(dest='command')
+    
+    serve_parser = subcommands.add_parser('serve', help='Run the web interface (default)')
+    serve_parser.add_argument('--port', type=int, default=5002)
+    
+    extract_parser = subcommands.add_parser('extract', help='Extract a website to an archive or directory')
+    extract_parser.add_argument('url')
+    extract_parser.add_argument('--format', choices=ARCHIVE_FORMATS, default='zip')
+    extract_parser.add_argument('--output', help='Output file or directory (default: <domain>_<timestamp>[.<format>])')
+    extract_parser.add_argument('--selenium', action='store_true', help='Render the page with Selenium')
+    extract_parser.add_argument('--pipeline', action='store_true', help='Download assets while the page is fetched')
+    extract_parser.add_argument('--parser', help='HTML parser backend')
+    extract_parser.add_argument('--hardlink', action='store_true', help="Hardlink cached assets into a 'dir' output")
+    extract_parser.add_argument('--dom-only', action='store_true', help='Render markup and CSS only (eager load, no images)')
+    extract_parser.add_argument('--block', action='append', default=[], help='Extra URL pattern to block while rendering (repeatable)')
+    
+    bench_parser = subcommands.add_parser('bench-parsers', help='Compare HTML parser backends on captured pages')
+    bench_parser.add_argument('files', nargs='+', help='Saved HTML pages')
+    bench_parser.add_argument('--parsers', help='Comma separated backends (default: all installed)')
+    bench_parser.add_argument('--repeat', type=int, default=3)
+    
+    components_parser = subcommands.add_parser('bench-components', help='Benchmark component classification')
+    components_parser.add_argument('files', nargs='*', help='Saved HTML pages (synthetic pages are always included)')
+    components_parser.add_argument('--sizes', default='5000,10000,20000', help='Synthetic page sizes in elements')
+    components_parser.add_argument('--parser', help='HTML parser backend')
+    
+    css_parser = subcommands.add_parser('bench-css', help='Benchmark the CSS reference scanner against cssutils')
+    css_parser.add_argument('files', nargs='*', help='Stylesheets (synthetic sheets are always included)')
+    css_parser.add_argument('--sizes', default='1000,10000', help='Synthetic stylesheet sizes in rules')
+    css_parser.add_argument('--repeat', type=int, default=3)
+    
+    archive_parser = subcommands.add_parser('bench-archive', help='Benchmark parallel archive compression')
+    archive_parser.add_argument('--workers', help='Comma separated worker counts (default: 1,2,4,cores)')
+    archive_parser.add_argument('--members', type=int, default=200)
+    archive_parser.add_argument('--size-kb', type=int, default=200)
+    archive_parser.add_argument('--repeat', type=int, default=3)
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == 'extract':
+        url = args.url if args.url.startswith(('http://', 'https://')) else 'https://' + args.url
+        output = args.output
+        if not output:
+            safe_domain = re.sub(r'[^\w\-_]', '_', urlparse(url).netloc)
+            output = f"{safe_domain}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            if args.format != 'dir':
+                output = f"{output}.{args.format}"
+        if args.format == 'dir':
+            fh = None
+            archive = open_archive_writer('dir', root=output, hardlink=args.hardlink)
+        else:
+            fh = open(output, 'wb')
+            archive = open_archive_writer(args.format, fh.write, page_url=url)
+        try:
+            metadata = run_extraction(url, archive, http_client.new_session(), args.selenium, args.pipeline, args.parser,
+                                      'dom' if args.dom_only else 'full', args.block)
+        except ExtractionError as e:
+            print(f"Extraction failed: {str(e)}")
+            return 1
+        finally:
+            if fh:
+                fh.close()
+        print(f"Wrote {output}: {sum(metadata['asset_counts'].values())} assets")
+        return 0
+    
+    if args.command == 'bench-parsers':
+        parsers = args.parsers.split(',') if args.parsers else None
+        results = benchmark_parsers(args.files, parsers, args.repeat)
+        print(f"{'file':<40} {'parser':<12} {'parse ms':>10} {'peak KB':>10} {'assets':>7}  same as reference")
+        for result in results:
+            print(f"{os.path.basename(result['file'])[:40]:<40} {result['parser']:<12} {result['parse_ms']:>10} "
+                  f"{result['peak_kb']:>10} {result['assets']:>7}  {'yes' if result['matches_reference'] else 'NO'}")
+        return 0 if all(r['matches_reference'] for r in results) else 1
+    
+    if args.command == 'bench-components':
+        sizes = [int(size) for size in args.sizes.split(',') if size]
+        results = benchmark_components(sizes, args.files, args.parser)
+        print(f"{'page':<30} {'elements':>9} {'scan ms':>9} {'classify ms':>12} {'per-rule ms':>12} {'speedup':>8}")
+        for result in results:
+            print(f"{result['page'][:30]:<30} {result['elements']:>9} {result['scan_ms']:>9} {result['classify_ms']:>12} "
+                  f"{result['per_rule_walks_ms']:>12} {result['speedup']:>7}x")
+        return 0
+    
+    if args.command == 'bench-css':
+        sizes = [int(size) for size in args.sizes.split(',') if size]
+        results = benchmark_css(sizes, args.files, args.repeat)
+        print(f"{'stylesheet':<30} {'KB':>8} {'scan ms':>9} {'cssutils ms':>12} {'speedup':>8} {'refs':>6} {'missed':>7}")
+        for result in results:
+            print(f"{result['stylesheet'][:30]:<30} {result['kb']:>8} {result['scan_ms']:>9} {result['cssutils_ms']:>12} "
+                  f"{result['speedup']:>7}x {result['references']:>6} {len(result['missed']):>7}")
+            for url in result['missed'][:5]:
+                print(f"    missed: {url}")
+        return 0 if not any(r['missed'] for r in results) else 1
+    
+    if args.command == 'bench-archive':
+        workers = [int(count) for count in args.workers.split(',') if count] if args.workers else None
+        results = benchmark_archive(workers, args.members, args.size_kb * 1024, args.repeat)
+        print(f"{os.cpu_count()} cores, {args.members} members of {args.size_kb} KB")
+        print(f"{'workers':>8} {'seconds':>9} {'MB/s':>8} {'speedup':>8} {'archive KB':>11}")
+        for result in results:
+            print(f"{result['workers']:>8} {result['seconds']:>9} {result['mb_per_s']:>8} {result['speedup']:>7}x "
+                  f"{result['archive_bytes'] // 1024:>11}")
+        return 0
+    
+    port = getattr(args, 'port', 5002)
     print("\n" + "="*80)
     print("Website Extractor is running!")
-    print("Access it in your browser at: http://127.0.0.1:5002")
+    print(f"Access it in your browser at: http://127.0.0.1:{port}")
     print("="*80 + "\n")
-    app.run(debug=True, threaded=True, port=5002) 
\ No newline at end of file
+    warm_browser_pool(debug=True)
+    app.run(debug=True, threaded=True, port=port)
@@ -0,0 +1,63 @@
+"""ZIP members that fail to compress are stored, and the manifest never lists a missing member."""
+import io
+import json
+import zipfile
+
+import app
+
+ORIGINAL_COMPRESS_MEMBER = app.compress_member
+
+
+def build_zip(monkeypatch, compress_member, assets):
+    monkeypatch.setattr(app, 'compress_member', compress_member)
+    buffer = io.BytesIO()
+    with app.ZipArchiveWriter(buffer.write, workers=2) as archive:
+        archive.add('index.html', '<html></html>', 'html', 'text/html')
+        for asset in assets:
+            archive.add_asset('css', asset)
+    archive_file = zipfile.ZipFile(io.BytesIO(buffer.getvalue()))
+    assert archive_file.testzip() is None
+    return archive_file, json.loads(archive_file.read('manifest.json'))
+
+
+def test_failed_compression_falls_back_to_stored(monkeypatch):
+    def deflate_fails(content, compress_type, compresslevel):
+        if compress_type == zipfile.ZIP_DEFLATED and content.startswith(b'body'):
+            raise MemoryError('no room to compress')
+        return ORIGINAL_COMPRESS_MEMBER(content, compress_type, compresslevel)
+
+    body = b'body { color: red }' * 100
+    archive_file, manifest = build_zip(monkeypatch, deflate_fails, [{'url': 'http://site.test/a.css', 'content': body}])
+    member = manifest['assets'][0]['member']
+    assert archive_file.read(member) == body
+    assert archive_file.getinfo(member).compress_type == zipfile.ZIP_STORED
+
+
+def test_unreadable_member_is_left_out_of_the_manifest(monkeypatch):
+    def unreadable(content, compress_type, compresslevel):
+        if content.startswith(b'broken'):
+            raise OSError('spill file is gone')
+        return ORIGINAL_COMPRESS_MEMBER(content, compress_type, compresslevel)
+
+    archive_file, manifest = build_zip(monkeypatch, unreadable, [
+        {'url': 'http://site.test/broken.css', 'content': b'broken' * 100},
+        {'url': 'http://site.test/ok.css', 'content': b'ok {}' * 100},
+    ])
+    names = set(archive_file.namelist())
+    assert [entry['url'] for entry in manifest['assets']] == ['http://site.test/ok.css']
+    assert all(entry['member'] in names for entry in manifest['assets'])
+
+
+def test_empty_asset_is_archived(monkeypatch):
+    body = app.AssetBody(data=b'', content_type='text/css', url='http://site.test/empty.css')
+    archive_file, manifest = build_zip(monkeypatch, ORIGINAL_COMPRESS_MEMBER, [{'url': body.url, 'content': body}])
+    member = manifest['assets'][0]['member']
+    assert archive_file.read(member) == b''
+
+
+def test_empty_captured_body_is_a_successful_download():
+    url = 'http://site.test/empty.css'
+    body = app.AssetBody(data=b'', content_type='text/css', url=url)
+    downloader = app.AssetDownloader('http://site.test/', captured={app.canonicalize_url(url): body})
+    downloader.submit('css', url, 'empty.css')
+    assert [record['content'] for record in downloader.collect()['css']] == [body]
@@ -0,0 +1,39 @@
+"""Media <source> elements and sniffed bodies end up in the right asset bucket."""
+import pytest
+
+import app
+
+BASE_URL = 'http://site.test/'
+PAGE = """<html><body>
+<video><source src="v.mp4" type="video/mp4"><source src="v.webm"></video>
+<audio><source src="a.ogg"></audio>
+<picture><source srcset="p.webp"><img src="p.jpg"></picture>
+</body></html>"""
+
+
+@pytest.mark.parametrize('parser', app.available_parsers())
+def test_sources_are_typed_by_their_container(parser):
+    document = app.parse_document(PAGE, BASE_URL, parser)
+    types = {url: asset_type for asset_type, url, _, _ in app.iter_asset_references(document, BASE_URL)}
+    assert types == {
+        BASE_URL + 'v.mp4': 'other', BASE_URL + 'v.webm': 'other', BASE_URL + 'a.ogg': 'other',
+        BASE_URL + 'p.webp': 'images', BASE_URL + 'p.jpg': 'images',
+    }
+
+
+def test_streaming_sniffer_agrees_with_the_parsed_document():
+    sniffer = app.HTMLReferenceSniffer(BASE_URL)
+    found = sniffer.feed(PAGE) + sniffer.close()
+    document = app.parse_document(PAGE, BASE_URL, 'html.parser')
+    expected = {(asset_type, url) for asset_type, url, _, _ in app.iter_asset_references(document, BASE_URL)}
+    assert {(asset_type, url) for asset_type, url, _, _ in found} == expected
+
+
+def test_sniffed_video_overrides_an_image_slot():
+    record = {'url': BASE_URL + 'v2.mp4', 'kind': 'other', 'mime': 'video/mp4'}
+    assert app.AssetDownloader._bucket('images', record) == 'other'
+
+
+def test_untyped_body_keeps_the_html_context():
+    record = {'url': BASE_URL + 'styles', 'kind': 'other', 'mime': 'text/plain'}
+    assert app.AssetDownloader._bucket('css', record) == 'css'
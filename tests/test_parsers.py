@@ -0,0 +1,63 @@
+"""Every parser backend must extract the same thing from a page as html.parser."""
+import os
+
+import pytest
+from bs4 import BeautifulSoup
+
+import app
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+PAGES = sorted(name for name in os.listdir(FIXTURES) if name.endswith('.html'))
+BASE_URL = 'http://site.test/page/'
+
+
+def parse(page, parser):
+    if parser not in app.available_parsers():
+        pytest.skip(f"{parser} is not installed")
+    with open(os.path.join(FIXTURES, page), encoding='utf-8') as fh:
+        return app.parse_document(fh.read(), BASE_URL, parser)
+
+
+def references(document):
+    return [(asset_type, url, original_path, extra)
+            for asset_type, url, original_path, extra in app.iter_asset_references(document, BASE_URL)]
+
+
+def component_groups(document):
+    # Serialized markup differs between backends (void tags, implied end tags);
+    # compare what each group holds instead
+    return {
+        component_type: [(BeautifulSoup(entry['html'], 'html.parser').get_text(' ', strip=True), entry.get('count', 1))
+                         for entry in entries]
+        for component_type, entries in app.extract_component_structure(document).items()
+    }
+
+
+@pytest.mark.parametrize('parser', ['lxml', 'html5lib'])
+@pytest.mark.parametrize('page', PAGES)
+def test_asset_references_match_html_parser(page, parser):
+    assert references(parse(page, parser)) == references(parse(page, 'html.parser'))
+
+
+@pytest.mark.parametrize('parser', ['lxml', 'html5lib'])
+@pytest.mark.parametrize('page', PAGES)
+def test_metadata_matches_html_parser(page, parser):
+    expected = app.extract_metadata(parse(page, 'html.parser'), BASE_URL)
+    assert app.extract_metadata(parse(page, parser), BASE_URL) == expected
+
+
+@pytest.mark.parametrize('parser', ['lxml', 'html5lib'])
+@pytest.mark.parametrize('page', PAGES)
+def test_component_groups_match_html_parser(page, parser):
+    assert component_groups(parse(page, parser)) == component_groups(parse(page, 'html.parser'))
+
+
+def test_fixtures_are_not_trivial():
+    document = parse('landing.html', 'html.parser')
+    assert len(references(document)) >= 8
+    assert app.extract_metadata(document, BASE_URL)['title'] == 'Acme Outfitters'
+    assert component_groups(document)['card'][0][1] == 3
+
+
+def test_missing_parser_falls_back_to_html_parser():
+    assert app.resolve_parser('no-such-parser') == 'html.parser'